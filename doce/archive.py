@@ -0,0 +1,367 @@
+"""Handle the archives of the outputs of the settings for the doce module.
+
+An archive gathers the outputs of a set of settings in a single file,
+written sequentially, which is convenient on networked file systems.
+An archive is designated by its path:
+
+- a .tar file, possibly compressed (.tar.gz, .tgz, .tar.bz2, .tar.xz), or a .zip file,
+  where each output is a member in the npy (or npz) format named <identifier><metric_delimiter><output>.npy,
+- an .h5 file, with the same layout as the .h5 file of the settings, see :func:`doce.archive.write_h5_archive`.
+
+Each archive has a manifest describing the settings and the outputs it contains,
+see :func:`doce.archive.manifest`. The outputs are restored in a data sink
+by :func:`doce.archive.restore_archive`.
+"""
+
+import os
+import io
+import json
+import time
+import tarfile
+import zipfile
+import numpy as np
+import doce.util as eu
+import doce.sink
+
+if eu.in_notebook():
+  from tqdm.notebook import tqdm as tqdm
+else:
+  from tqdm import tqdm as tqdm
+
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ZIP_EXTENSION = '.zip'
+MANIFEST = 'manifest.json'
+
+def is_archive(path):
+  """returns True if path designates a tar or zip archive.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.archive.is_archive('/tmp/my_experiment.tar.gz')
+  True
+  >>> doce.archive.is_archive('/tmp/my_experiment.zip')
+  True
+  >>> doce.archive.is_archive('/tmp/my_experiment/')
+  False
+  """
+  return isinstance(path, str) and path.endswith(TAR_EXTENSIONS+(ZIP_EXTENSION,))
+
+def _tar_mode(path, mode):
+  for (extension, compression) in [('.gz', 'gz'), ('.tgz', 'gz'), ('.bz2', 'bz2'), ('.xz', 'xz')]:
+    if path.endswith(extension):
+      return f'{mode}|{compression}'
+  return f'{mode}|'
+
+def _serialize(data):
+  buffer = io.BytesIO()
+  np.lib.format.write_array(buffer, np.asanyarray(data), allow_pickle=False)
+  return buffer.getvalue()
+
+def _deserialize(buffer, member):
+  if member.endswith('.npz'):
+    with np.load(io.BytesIO(buffer)) as archive:
+      return archive[archive.files[0]]
+  return np.lib.format.read_array(io.BytesIO(buffer), allow_pickle=False)
+
+class _ArchiveWriter():
+  """writes the members of a tar or zip archive sequentially."""
+  def __init__(self, path, file_name):
+    # the format is given by path, the archive is written to file_name
+    self.path = path
+    if path.endswith(ZIP_EXTENSION):
+      self._zip = zipfile.ZipFile(file_name, 'w')
+      self._tar = None
+    else:
+      self._zip = None
+      self._tar = tarfile.open(file_name, _tar_mode(path, 'w'))
+
+  def add(self, name, buffer=None, file_name=None, stamp=None):
+    if self._zip is not None:
+      # npz files are already compressed
+      compression = zipfile.ZIP_STORED if name.endswith('.npz') else zipfile.ZIP_DEFLATED
+      if file_name is not None:
+        self._zip.write(file_name, name, compress_type=compression)
+      else:
+        info = zipfile.ZipInfo(name, time.localtime(stamp or time.time())[:6])
+        self._zip.writestr(info, buffer, compress_type=compression)
+    elif file_name is not None:
+      self._tar.add(file_name, name, recursive=False)
+    else:
+      info = tarfile.TarInfo(name)
+      info.size = len(buffer)
+      info.mtime = stamp or time.time()
+      self._tar.addfile(info, io.BytesIO(buffer))
+
+  def close(self):
+    if self._zip is not None:
+      self._zip.close()
+    else:
+      self._tar.close()
+
+def manifest(path):
+  """returns the manifest of an archive.
+
+  The manifest is a dict with the following keys:
+
+  - source: the path of the data sink of the archived outputs,
+  - date: the date of creation of the archive,
+  - settings: the identifiers of the archived settings,
+  - outputs: a list of dicts describing the archived outputs, with the keys identifier, output and member.
+
+  Returns None if the archive has no manifest.
+  """
+  if path.endswith(doce.sink.H5_EXTENSION):
+    import tables as tb
+    with tb.open_file(path, mode='r') as h5:
+      if 'doce_manifest' not in h5.root._v_attrs:
+        return None
+      return json.loads(h5.root._v_attrs.doce_manifest)
+  if path.endswith(ZIP_EXTENSION):
+    with zipfile.ZipFile(path, 'r') as archive:
+      if MANIFEST not in archive.namelist():
+        return None
+      return json.loads(archive.read(MANIFEST))
+  # the manifest is the first member of the tar archives
+  with tarfile.open(path, _tar_mode(path, 'r')) as archive:
+    member = archive.next()
+    if member is None or member.name != MANIFEST:
+      return None
+    return json.loads(archive.extractfile(member).read())
+
+def _manifest(sink, entries, members=True):
+  outputs = []
+  for (identifier, output, file_name) in entries:
+    if not members:
+      member = None
+    elif file_name is not None:
+      member = os.path.basename(file_name)
+    else:
+      member = identifier+sink.metric_delimiter+output+'.npy'
+    outputs.append({'identifier': identifier, 'output': output, 'member': member})
+  settings = list(dict.fromkeys(identifier for (identifier, _, _) in entries if identifier is not None))
+  return {'source': sink.path,
+          'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+          'settings': settings,
+          'outputs': outputs}
+
+def write_archive(path, sink, entries, verbose=False):
+  """writes outputs of a data sink in a tar or zip archive.
+
+  The archive is written sequentially in a temporary file, which replaces path once complete.
+  The manifest is the first member of the archive.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the archive, see :func:`doce.archive.is_archive`.
+
+  sink: :class:`doce.sink.Sink`
+    the data sink storing the outputs.
+
+  entries: list of tuples
+    the (identifier, output, file_name) of the outputs to archive. If file_name is not None,
+    the file is archived as is, otherwise, the output is read from the sink.
+    The identifier and the output of an archived file may be None if unknown.
+
+  verbose: bool (optional)
+    if True, display the progress of the archiving (default False).
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import os
+  >>> import shutil
+  >>> shutil.rmtree('/tmp/example_archive', ignore_errors=True)
+  >>> sink = doce.sink.NpySink('/tmp/example_archive/')
+  >>> os.makedirs(sink.path)
+  >>> sink.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> sink.write('f1=1+f2=3', 'accuracy', np.ones(2))
+  >>> entries = [('f1=1+f2=2', 'accuracy', None), ('f1=1+f2=3', 'accuracy', None)]
+  >>> doce.archive.write_archive('/tmp/example_archive.tar.gz', sink, entries)
+  >>> doce.archive.manifest('/tmp/example_archive.tar.gz')['settings']
+  ['f1=1+f2=2', 'f1=1+f2=3']
+  >>> sink.remove('f1=1+f2=2')
+  >>> doce.archive.restore_archive('/tmp/example_archive.tar.gz', sink, ['f1=1+f2=2'])
+  1
+  >>> sink.read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  """
+  temporary_path = path+'.tmp'
+  try:
+    writer = _ArchiveWriter(path, temporary_path)
+    writer.add(MANIFEST, json.dumps(_manifest(sink, entries), indent=1).encode())
+    for (identifier, output, file_name) in tqdm(entries, disable=not verbose, desc=f'Archiving to {path}'):
+      if file_name is not None:
+        writer.add(os.path.basename(file_name), file_name=file_name)
+      else:
+        writer.add(identifier+sink.metric_delimiter+output+'.npy',
+                   _serialize(sink.read(identifier, output)),
+                   stamp=sink.stamp(identifier, output))
+    writer.close()
+  except BaseException:
+    if os.path.exists(temporary_path):
+      os.remove(temporary_path)
+    raise
+  os.replace(temporary_path, path)
+
+def write_h5_archive(path, sink, identifiers, verbose=False):
+  """writes the outputs of settings of an .h5 file in another .h5 file.
+
+  Only the selected settings are copied, with the layout of the .h5 file of the settings.
+  The manifest is stored in the doce_manifest attribute of the root group.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the archive .h5 file.
+
+  sink: :class:`doce.sink.H5Sink`
+    the data sink storing the outputs.
+
+  identifiers: list of str
+    the identifiers of the settings to archive.
+
+  verbose: bool (optional)
+    if True, display the progress of the archiving (default False).
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import os
+  >>> if os.path.exists('/tmp/example_archive.h5'): os.remove('/tmp/example_archive.h5')
+  >>> sink = doce.sink.H5Sink('/tmp/example_archive.h5')
+  >>> sink.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> sink.write('f1=1+f2=3', 'accuracy', np.ones(2))
+  >>> sink.close()
+  >>> doce.archive.write_h5_archive('/tmp/example_archive_subset.h5', sink, ['f1=1+f2=3'])
+  >>> doce.sink.H5Sink('/tmp/example_archive_subset.h5').identifiers()
+  ['f1=1+f2=3']
+  >>> doce.archive.manifest('/tmp/example_archive_subset.h5')['outputs']
+  [{'identifier': 'f1=1+f2=3', 'output': 'accuracy', 'member': None}]
+  """
+  import tables as tb
+  import warnings
+  from tables import NaturalNameWarning
+  warnings.filterwarnings('ignore', category=NaturalNameWarning)
+
+  sink.close()
+  temporary_path = path+'.tmp'
+  try:
+    with tb.open_file(sink.path, mode='r') as source, tb.open_file(temporary_path, mode='w') as destination:
+      layout = doce.sink.h5_layout(source)
+      if layout != 'flat':
+        destination.root._v_attrs.doce_layout = layout
+      available = set(doce.sink.h5_identifiers(source))
+      identifiers = [identifier for identifier in identifiers if identifier in available]
+      entries = []
+      factors = doce.sink.h5_factors(identifiers) if layout == 'table' else None
+      for identifier in tqdm(identifiers, disable=not verbose, desc=f'Archiving to {path}'):
+        outputs = doce.sink.h5_outputs(source, identifier)
+        if layout == 'table':
+          for output in outputs:
+            doce.sink.h5_write(destination, identifier, output,
+                               doce.sink.h5_read(source, identifier, output), factors=factors)
+        else:
+          # the arrays are copied, so that their type and attributes are preserved
+          group = source.get_node(doce.sink.h5_group_path(identifier, layout))
+          destination_group = doce.sink.h5_setting_group(destination, identifier, group._v_title)
+          for output in outputs:
+            group._f_get_child(output)._f_copy(newparent=destination_group)
+        entries += [(identifier, output, None) for output in outputs]
+      for table in doce.sink.h5_tables(destination) if layout == 'table' else []:
+        table.reindex()
+      destination.root._v_attrs.doce_manifest = json.dumps(_manifest(sink, entries, members=False))
+  except BaseException:
+    if os.path.exists(temporary_path):
+      os.remove(temporary_path)
+    raise
+  os.replace(temporary_path, path)
+
+def restore_archive(path, sink, identifiers=None, verbose=False):
+  """writes the outputs stored in an archive to a data sink.
+
+  The members of tar and zip archives are read sequentially.
+  With a directory of .npy files as data sink, the members are written as is.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the archive, either a tar or zip archive, or an .h5 file.
+
+  sink: :class:`doce.sink.Sink`
+    the data sink where the outputs are restored.
+
+  identifiers: list of str (optional)
+    the identifiers of the settings to restore. If None (default), all the settings are restored.
+
+  verbose: bool (optional)
+    if True, display the progress of the restoration (default False).
+
+  Returns the number of restored outputs.
+  """
+  if identifiers is not None:
+    identifiers = set(identifiers)
+  if not is_archive(path):
+    # any other data sink is restored output by output
+    source = doce.sink.get_sink(path, sink.metric_delimiter)
+    source.output_names = sink.output_names
+    count = 0
+    for identifier in source.identifiers():
+      if identifiers is None or identifier in identifiers:
+        for output in source.outputs(identifier):
+          sink.write(identifier, output, source.read(identifier, output))
+          count += 1
+    source.close()
+    sink.flush()
+    return count
+  description = manifest(path)
+  if description is None:
+    print(f'The archive {path} has no manifest.')
+    raise ValueError
+  members = {output['member']: output for output in description['outputs']
+             if identifiers is None or output['identifier'] in identifiers}
+  raw = isinstance(sink, doce.sink.NpySink)
+  count = 0
+  with tqdm(total=len(members), disable=not verbose, desc=f'Restoring from {path}') as progress_bar:
+    for (name, buffer) in _members(path, members):
+      output = members[name]
+      if raw:
+        file_name = os.path.join(sink.path, name)
+        with open(file_name+'.tmp', 'wb') as file:
+          file.write(buffer)
+        os.replace(file_name+'.tmp', file_name)
+      elif output['identifier'] is None:
+        print(f'The member {name} is not an output of a setting and is not restored.')
+        continue
+      else:
+        sink.write(output['identifier'], output['output'], _deserialize(buffer, name))
+      count += 1
+      progress_bar.update(1)
+  sink.flush()
+  return count
+
+def _members(path, names):
+  # yields the name and the content of the selected members, in the order of the archive
+  if path.endswith(ZIP_EXTENSION):
+    with zipfile.ZipFile(path, 'r') as archive:
+      for name in archive.namelist():
+        if name in names:
+          yield (name, archive.read(name))
+  else:
+    with tarfile.open(path, _tar_mode(path, 'r')) as archive:
+      for member in archive:
+        if member.name in names:
+          yield (member.name, archive.extractfile(member).read())
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
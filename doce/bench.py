@@ -0,0 +1,428 @@
+"""Benchmark the main operations of the doce module.
+
+The benchmarks generate synthetic plans and synthetic data sinks, time the
+main operations of doce and report the results as json, so that different
+versions of the package can be compared.
+
+The suite is run from the command line:
+
+  $ python -m doce.bench --sizes 1000 10000 --output bench.json
+
+and two reports can be compared:
+
+  $ python -m doce.bench --sizes 1000 10000 --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import doce
+import doce.version
+
+def synthetic_plan(nb_settings, nb_modalities=10, name='bench'):
+  """returns a plan with approximately nb_settings settings.
+
+  The plan has as many factors of nb_modalities integer modalities
+  as needed to reach nb_settings, the last factor being truncated if needed.
+
+  Parameters
+  ----------
+
+  nb_settings: int
+    the requested number of settings.
+
+  nb_modalities: int (optional)
+    the number of modalities of each factor (default 10).
+
+  Examples
+  --------
+
+  >>> import doce.bench
+  >>> p = doce.bench.synthetic_plan(200)
+  >>> print(p)
+    0  f0: [0 1 2 3 4 5 6 7 8 9]
+    1  f1: [0 1 2 3 4 5 6 7 8 9]
+    2  f2: [0 1]
+  >>> len(p)
+  200
+  """
+  factors = {}
+  remaining = max(int(nb_settings), 1)
+  factor_index = 0
+  while remaining > 1 or not factors:
+    size = min(nb_modalities, remaining)
+    factors[f'f{factor_index}'] = list(range(size))
+    remaining = int(np.ceil(remaining/size))
+    factor_index += 1
+  return doce.Plan(name, **factors)
+
+def synthetic_experiment(nb_settings, path, storage='npy', output_size=10):
+  """returns an experiment whose outputs are available for all its settings.
+
+  Parameters
+  ----------
+
+  nb_settings: int
+    the requested number of settings.
+
+  path: str
+    the directory where the synthetic data sink is created.
+
+  storage: str (optional)
+    'npy' (default) for a directory of .npy files, 'h5' for an .h5 file,
+    'store' for a consolidated store.
+
+  output_size: int (optional)
+    the number of values of each output (default 10).
+  """
+  experiment = doce.Experiment(name='bench')
+  experiment._check_setting_length = False
+  # the reductions are timed without the cache of the reduced metrics
+  experiment._display.reduce_cache = False
+  if storage == 'h5':
+    experiment.set_path('output', os.path.join(path, 'bench.h5'), force=True)
+  elif storage == 'store':
+    experiment.set_path('output', os.path.join(path, 'bench.store'), force=True)
+  else:
+    experiment.set_path('output', os.path.join(path, 'bench'), force=True)
+  experiment._plan = synthetic_plan(nb_settings)
+  experiment._plans = []
+  experiment.set_metric(
+    name = 'accuracy',
+    higher_the_better = True,
+    significance = True
+  )
+  experiment.set_metric(name = 'acc_std', output = 'accuracy', func = np.std)
+  experiment.set_metric(name = 'duration', lower_the_better = True)
+
+  rng = np.random.default_rng(0)
+  if storage == 'h5':
+    import tables as tb
+    h5 = tb.open_file(experiment.path.output, mode='w')
+    for setting in experiment._plan.select([]):
+      setting_group = experiment.add_setting_group(
+        h5,
+        setting,
+        output_dimension = {'accuracy': output_size, 'duration': output_size})
+      setting_group.accuracy[:] = rng.random(output_size)
+      setting_group.duration[:] = rng.random(output_size)
+    h5.close()
+  elif storage == 'store':
+    for setting in experiment._plan.select([]):
+      experiment.save(setting, 'accuracy', rng.random(output_size))
+      experiment.save(setting, 'duration', rng.random(output_size))
+    experiment.flush()
+  else:
+    for setting in experiment._plan.select([]):
+      prefix = experiment.path.output+setting.identifier()+experiment.metric_delimiter
+      np.save(prefix+'accuracy.npy', rng.random(output_size))
+      np.save(prefix+'duration.npy', rng.random(output_size))
+  return experiment
+
+def measure(func, repeat=3, memory=True):
+  """time a function and measure its peak memory usage.
+
+  Parameters
+  ----------
+
+  func: callable
+    function with no argument to be measured.
+
+  repeat: int (optional)
+    number of timed calls (default 3).
+
+  memory: bool (optional)
+    if True, an additional call is made while tracing memory allocations (default).
+
+  Returns
+  -------
+
+  measurement: dict
+    the minimal and mean duration in seconds of the calls,
+    and the peak memory in bytes allocated during the traced call (None if not traced).
+
+  Examples
+  --------
+
+  >>> import doce.bench
+  >>> measurement = doce.bench.measure(lambda: sum(range(1000)), repeat=2)
+  >>> sorted(measurement.keys())
+  ['peak_memory', 'repeat', 'time_mean', 'time_min']
+  """
+  durations = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    durations.append(time.perf_counter()-start)
+  peak_memory = None
+  if memory:
+    tracemalloc.start()
+    func()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+  return {
+    'time_min': min(durations),
+    'time_mean': sum(durations)/len(durations),
+    'repeat': repeat,
+    'peak_memory': peak_memory
+    }
+
+def bench_enumeration(nb_settings):
+  plan = synthetic_plan(nb_settings)
+  def run():
+    plan._changed = True
+    plan.select([]).__set_settings__()
+  return run
+
+def bench_identifier(nb_settings):
+  plan = synthetic_plan(nb_settings)
+  def run():
+    for setting in plan.select([]):
+      setting.identifier()
+  return run
+
+def bench_resume(experiment):
+  experiment._resume = True
+  def run():
+    for setting in experiment._plan.select([]):
+      experiment.skip_setting(setting)
+  return run
+
+def bench_reduction(experiment):
+  def run():
+    experiment.metric.reduce(
+      experiment._plan.select([]),
+      experiment.path,
+      metric_delimiter = experiment.metric_delimiter,
+      cache = experiment._display.reduce_cache)
+  return run
+
+def bench_significance(nb_settings, output_size=10):
+  import doce.metric as em
+  plan = synthetic_plan(nb_settings)
+  rng = np.random.default_rng(0)
+  raw_data = [[rng.random(output_size)] for _ in range(len(plan))]
+  table = [[0]*len(plan.factors())+[np.mean(raw[0])] for raw in raw_data]
+  def run():
+    em.significance(plan, table, raw_data, [True], [-1], [1])
+  return run
+
+def bench_display(experiment):
+  import doce.cli
+  args = types.SimpleNamespace(verbose=False)
+  experiment.selector = []
+  def run():
+    doce.cli.data_frame_display(experiment, args, [], '')
+  return run
+
+def bench_clean(experiment, path):
+  archive_path = os.path.join(path, 'archive')
+  os.makedirs(archive_path, exist_ok=True)
+  def run():
+    experiment.clean_data_sink(
+      'output',
+      [0],
+      force = True,
+      keep = True,
+      archive_path = archive_path)
+  return run
+
+BENCHMARKS = [
+  'enumeration',
+  'identifier',
+  'resume',
+  'reduction_npy',
+  'reduction_h5',
+  'reduction_store',
+  'significance',
+  'display',
+  'clean_npy'
+]
+
+def run(sizes, benchmarks=None, sink_size=1000, repeat=3, memory=True, verbose=True):
+  """run the benchmark suite.
+
+  Parameters
+  ----------
+
+  sizes: list of int
+    the numbers of settings of the synthetic plans.
+
+  benchmarks: list of str (optional)
+    the benchmarks to run, all of doce.bench.BENCHMARKS if None (default).
+
+  sink_size: int (optional)
+    the maximal number of settings for which data is stored in synthetic data sinks (default 1000).
+    Larger plans are only used for benchmarks that do not need stored data.
+
+  repeat: int (optional)
+    number of timed calls per benchmark (default 3).
+
+  memory: bool (optional)
+    if True, measure the peak memory of each benchmark (default).
+
+  verbose: bool (optional)
+    if True, print each result when available (default).
+
+  Returns
+  -------
+
+  report: dict
+    description of the environment and list of results.
+  """
+  if benchmarks is None:
+    benchmarks = BENCHMARKS
+  results = []
+  path = tempfile.mkdtemp(prefix='doce_bench_')
+  stdout = sys.stdout
+  try:
+    for size in sizes:
+      experiments = {}
+      for benchmark in benchmarks:
+        if benchmark in ['enumeration', 'identifier', 'significance']:
+          setup = globals()[f'bench_{benchmark}']
+          func = setup(size)
+        else:
+          if size > sink_size:
+            continue
+          storage = benchmark.split('_')[-1] if benchmark.startswith('reduction') else 'npy'
+          if storage not in experiments:
+            experiments[storage] = synthetic_experiment(
+              size,
+              os.path.join(path, f'{storage}_{size}'),
+              storage)
+          experiment = experiments[storage]
+          if benchmark == 'resume':
+            func = bench_resume(experiment)
+          elif benchmark.startswith('reduction'):
+            func = bench_reduction(experiment)
+          elif benchmark == 'display':
+            func = bench_display(experiment)
+          elif benchmark == 'clean_npy':
+            func = bench_clean(experiment, os.path.join(path, f'{storage}_{size}'))
+        # doce operations may be verbose
+        sys.stdout = open(os.devnull, 'w')
+        try:
+          measurement = measure(func, repeat, memory)
+        finally:
+          sys.stdout.close()
+          sys.stdout = stdout
+        measurement['name'] = benchmark
+        measurement['size'] = size
+        results.append(measurement)
+        if verbose:
+          print(format_result(measurement))
+  finally:
+    sys.stdout = stdout
+    shutil.rmtree(path, ignore_errors=True)
+
+  return {
+    'doce_version': doce.version.version,
+    'python': platform.python_version(),
+    'numpy': np.__version__,
+    'platform': platform.platform(),
+    'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'results': results
+    }
+
+def format_result(result, reference=None):
+  """returns a one-liner str describing a benchmark result.
+
+  Examples
+  --------
+
+  >>> import doce.bench
+  >>> result = {'name': 'identifier', 'size': 1000, 'time_min': 0.01, 'peak_memory': 2048}
+  >>> print(doce.bench.format_result(result))
+  identifier          1000      10.000 ms       2.0 kB
+  >>> print(doce.bench.format_result(result, {'time_min': 0.02}))
+  identifier          1000      10.000 ms       2.0 kB   x0.50
+  """
+  description = f"{result['name']:<15}{result['size']:>9}{result['time_min']*1000:>12.3f} ms"
+  if result.get('peak_memory') is not None:
+    description += f"{result['peak_memory']/1024:>10.1f} kB"
+  if reference:
+    description += f"   x{result['time_min']/reference['time_min']:.2f}"
+  return description
+
+def compare(report, reference):
+  """print the results of a report along their ratio to the results of a reference report."""
+  references = {(r['name'], r['size']): r for r in reference['results']}
+  print(f"Reference: doce {reference['doce_version']} ({reference['date']})")
+  for result in report['results']:
+    print(format_result(result, references.get((result['name'], result['size']))))
+
+def main(arg_str=None):
+  parser = argparse.ArgumentParser(
+    prog = 'python -m doce.bench',
+    description = 'benchmark the main operations of the doce module.')
+  parser.add_argument(
+    '--sizes',
+    type=float,
+    nargs='+',
+    help=r'numbers of settings of the synthetic plans (default 1e3 1e4).',
+    default=[1e3, 1e4])
+  parser.add_argument(
+    '-b',
+    '--benchmarks',
+    type=str,
+    nargs='+',
+    choices=BENCHMARKS,
+    help=r'benchmarks to run (default all).')
+  parser.add_argument(
+    '--sink_size',
+    type=float,
+    help=r'maximal number of settings of the synthetic data sinks (default 1e3).',
+    default=1e3)
+  parser.add_argument(
+    '-r',
+    '--repeat',
+    type=int,
+    help=r'number of timed calls per benchmark (default 3).',
+    default=3)
+  parser.add_argument(
+    '--no_memory',
+    help=r'do not measure peak memory, which slows down the benchmarks.',
+    action='store_true')
+  parser.add_argument(
+    '-o',
+    '--output',
+    type=str,
+    help=r'json file where the report is written.')
+  parser.add_argument(
+    '-c',
+    '--compare',
+    type=str,
+    help=r'json report to compare with.')
+  if arg_str:
+    args = parser.parse_args(arg_str.split())
+  else:
+    args = parser.parse_args()
+
+  report = run(
+    [int(size) for size in args.sizes],
+    args.benchmarks,
+    sink_size = int(args.sink_size),
+    repeat = args.repeat,
+    memory = not args.no_memory,
+    verbose = not args.compare)
+
+  if args.compare:
+    with open(args.compare, 'r') as file:
+      compare(report, json.load(file))
+  if args.output:
+    with open(args.output, 'w') as file:
+      json.dump(report, file, indent=2)
+    print(f'Report written to {args.output}')
+  return report
+
+if __name__ == '__main__':
+  main()
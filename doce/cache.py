@@ -0,0 +1,160 @@
+"""Handle the cache of the reduced metrics of the doce module.
+
+The values of the reduced metrics are stored in an .sqlite file kept alongside the data sink
+of the outputs. A value is identified by the identifier of the setting, the name of the output
+and the reduction, and is valid as long as the version of the output,
+given by :meth:`doce.sink.Sink.version`, is unchanged.
+"""
+
+import os
+import io
+import hashlib
+import inspect
+import sqlite3
+import threading
+import numpy as np
+
+def cache_path(path):
+  """returns the path of the cache of the reduced metrics of a data sink.
+
+  The cache of a directory is a hidden file of the directory,
+  the cache of a file is a hidden file of the directory of the file.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.cache.cache_path('/tmp/my_experiment/')
+  '/tmp/my_experiment/.doce_cache.sqlite'
+  >>> doce.cache.cache_path('/tmp/my_experiment.h5')
+  '/tmp/.my_experiment.h5.doce_cache.sqlite'
+  """
+  if os.path.isdir(path) or path.endswith(('/', '\\')):
+    return os.path.join(path, '.doce_cache.sqlite')
+  (directory, name) = os.path.split(path)
+  return os.path.join(directory, f'.{name}.doce_cache.sqlite')
+
+def reduction_key(func):
+  """returns a key describing a reduction function.
+
+  The key is built from the qualified name of the function and a hash of its source code if available,
+  so that the cached values are not used once the function is modified.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> doce.cache.reduction_key(np.mean)
+  'numpy.mean:...'
+  """
+  name = f"{getattr(func, '__module__', None)}.{getattr(func, '__qualname__', repr(func))}"
+  try:
+    source = inspect.getsource(func)
+  except (OSError, TypeError):
+    source = repr(func)
+  return f'{name}:{hashlib.md5(source.encode()).hexdigest()}'
+
+class ReductionCache():
+  """stores the values of the reduced metrics of a data sink.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the data sink, see :func:`doce.cache.cache_path`.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import os
+  >>> if os.path.exists('/tmp/.example_cache.h5.doce_cache.sqlite'): os.remove('/tmp/.example_cache.h5.doce_cache.sqlite')
+  >>> cache = doce.cache.ReductionCache('/tmp/example_cache.h5')
+  >>> key = doce.cache.reduction_key(np.mean)
+  >>> cache.get('f1=1', 'accuracy', key, '10.0:(3,)') is None
+  True
+  >>> cache.set('f1=1', 'accuracy', key, '10.0:(3,)', np.float64(0.5))
+  >>> cache.commit()
+  >>> cache.get('f1=1', 'accuracy', key, '10.0:(3,)')
+  0.5
+  >>> cache.get('f1=1', 'accuracy', key, '10.0:(4,)') is None
+  True
+  >>> cache.close()
+  """
+  def __init__(self, path):
+    self.path = cache_path(path)
+    self._connection = None
+    self._lock = threading.Lock()
+    self._pending = []
+    self._values = None
+    # the cache is disabled if it cannot be written, for example on read-only storage
+    self._disabled = False
+
+  def _connect(self):
+    if self._connection is None:
+      self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+      self._connection.execute('''create table if not exists reduced_values
+        (identifier text, output text, reduction text, version text, value blob,
+        primary key (identifier, output, reduction))''')
+      self._connection.commit()
+    return self._connection
+
+  def get(self, identifier, output, reduction, version):
+    """returns the cached value of a reduction of an output, None if not available or outdated."""
+    with self._lock:
+      if self._disabled:
+        return None
+      if self._values is None:
+        # the cache is read at once, as most of its values are usually requested
+        try:
+          self._values = {tuple(row[:3]): row[3:] for row in self._connect().execute(
+            'select identifier, output, reduction, version, value from reduced_values')}
+        except sqlite3.Error:
+          self._disabled = True
+          return None
+    row = self._values.get((identifier, output, reduction))
+    if row is None or row[0] != version:
+      return None
+    return np.lib.format.read_array(io.BytesIO(row[1]), allow_pickle=False)[()]
+
+  def set(self, identifier, output, reduction, version, value):
+    """stores the value of a reduction of an output, written by :meth:`doce.cache.ReductionCache.commit`.
+
+    The values that cannot be stored without pickling are not stored.
+    """
+    value = np.asarray(value)
+    if value.dtype.hasobject:
+      return
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, value, allow_pickle=False)
+    self._pending.append((identifier, output, reduction, version, buffer.getvalue()))
+
+  def commit(self):
+    """writes the stored values to the cache."""
+    if not self._pending:
+      return
+    with self._lock:
+      if not self._disabled:
+        try:
+          connection = self._connect()
+          connection.executemany('insert or replace into reduced_values values (?, ?, ?, ?, ?)', self._pending)
+          connection.commit()
+        except sqlite3.Error:
+          self._disabled = True
+      if self._values is not None:
+        self._values.update({tuple(row[:3]): row[3:] for row in self._pending})
+    self._pending = []
+
+  def close(self):
+    """writes the stored values and closes the cache."""
+    self.commit()
+    with self._lock:
+      if self._connection is not None:
+        self._connection.close()
+        self._connection = None
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
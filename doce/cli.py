@@ -14,7 +14,7 @@ import inspect
 import dataframe_image
 import doce
 
-def main(experiment = None, func = None, display_func = None, arg_str = None):
+def main(experiment = None, func = None, display_func = None, arg_str = None, batch_factors = None):
   """This method shall be called from the main script of the experiment
   to control the experiment using the command line.
 
@@ -22,6 +22,9 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
   It should be called from the main script of the experiment.
   The main script must define the **experiment** object that will be called before processing
   and a **func** function that will be run for each setting.
+  If **batch_factors** is set, **func** is run for each batch of settings
+  that only differ by the modalities of the batch factors,
+  see :meth:`doce.Plan.perform_batch`.
 
 
   Examples
@@ -59,16 +62,26 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       type=str,
       help=r'archive the selected  settings from a given path. \
       If the argument does not have / or \, the argument is interpreted as a member \
-      of the experiments path. The files are copied to the path experiment.path.archive if set.',
+      of the experiments path. The files are copied to the path experiment.path.archive if set. \
+      If experiment.path.archive is a tar or zip file, the settings are streamed to this archive.',
       nargs='?',
       const=''
   )
+  parser.add_argument(
+      '--aggregate',
+      type=str,
+      help=r'aggregate the displayed settings over the modalities of the given factors, \
+      separated by commas, for example seed or seed,fold. Each metric gives the mean over \
+      the aggregated settings and is followed by their standard deviation \
+      (default experiment._display.aggregate).'
+  )
   parser.add_argument(
       '-c',
       '--compute',
       type=int,
       help=r'perform computation. Integer parameter sets the number of jobs computed in parallel \
-      (default to one core).',
+      (default to one core). If the computation function is a coroutine function (async def), \
+      sets the number of settings computed concurrently.',
       nargs='?',
       const=1
   )
@@ -78,6 +91,22 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       help=r'copy codebase to the host defined by the host (-H) argument.',
       action='store_true'
   )
+  parser.add_argument(
+      '--compact',
+      type=str,
+      help=r'reclaim the space of the removed outputs in the data sink of a given path. \
+      If the argument does not have / or \, the argument is interpreted \
+      as a member of the experiments path. If no argument is given, all the data sinks \
+      of the experiment are compacted.',
+      nargs='?',
+      const=' '
+  )
+  parser.add_argument(
+      '--dry_run',
+      help=r'report the number and the size of the entries selected by the remove (-R), \
+      keep (-K) or archive (-A) commands, without modifying the data sinks.',
+      action='store_true'
+  )
   parser.add_argument(
       '-d',
       '--display',
@@ -120,6 +149,23 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       help=r'list files.',
       action='store_true'
   )
+  parser.add_argument(
+      '--fast',
+      help=r'use a low overhead driver loop for sequential computation, \
+      suited to large setting sets of short settings.',
+      action='store_true'
+  )
+  parser.add_argument(
+      '--h5_layout',
+      type=str,
+      choices=doce.sink.H5_LAYOUTS,
+      help=r'layout of the groups of the settings in .h5 files: flat (one group per setting \
+      at the root of the file), factor (one level of groups per factor), hash \
+      (groups of the settings gathered in 256 groups) or table (one table per output, \
+      with one row per setting, suited to scalar and fixed-length outputs). Nested layouts \
+      are faster for large numbers of settings. Existing .h5 files of the experiment \
+      are migrated to the given layout.'
+  )
   parser.add_argument(
       '-H',
       '--host',
@@ -199,6 +245,22 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       nargs='?',
       const='d'
   )
+  parser.add_argument(
+      '--profile',
+      type=str,
+      help=r'profile the computation of the settings. The report splits the time \
+      between doce overhead and user code and is written in the export path with \
+      the given name (default experiment name followed by _profile) \
+      in the pstats (.prof) and flamegraph compatible folded stack (.folded) formats.',
+      nargs='?',
+      const=''
+  )
+  parser.add_argument(
+      '--profile_interval',
+      type=int,
+      help=r'if --profile is set, profile one setting every given number of settings (default 1).',
+      default=1
+  )
   parser.add_argument(
       '-R',
       '--remove',
@@ -210,6 +272,35 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       nargs='?',
       const=' '
   )
+  parser.add_argument(
+      '--reduce_jobs',
+      type=int,
+      help=r'number of threads reading the outputs ahead of the reduction of the metrics \
+      (default experiment._display.reduce_jobs).'
+  )
+  parser.add_argument(
+      '--reduce_cache',
+      help=r'cache the reduced metrics in a hidden .doce_cache.sqlite file alongside each data sink, \
+      so that only the outputs modified since their last reduction are read \
+      (default experiment._display.reduce_cache).',
+      action='store_true'
+  )
+  parser.add_argument(
+      '--reduce_processes',
+      type=int,
+      help=r'number of worker processes computing the reductions of the metrics \
+      that are not computed by chunks (default experiment._display.reduce_processes).'
+  )
+  parser.add_argument(
+      '--restore',
+      type=str,
+      help=r'restore the selected settings of a given path from the path experiment.path.archive. \
+      If the argument does not have / or \, the argument is interpreted \
+      as a member of the experiments path. If no argument is given, all the data sinks \
+      of the experiment are restored.',
+      nargs='?',
+      const=' '
+  )
   parser.add_argument(
       '-s',
       '--select',
@@ -223,6 +314,12 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       help=r'check availability of any metric of a given setting and skip \
       computation if available.',
       action='store_true')
+  parser.add_argument(
+      '--timeout',
+      type=float,
+      help=r'if the computation function is a coroutine function (async def), \
+      maximal duration in seconds of the computation of a setting.',
+  )
   parser.add_argument(
       '-u',
       '--user_data',
@@ -287,15 +384,26 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
     for path in experiment.path.__dict__.keys():
       if not path.endswith('_raw') and path != 'code' and path != 'archive'and path != 'export': 
         new_path = getattr(experiment.path, path)
-        if new_path.endswith('.h5'):
-          new_path = new_path[:-3]+'_'+args.tag+'.h5'
-        else:
-          new_path += '/'+args.tag
-        experiment.set_path(path, new_path)
+        experiment.set_path(path, doce.sink.tag_path(new_path, args.tag))
     # for path in experiment.path.__dict__.keys():
     #   print(path)
     #   print(getattr(experiment.path, path))
 
+  if args.h5_layout:
+    experiment._h5_layout = args.h5_layout
+    for path in experiment.path.__dict__.values():
+      if isinstance(path, str) and path.endswith(doce.sink.H5_EXTENSION) and os.path.exists(path):
+        doce.sink.migrate_h5(path, args.h5_layout)
+
+  if args.reduce_jobs is not None:
+    experiment._display.reduce_jobs = args.reduce_jobs
+  if args.reduce_processes is not None:
+    experiment._display.reduce_processes = args.reduce_processes
+  if args.reduce_cache:
+    experiment._display.reduce_cache = True
+  if args.aggregate is not None:
+    experiment._display.aggregate = args.aggregate.split(',')
+
   if isinstance(args.user_data, dict):
     experiment.user_data = args.user_data
 
@@ -382,7 +490,8 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
         args.remove,
         experiment.selector,
         archive_path=experiment.path.archive,
-        verbose=experiment.status.verbose
+        verbose=experiment.status.verbose,
+        dry_run=args.dry_run
     )
   if args.keep:
     experiment.clean_data_sink(
@@ -390,8 +499,11 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
         experiment.selector,
         reverse=True,
         archive_path=experiment.path.archive,
-        verbose=experiment.status.verbose
+        verbose=experiment.status.verbose,
+        dry_run=args.dry_run
     )
+  if args.compact:
+    experiment.compact_data_sink(args.compact)
   if args.archive:
     if experiment.path.archive:
       experiment.clean_data_sink(
@@ -399,10 +511,19 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
           experiment.selector,
           keep=True,
           archive_path=experiment.path.archive,
-          verbose=experiment.status.verbose
+          verbose=experiment.status.verbose,
+          dry_run=args.dry_run
       )
     else:
       print('Please set the path.archive path before issuing an archive command.')
+  if args.restore:
+    if experiment.path.archive:
+      experiment.restore_data_sink(
+          args.restore,
+          experiment.selector if experiment.selector else None
+      )
+    else:
+      print('Please set the path.archive path before issuing a restore command.')
 
   log_file_name = ''
   if args.host > -2:
@@ -443,13 +564,25 @@ def main(experiment = None, func = None, display_func = None, arg_str = None):
       f'<div> Selector = {args.select}</div>'
       )
   if args.compute and func:
+    profile = ''
+    if args.profile is not None:
+      profile = args.profile
+      if not profile:
+        profile = f'{experiment.name}_profile'
+      if '/' not in profile and '\\' not in profile:
+        profile = f'{experiment.path.export}/{profile}'
     experiment.perform(
       experiment.selector,
       func,
       nb_jobs=args.compute,
       log_file_name=log_file_name,
       progress=args.progress,
-      mail_interval=float(args.mail)
+      mail_interval=float(args.mail),
+      profile=profile,
+      profile_interval=args.profile_interval,
+      fast=args.fast,
+      batch_factors=batch_factors,
+      timeout=args.timeout
       )
 
   select_display = []
@@ -506,19 +639,12 @@ def data_frame_display(experiment, args, select_display, select_factor):
   selector = experiment.selector
   if select_factor:
     factor_index = experiment._plan.factors().index(select_factor)
-
     selector = experiment._plan.expand_selector(selector, select_factor)
-
     masked_selector_factor = selector[factor_index]
 
-    selector[factor_index] = [0]
-    experiment._plan.select(selector).__set_settings__()
-    settings = experiment._plan._settings
-
-    for setting in settings:
-      setting[factor_index] = masked_selector_factor
-
-  (table, columns, header, nb_factor_columns, modification_time_stamp, significance) = experiment.metric.reduce(
+  # the pivot table is built from a single reduction of the selected settings,
+  # each setting being compared with the ones of the same row of the pivot table
+  (data_frame, columns, header, nb_factor_columns, modification_time_stamp, significance) = experiment.metric.reduce(
     experiment._plan.select(selector),
     experiment.path,
     factor_display=experiment._display.factor_format_in_reduce,
@@ -526,10 +652,17 @@ def data_frame_display(experiment, args, select_display, select_factor):
     factor_display_length=experiment._display.factor_format_in_reduce_length,
     metric_display_length=experiment._display.metric_format_in_reduce_length,
     metric_delimiter = experiment.metric_delimiter,
-    verbose=args.verbose
+    verbose=args.verbose,
+    jobs=experiment._display.reduce_jobs,
+    processes=experiment._display.reduce_processes,
+    cache=experiment._display.reduce_cache,
+    correction=experiment._display.p_value_correction,
+    pivot_factor=select_factor if select_factor else None,
+    aggregate=experiment._display.aggregate,
+    data_frame=True
     )
 
-  if len(table) == 0:
+  if len(data_frame) == 0:
     return (None, '', None, None, None)
   if select_factor:
     modalities = getattr(experiment._plan, select_factor)[masked_selector_factor]
@@ -537,29 +670,44 @@ def data_frame_display(experiment, args, select_display, select_factor):
         select_factor + ': ' + str(modalities[0]) + ' ', '')
     header = f'metric: {columns[nb_factor_columns+select_display[0]]} for factor {header_short} {select_factor}'
 
-    columns = columns[:nb_factor_columns]
-    for modality in modalities:
-      columns.append(str(modality))
-
-    significance = np.zeros((len(settings), len(modalities)))
-    for row_index, _ in enumerate(table):
-      table[row_index] = table[row_index][:nb_factor_columns]
-    # print(settings)
-    for setting_index, setting in enumerate(settings):
-      (setting_descriptions, _, _, _, setting_modification_time_stamp, setting_p_values) = experiment.metric.reduce(
-        experiment._plan.select(setting),
-        experiment.path,
-        factor_display=experiment._display.factor_format_in_reduce,
-        metric_display=experiment._display.metric_format_in_reduce,
-        factor_display_length=experiment._display.factor_format_in_reduce_length,
-        metric_display_length=experiment._display.metric_format_in_reduce_length,
-        metric_delimiter = experiment.metric_delimiter,
-        verbose=args.verbose
-        )
-      modification_time_stamp += setting_modification_time_stamp # ???
-      significance[setting_index, :] = setting_p_values[:, select_display[0]]
-      for setting_description in setting_descriptions:
-        table[setting_index].append(setting_description[1 + select_display[0]])
+    # the column of the pivot factor is removed if the factor has several modalities
+    pivot_column = doce.util.compress_description(select_factor,
+                                                  experiment._display.factor_format_in_reduce,
+                                                  experiment._display.factor_format_in_reduce_length)
+    pivot_index = columns.index(pivot_column) if pivot_column in columns[:nb_factor_columns] else None
+    factor_indexes = [index for index in range(nb_factor_columns) if index != pivot_index]
+    # the row of each setting is given by its other factors, in order of appearance,
+    # and its column by the modality of the pivot factor
+    if factor_indexes:
+      row_indexes = data_frame.groupby(list(data_frame.columns[factor_indexes]), sort=False, observed=True).ngroup().to_numpy()
+    else:
+      row_indexes = np.zeros(len(data_frame), dtype=int)
+    if pivot_index is None:
+      column_indexes = np.zeros(len(data_frame), dtype=int)
+    else:
+      modality_index = {str(modality): index for index, modality in enumerate(modalities)}
+      column_indexes = data_frame.iloc[:, pivot_index].astype(str).map(modality_index).to_numpy()
+    nb_rows = row_indexes.max()+1
+    pivot_table = np.full((nb_rows, len(modalities)), np.nan)
+    pivot_table[row_indexes, column_indexes] = data_frame.iloc[:, nb_factor_columns+select_display[0]].to_numpy()
+    pivot_significance = np.zeros((nb_rows, len(modalities)))
+    pivot_significance[row_indexes, column_indexes] = significance[:, select_display[0]]
+
+    factor_frame = data_frame.iloc[np.unique(row_indexes, return_index=True)[1], factor_indexes].reset_index(drop=True)
+    columns = list(factor_frame.columns)+[str(modality) for modality in modalities]
+    data_frame = pd.concat([factor_frame, pd.DataFrame(pivot_table)], axis=1)
+    data_frame.columns = columns
+    nb_factor_columns = len(factor_indexes)
+    significance = pivot_significance
+
+  # the factor columns are displayed with the type of their modalities
+  for column_index in range(nb_factor_columns):
+    data_frame.isetitem(column_index, np.asarray(data_frame.iloc[:, column_index]))
+
+  if experiment._display.aggregate and select_display and not select_factor:
+    # the standard deviations of the selected metrics are displayed along them
+    nb_metric_columns = (len(columns)-nb_factor_columns)//2
+    select_display = select_display+[index+nb_metric_columns for index in select_display]
 
   if significance is not None:
     best = significance == -1
@@ -570,21 +718,19 @@ def data_frame_display(experiment, args, select_display, select_factor):
       significance = significance[:, select_display]
 
   if experiment._display.pValue == 0:
-    for table_row_index, in enumerate(table):
-      table[table_row_index][-len(significance[table_row_index]):] = significance[table_row_index]
+    data_frame.iloc[:, -significance.shape[1]:] = significance
 
   if modification_time_stamp:
     print(f'Displayed data generated from {time.ctime(min(modification_time_stamp))} \
      to {time.ctime(max(modification_time_stamp))}')
-  data_frame = pd.DataFrame(table, columns=columns)  # .fillna('-')
 
   if (select_display and
       not select_factor and
       len(columns) >= max(select_display) + nb_factor_columns
       ):
-    columns = [columns[i] for i in [
-        *range(nb_factor_columns)] + [s + nb_factor_columns for s in select_display]]
-    data_frame = data_frame[columns]
+    column_indexes = [*range(nb_factor_columns)] + [s + nb_factor_columns for s in select_display]
+    columns = [columns[i] for i in column_indexes]
+    data_frame = data_frame.iloc[:, column_indexes]
 
   table_style = dict(selector="th", props=[
            ('text-align', 'center'), ('border-bottom', '.1rem solid')])
@@ -600,7 +746,7 @@ def data_frame_display(experiment, args, select_display, select_factor):
   for column_index, column in enumerate(columns):
     # if data_frame[column].dtypes == 'bool':
     #   bool_selector.append(column) 
-    if np.sum(np.array(data_frame[column])==-99999)+np.sum(np.array(data_frame[column])==0)+np.sum(np.array(data_frame[column])==1) == np.array((data_frame[column])).size:
+    if data_frame[column].isin([-99999, 0, 1]).all():
       bool_selector.append(column)
       data_frame[column] = data_frame[column].replace({-99999: 0})
       data_frame = data_frame.astype({column: 'bool'})
@@ -620,20 +766,21 @@ def data_frame_display(experiment, args, select_display, select_factor):
   d_precision = pd.Series(c_metric_precision, index=c_metric, dtype=np.intc)
   data_frame = data_frame.round(d_precision)
  
+  # the columns are converted as a whole, NaN values preventing the conversion to integers
+  for column in columns:
+    values = data_frame[column]
+    if values.dtype.kind == 'f' and np.all(np.mod(values, 1) == 0):
+      c_int[column] = 'int32'
+  data_frame = data_frame.astype(c_int)
   for column in columns:
-    if isinstance(data_frame[column][0], float):
-      is_integer = True
-      for data_column in data_frame[column]:
-        if not data_column.is_integer():
-          is_integer = False
-      if is_integer:
-        c_int[column] = 'int32'
-
-  data_frame = data_frame.astype(c_int).applymap(remove_special)
+    special = data_frame[column].isin([-99999, '-99999'])
+    if special.any():
+      data_frame[column] = data_frame[column].astype(object).where(~special, '')
+
   columns = data_frame.columns.to_series()
   data_frame.columns = data_frame.columns.to_series().apply(metric_direction, **{'metrics': experiment.metric, 'output_type':'html'})
-  
-  styler = data_frame.applymap(pretty_bool).style.set_properties(subset=data_frame.columns[numeric_col_selector],
+
+  styler = pretty_bool_columns(data_frame).style.set_properties(subset=data_frame.columns[numeric_col_selector],
                                    **{'width': '10em', 'text-align': 'right'})\
       .set_properties(subset=data_frame.columns[~numeric_col_selector],
                       **{'width': '10em', 'text-align': 'left'})\
@@ -658,7 +805,7 @@ def data_frame_display(experiment, args, select_display, select_factor):
                  **{'significance': significance})
 
   data_frame.columns = columns.apply(metric_direction, **{'metrics': experiment.metric, 'output_type':'text'})
-  return (data_frame.fillna('-').applymap(int_bool), header, styler, significance, c_metric)
+  return (int_bool_columns(data_frame.fillna('-')), header, styler, significance, c_metric)
 
 def pretty_bool(val):
   if isinstance(val, bool):
@@ -668,6 +815,14 @@ def pretty_bool(val):
       return ''
   return val
 
+def pretty_bool_columns(data_frame):
+  """returns data_frame where the bool columns are displayed as a dot if True and empty otherwise."""
+  data_frame = data_frame.copy()
+  for column_index, dtype in enumerate(data_frame.dtypes):
+    if dtype == bool:
+      data_frame.iloc[:, column_index] = np.where(data_frame.iloc[:, column_index], '&#11044', '')
+  return data_frame
+
 def escape_tex(val):
   if isinstance(val, str):
     val = val.replace('_', r'\_').replace('%', r'\%').replace('$', r'\$').replace('{', r'\{').replace('}', r'\}')
@@ -679,6 +834,10 @@ def int_bool(val):
     return int(val)
   return val
 
+def int_bool_columns(data_frame):
+  """returns data_frame where the bool columns are converted to integers."""
+  return data_frame.astype({column: int for column, dtype in data_frame.dtypes.items() if dtype == bool})
+
 def remove_special(val):
   if val == -99999 or val == '-99999':
     return ''
@@ -713,6 +872,9 @@ def highlight_best(data_frame, significance):
   return data_frame
 
 def metric_direction(val, metrics, output_type):
+  if val.endswith(' std'):
+    # the standard deviations of the aggregated metrics have no direction
+    return val
   for metric in metrics.name():
     if len(val) >= len(getattr(metrics, metric)['name']) and getattr(metrics, metric)['name'] == val[:len(getattr(metrics, metric)['name'])]:
       if getattr(metrics, metric)['higher_the_better']:
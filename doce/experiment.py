@@ -6,10 +6,12 @@ import os
 import time
 import datetime
 import ast
-import glob
 import copy
 import numpy as np
 import doce.util as eu
+import doce.profiling
+import doce.sink
+import doce.archive
 import doce
 
 class Experiment():
@@ -133,6 +135,11 @@ class Experiment():
     self._default_server_run_argument =  {}
     self._resume = False
     self._check_setting_length = True
+    self._sinks = {}
+    self._writer = None
+    self._write_buffer_size = 256
+    self._h5_layout = 'flat'
+    self._output_options = {}
 
     self._display = types.SimpleNamespace()
     self._display.export_png = 'wkhtmltoimage' # could be 'chrome' or 'matplotlib'
@@ -146,6 +153,11 @@ class Experiment():
     self._display.highlight = True
     self._display.bar = False
     self._display.pValue = 0.05
+    self._display.p_value_correction = None # could be 'holm' or 'bh'
+    self._display.reduce_jobs = 1 # threads reading the outputs ahead of the reduction
+    self._display.reduce_processes = 0 # worker processes computing custom reductions
+    self._display.reduce_cache = False # cache the reduced metrics alongside the data sinks
+    self._display.aggregate = None # factors over which the displayed settings are aggregated, e.g. ['seed']
 
     for field, value in description.items():
       self.__setattr__(field, value)
@@ -197,7 +209,7 @@ class Experiment():
 
     path = os.path.abspath(os.path.expanduser(path))
     if path:
-      if path.endswith('.h5'):
+      if doce.sink.is_file_sink(path) or doce.archive.is_archive(path):
         path = os.path.dirname(os.path.abspath(path))
       else:
         if not path.endswith('/'):
@@ -350,7 +362,12 @@ class Experiment():
     progress='d',
     log_file_name='',
     mail_interval=0,
-    tag=''
+    tag='',
+    profile='',
+    profile_interval=1,
+    fast=False,
+    batch_factors=None,
+    timeout=None
     ):
     r"""Operate the function with parameters on the :term:`settings<setting>` set
     generated using :term:`selector`.
@@ -375,6 +392,10 @@ class Experiment():
 
       If None, a description of the given setting is shown.
 
+      If the function is a coroutine function (defined using async def),
+      the settings are processed on an asyncio event loop,
+      see :meth:`doce.Plan.perform_async`.
+
     *parameters : any type (optional)
       parameters to be given to the function.
 
@@ -387,6 +408,9 @@ class Experiment():
       If nb_jobs > 1, the settings set is browsed randomly,
       and settings are distributed over the different processes.
 
+      If the function is a coroutine function, nb_jobs is the maximal number
+      of settings processed concurrently.
+
     progress : str (optional)
       display progress of scheduling the setting set.
 
@@ -412,6 +436,38 @@ class Experiment():
     tag : string (optional)
       specify a tag to be added to the output names
 
+    profile : str (optional)
+      If empty, no profiling is done (default).
+
+      If not empty, path prefix of the profiling report files.
+      The time spent by the function and the overhead of doce are measured,
+      and the processing of the settings is profiled using cProfile.
+      Statistics are written in the pstats (.prof) and folded stack (.folded) formats.
+      See :class:`doce.profiling.Profiler` for reference.
+
+    profile_interval : int (optional)
+      If profile is not empty, profile one setting every profile_interval settings (default 1).
+
+    fast : bool (optional)
+      If False, use the default driver loop (default).
+
+      If True and nb_jobs = 1, use a low overhead driver loop that is suited
+      to large setting sets of short settings. In this case, the setting object
+      given to the function is updated in place and shall not be retained by the function.
+      See :meth:`doce.Plan.perform_fast` for reference.
+
+    batch_factors : list of str (optional)
+      If empty, the function operates on each setting (default).
+
+      If not empty, the settings that only differ by the modalities of the batch factors
+      are gathered as a :class:`doce.setting.SettingBatch` that is given to the function,
+      where the batch factors are numpy arrays with the modalities of the settings of the batch.
+      See :meth:`doce.Plan.perform_batch` for reference.
+
+    timeout : float (optional)
+      If the function is a coroutine function, maximal duration in seconds of the processing
+      of a setting. Settings that last longer are cancelled and considered as failed.
+
     See Also
     --------
 
@@ -443,17 +499,38 @@ class Experiment():
     1+5=6
     1+2=3
     3+5=8
+
+    >>> # this function operates on batches of settings where factor2 varies
+    >>> def my_batch_function(setting_batch, experiment):
+    ...  print(f'{setting_batch.factor1}+{setting_batch.factor2}={setting_batch.factor1+setting_batch.factor2}')
+    >>> nb_failed = e.perform([], my_batch_function, progress='', batch_factors=['factor2'])
+    1+[2 5]=[3 6]
+    3+[2 5]=[5 8]
     """
 
-    return self._plan.select(selector).perform(
-      function,
-      self,
-      *parameters,
-      nb_jobs=nb_jobs,
-      progress=progress,
-      log_file_name=log_file_name,
-      mail_interval=mail_interval
-      )
+    profiler = None
+    if profile:
+      profiler = doce.profiling.Profiler(profile, profile_interval)
+
+    try:
+      nb_failed = self._plan.select(selector).perform(
+        function,
+        self,
+        *parameters,
+        nb_jobs=nb_jobs,
+        progress=progress,
+        log_file_name=log_file_name,
+        mail_interval=mail_interval,
+        profiler=profiler,
+        fast=fast,
+        batch_factors=batch_factors,
+        timeout=timeout
+        )
+    finally:
+      # outputs saved using doce.Experiment.save may still be buffered
+      nb_failed_writes = self.flush()
+      self._close_sinks()
+    return nb_failed+nb_failed_writes
 
   def select(self, selector, show=False, plan_order_factor=None):
     experiment_id = 'all'
@@ -510,7 +587,8 @@ class Experiment():
     wildcard='*',
     setting_encoding=None,
     archive_path = None,
-    verbose=0
+    verbose=0,
+    dry_run=False
     ):
     r""" Perform a cleaning of a data sink (directory or h5 file).
 
@@ -546,9 +624,16 @@ class Experiment():
 
     archive_path : str (optional)
       If not None, specify an existing directory where the specified data will be moved.
+      If the path designates a tar or zip archive, the specified data is streamed to the archive,
+      along with a manifest of the archived settings, see :mod:`doce.archive`.
+      The archived data is restored by :meth:`doce.Experiment.restore_data_sink`.
 
       If None, the path doce.Experiment._archive_path is used (default).
 
+    dry_run : bool (optional)
+      If True, only report the number and the size of the selected entries,
+      without modifying the data sink (default: False).
+
     See Also
     --------
 
@@ -570,6 +655,9 @@ class Experiment():
     >>> os.listdir(e.path.output)
     ['factor1=1+factor2=4_mult.npy', 'factor1=1+factor2=4_sum.npy', 'factor1=3+factor2=4_sum.npy', 'factor1=1+factor2=2_mult.npy', 'factor1=1+factor2=2_sum.npy', 'factor1=3+factor2=2_mult.npy', 'factor1=3+factor2=4_mult.npy', 'factor1=3+factor2=2_sum.npy']
 
+    >>> e.clean_data_sink('output', [0], dry_run=True)
+    About to process path: output
+    Would remove 4 files (0.00 MB) from /tmp/test/
     >>> e.clean_data_sink('output', [0], force=True)
     About to process path: output
     >>> os.listdir(e.path.output)
@@ -653,6 +741,7 @@ class Experiment():
     Here, the same operations are conducted on a h5 file.
     """
 
+    self.flush()
     if path == ' ':
       paths = self.path.__dict__
     else:
@@ -671,8 +760,184 @@ class Experiment():
             wildcard=wildcard,
             setting_encoding=setting_encoding,
             archive_path=archive_path,
-            verbose=verbose
+            verbose=verbose,
+            dry_run=dry_run,
+            metric_delimiter=self.metric_delimiter,
+            output_names=self._output_names()
             )
+    # cleaning may compact the data sinks
+    self._close_sinks()
+
+  def compact_data_sink(self, path=' ', verbose=True):
+    r"""reclaims the space of the removed outputs in data sinks.
+
+    The .h5 files are rewritten, see :func:`doce.sink.compact_h5`,
+    the consolidated stores are merged, see :meth:`doce.store.Store.compact`,
+    and the .sqlite files are vacuumed. Directories of .npy files need no compaction.
+
+    Parameters
+    ----------
+
+    path : str
+      If has a / or \\\, a valid path to a data sink.
+
+      If has no / or \\\, a member of the name_space self.path.
+
+      If ' ' (default), all the paths of the experiment.
+
+    verbose : bool
+      If True (default), display the progress and the sizes of the data sinks.
+
+    Returns
+    -------
+
+    sizes: dict
+      for each data sink, the sizes in bytes before and after the compaction.
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> import numpy as np
+    >>> e=doce.Experiment()
+    >>> e.set_path('output', '/tmp/example_compact_experiment.h5')
+    >>> e.add_plan('plan', f1=np.arange(10))
+    >>> e.set_metric(name='m1')
+    >>> def process(setting, experiment):
+    ...   experiment.save(setting, 'm1', np.ones(10000))
+    >>> nb_failed = e.perform([], process, progress='')
+    >>> for f1 in range(5):
+    ...   e.sink('output').remove(f'f1={f1}')
+    >>> sizes = e.compact_data_sink(verbose=False)
+    >>> (size, compacted_size) = sizes['/tmp/example_compact_experiment.h5']
+    >>> compacted_size < size
+    True
+    """
+    self.flush()
+    if path == ' ':
+      paths = self.path.__dict__
+    else:
+      paths = [path]
+    sizes = {}
+    for path in paths:
+      if not path.endswith('_raw') and path not in self._doce_paths:
+        if '/' not in path and '\\' not in path:
+          path = self.__getattribute__('path').__getattribute__(path)
+        if path:
+          sink = self.sink(path)
+          size = sink.size()
+          if isinstance(sink, doce.sink.H5Sink):
+            sink.compact(verbose)
+          else:
+            sink.compact()
+          sizes[path] = (size, sink.size())
+          if verbose and not isinstance(sink, doce.sink.H5Sink):
+            print(f'Size of {path} reduced from {size/1024**2:.2f} MB to {sizes[path][1]/1024**2:.2f} MB')
+    self._close_sinks()
+    return sizes
+
+  def restore_data_sink(self, path=' ', selector=None, archive_path=None, verbose=True):
+    r"""restores the outputs archived from data sinks.
+
+    The outputs are read from the archive_path, either a tar or zip archive, see :mod:`doce.archive`,
+    or a directory where the outputs have been copied by :meth:`doce.Experiment.clean_data_sink`.
+
+    Parameters
+    ----------
+
+    path : str
+      If has a / or \\\, a valid path to a data sink.
+
+      If has no / or \\\, a member of the name_space self.path.
+
+      If ' ' (default), all the paths of the experiment.
+
+    selector : a list of literals or a list of lists of literals (optional)
+      :term:`selector` used to specify the :term:`settings<setting>` set to restore.
+      If None (default), all the archived settings are restored.
+
+    archive_path : str (optional)
+      If None, the path doce.Experiment.path.archive is used (default).
+
+    verbose : bool
+      If True (default), display the progress of the restoration.
+
+    Returns
+    -------
+
+    counts: dict
+      for each data sink, the number of restored outputs.
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> import numpy as np
+    >>> import os
+    >>> e=doce.Experiment()
+    >>> e.set_path('output', '/tmp/example_restore/', force=True)
+    >>> e.set_path('archive', '/tmp/example_restore.zip')
+    >>> e.add_plan('plan', f1=np.arange(4))
+    >>> e.set_metric(name='m1')
+    >>> def process(setting, experiment):
+    ...   experiment.save(setting, 'm1', np.ones(3)*setting.f1)
+    >>> nb_failed = e.perform([], process, progress='')
+    >>> e.clean_data_sink('output', {'f1': [2, 3]}, force=True, archive_path=e.path.archive)
+    About to process path: output
+    Archived data should be available at: /tmp/example_restore.zip
+    >>> sorted(os.listdir(e.path.output))
+    ['f1=0->m1.npy', 'f1=1->m1.npy']
+    >>> e.restore_data_sink('output', verbose=False)
+    {'/tmp/example_restore/': 2}
+    >>> e.sink().read('f1=3', 'm1')
+    array([3., 3., 3.])
+
+    The modalities may contain the metric delimiter.
+
+    >>> e=doce.Experiment()
+    >>> e.metric_delimiter = '_'
+    >>> e.set_path('output', '/tmp/example_restore_delimiter/', force=True)
+    >>> e.set_path('archive', '/tmp/example_restore_delimiter.tar')
+    >>> e.add_plan('plan', f1=[1], model=['linear_svm', 'tree'])
+    >>> e.set_metric(name='acc')
+    >>> def process(setting, experiment):
+    ...   experiment.save(setting, 'acc', np.ones(2))
+    >>> nb_failed = e.perform([], process, progress='')
+    >>> e.sink().identifiers()
+    ['f1=1+model=linear_svm', 'f1=1+model=tree']
+    >>> e.clean_data_sink('output', {'model': 'linear_svm'}, force=True, archive_path=e.path.archive)
+    About to process path: output
+    Archived data should be available at: /tmp/example_restore_delimiter.tar
+    >>> e.restore_data_sink('output', {'model': 'linear_svm'}, verbose=False)
+    {'/tmp/example_restore_delimiter/': 1}
+    """
+    self.flush()
+    if archive_path is None:
+      archive_path = self.path.archive
+    if not archive_path:
+      print('Please set the path.archive path before issuing a restore command.')
+      raise ValueError
+    identifiers = None
+    if selector is not None:
+      identifiers = [setting.identifier() for setting in self._plan.select(selector)]
+    if path == ' ':
+      paths = self.path.__dict__
+    else:
+      paths = [path]
+    counts = {}
+    for path in paths:
+      if not path.endswith('_raw') and path not in self._doce_paths:
+        if '/' not in path and '\\' not in path:
+          path = self.__getattribute__('path').__getattribute__(path)
+        if path:
+          sink = self.sink(path)
+          source = archive_path
+          if (os.path.isdir(archive_path) and not doce.store.is_store(archive_path)
+              and not isinstance(sink, doce.sink.NpySink)):
+            source = os.path.join(archive_path, os.path.basename(path.rstrip('/\\')))
+          counts[path] = doce.archive.restore_archive(source, sink, identifiers, verbose)
+    self._close_sinks()
+    return counts
 
   def plans(self):
     # names = []
@@ -709,6 +974,8 @@ class Experiment():
       raise Exception('A metric name must be a string.')
     if significance and not lower_the_better and not higher_the_better:
       raise Exception('Significance analysis requires either lower_the_better or higher_the_better to set be to True.')
+    if isinstance(significance, str) and significance not in doce.metric.SIGNIFICANCE_TESTS:
+      raise Exception('The significance test must be one of: '+', '.join(doce.metric.SIGNIFICANCE_TESTS)+'.')
     if precision is None:
       precision = self._display.metric_precision
     if output is None:
@@ -728,23 +995,218 @@ class Experiment():
       'unit':unit
       })
 
-  
+  def set_output(self,
+    name,
+    compression = 'zlib',
+    level = 5,
+    shuffle = True,
+    chunk_shape = None
+    ):
+    """sets the storage options of an output.
+
+    The options are considered when the output is stored with :meth:`doce.Experiment.save`
+    or :meth:`doce.Experiment.add_setting_group`.
+
+    Parameters
+    ----------
+
+    name: str
+      name of the output.
+
+    compression: str (optional)
+      compression library: 'zlib' (default), 'blosc', 'blosc:lz4', 'blosc:zstd', 'bzip2', 'lzo',
+      or None for no compression. With .npy storage, compressed outputs are stored
+      in .npz files, compressed with zlib whatever the library.
+
+    level: int (optional)
+      compression level, from 0 to 9 (default 5). Only considered for .h5 storage.
+
+    shuffle: bool (optional)
+      if True, bytes are shuffled before compression,
+      which usually improves the compression of floating point values (default).
+      Only considered for .h5 storage.
+
+    chunk_shape: tuple (optional)
+      shape of the chunks of the arrays of .h5 files (default None, chosen by PyTables).
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> import numpy as np
+    >>> import shutil
+    >>> shutil.rmtree('/tmp/example_output', ignore_errors=True)
+    >>> e=doce.Experiment()
+    >>> e.set_path('output', '/tmp/example_output', force=True)
+    >>> e.add_plan('plan', f1=[1, 2])
+    >>> e.set_metric(name='loss', func=np.min)
+    >>> e.set_output('loss', compression='zlib')
+    >>> def process(setting, experiment):
+    ...   experiment.save(setting, 'loss', np.ones(1000)*setting.f1)
+    >>> nb_failed = e.perform([], process, progress='')
+    >>> sorted(os.listdir(e.path.output))
+    ['f1=1->loss.npz', 'f1=2->loss.npz']
+    >>> (table, _, _, _, _, _) = e.metric.reduce(e._plan, e.path, metric_delimiter=e.metric_delimiter)
+    >>> table
+    [[1, 1.0], [2, 2.0]]
+    """
+    self._output_options[name] = {
+      'compression': compression,
+      'level': level,
+      'shuffle': shuffle,
+      'chunk_shape': chunk_shape
+      }
+
   def default(self, plan='', factor='', modality=''):
     getattr(self, plan).default(factor, modality)
 
   def skip_setting(self, setting):
     if self._resume:
       for path in self.__getattribute__('path').__dict__.keys():
-        if path.endswith('.h5'):
-          print('todo')
-        else:
-          if path not in self._doce_paths:
-            check = glob.glob(f'{self.path.__getattribute__(path)}{setting.identifier()}_*.npy')
-            if check:
-              return True
+        if not path.endswith('_raw') and path not in self._doce_paths:
+          if self.sink(path).contains(setting.identifier()):
+            return True
     return False
 
-  def get_output(self, output='', selector=None, path='', tag='', plan=None):
+  def sink(self, path='output'):
+    """returns the data sink of a path.
+
+    The sink is opened once and shared by the subsequent calls.
+
+    Parameters
+    ----------
+
+    path: str
+      Name of path as defined in the experiment,
+      or a valid path to a data sink.
+
+    See Also
+    --------
+
+    doce.sink.get_sink
+    """
+    if hasattr(self.path, path):
+      path = getattr(self.path, path)
+    if path not in self._sinks:
+      factors = sorted(set(factor for name in self._plans for factor in getattr(self, name).factors()))
+      self._sinks[path] = doce.sink.get_sink(path, self.metric_delimiter, self._h5_layout, factors)
+      self._sinks[path].options = self._output_options
+    self._sinks[path].output_names = self._output_names()
+    return self._sinks[path]
+
+  def _output_names(self):
+    """returns the names of the outputs declared by the metrics and the storage options."""
+    return set(getattr(self.metric, metric)['output'] for metric in self.metric.name()) | set(self._output_options)
+
+  def save(self, setting, output, data, path='output'):
+    """stores an output of a setting in the data sink of a path.
+
+    The data sink is selected according to the path,
+    see :func:`doce.sink.get_sink`: a directory of .npy files following the naming convention
+    <identifier><metric_delimiter><output>.npy, an .h5 file, a consolidated store
+    (directory ending with .store) or an .sqlite file.
+
+    The output is written by a background thread, so that the computation
+    of the settings overlaps the writing to disk. The pending outputs are written
+    at the end of :meth:`doce.Experiment.perform`, or by calling :meth:`doce.Experiment.flush`.
+    For .h5 files, the file is kept open by a single writer, see :class:`doce.sink.H5Writer`,
+    so that the settings can be computed in parallel. If the group of the setting has been created
+    by :meth:`doce.Experiment.add_setting_group`, the arrays of the group are filled.
+
+    Parameters
+    ----------
+
+    setting: :class:`doce.setting.Setting`
+      the setting whose output is stored.
+
+    output: str
+      name of the output.
+
+    data: array_like
+      the output.
+
+    path: str (optional)
+      Name of path as defined in the experiment (default 'output').
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> import numpy as np
+    >>> import shutil
+    >>> shutil.rmtree('/tmp/example_save.store', ignore_errors=True)
+    >>> e=doce.Experiment()
+    >>> e.set_path('output', '/tmp/example_save.store', force=True)
+    >>> e.add_plan('plan', f1=[1, 2], f2=[1, 2, 3])
+    >>> e.set_metric(name='m1', func=np.mean)
+    >>> def process(setting, experiment):
+    ...   experiment.save(setting, 'm1', setting.f1*setting.f2+np.arange(3))
+    >>> nb_failed = e.perform([], process, progress='')
+    >>> sorted(os.listdir(e.path.output))
+    ['...data', '...index']
+    >>> for setting in e._plan.select([1, 2]):
+    ...   print(e.load(setting, 'm1'))
+    [6 7 8]
+    >>> (table, _, _, _, _, _) = e.metric.reduce(e._plan.select([1]), e.path)
+    >>> table
+    [[1, 3.0], [2, 5.0], [3, 7.0]]
+    """
+    sink = self.sink(path)
+    if isinstance(sink, doce.sink.H5Sink):
+      # the group and the array are described as in doce.Experiment.add_setting_group
+      sink.write(setting.identifier(), output, data, str(setting), self._output_description(output))
+    elif self._write_buffer_size and not sink.asynchronous:
+      if self._writer is None:
+        self._writer = doce.sink.BufferedWriter(self._write_buffer_size)
+      self._writer.write(sink, setting.identifier(), output, data)
+    else:
+      sink.write(setting.identifier(), output, data)
+
+  def load(self, setting, output, path='output'):
+    """returns an output of a setting stored in the data sink of a path,
+    None if not available.
+
+    See Also
+    --------
+
+    doce.Experiment.save
+    """
+    self.flush()
+    return self.sink(path).read(setting.identifier(), output)
+
+  def flush(self):
+    """waits for the outputs saved using :meth:`doce.Experiment.save` to be written.
+
+    Returns
+    -------
+
+    nb_failed: int
+      the number of outputs that could not be written.
+    """
+    nb_failed = 0
+    if self._writer is not None:
+      nb_failed += self._writer.flush()
+    for sink in self._sinks.values():
+      nb_failed += sink.flush()
+    return nb_failed
+
+  def _output_description(self, output):
+    description = output
+    for metric in self.metric.name():
+      if getattr(self.metric, metric)['output'] == output:
+        if getattr(self.metric, metric)['description']:
+          description = getattr(self.metric, metric)['description']
+        if getattr(self.metric, metric)['unit']:
+          description += ' in ' + getattr(self.metric, metric)['unit']
+        break
+    return description
+
+  def _close_sinks(self):
+    for sink in self._sinks.values():
+      sink.close()
+    self._sinks = {}
+
+  def get_output(self, output='', selector=None, path='', tag='', plan=None, lazy=False):
     """ Get the output vector from an .npy or a group of a .h5 file.
 
     Get the output vector as a numpy array from an .npy or a group of a .h5 file.
@@ -766,6 +1228,10 @@ class Experiment():
     plan: str
       Name of plan to be considered.
 
+    lazy: bool
+      If True, the outputs are not loaded in memory but memory-mapped,
+      see :meth:`doce.sink.Sink.read_lazy`, so that only the accessed parts are read (default False).
+
     Returns
     -------
 
@@ -815,8 +1281,12 @@ class Experiment():
     3
     >>> print(setting_output[0].shape)
     (100,)
+    >>> (setting_output, _, _) = experiment.get_output(output = 'm1', selector = [1], path='output', lazy=True)
+    >>> type(setting_output[0]).__name__
+    'memmap'
     """
 
+    self.flush()
     if plan:
       plan = getattr(self, plan)
     else:
@@ -844,7 +1314,8 @@ class Experiment():
           settings=plan.select(selector),
           path=full_path,
           tag=tag,
-          metric_delimiter=self.metric_delimiter
+          metric_delimiter=self.metric_delimiter,
+          lazy=lazy
           )
       else:
         data = []
@@ -857,7 +1328,8 @@ class Experiment():
               settings=plan.select(selector),
               path=path_iterator,
               tag=tag,
-              metric_delimiter=self.metric_delimiter
+              metric_delimiter=self.metric_delimiter,
+              lazy=lazy
               )
             if data_path:
               for data_setting in data_path:
@@ -974,10 +1446,7 @@ class Experiment():
     #   setting_encoding={'factor_separator':'_', 'modality_separator':'_'}
     group_name = setting.identifier(**setting_encoding)
     # print(group_name)
-    if not file_id.__contains__('/'+group_name):
-      setting_group = file_id.create_group('/', group_name, str(setting))
-    else:
-      setting_group = file_id.root._f_get_child(group_name)
+    setting_group = doce.sink.h5_setting_group(file_id, group_name, str(setting), self._h5_layout)
     for metric in self.metric.name():
       output = getattr(self.metric, metric)['output']
       if getattr(self.metric, metric)['description']:
@@ -988,17 +1457,29 @@ class Experiment():
       if getattr(self.metric, metric)['unit']:
         description += ' in ' + getattr(self.metric, metric)['unit']
 
+      options = self._output_options.get(output, {})
+      filters = doce.sink.h5_filters(options)
       if output_dimension and output in output_dimension:
         if not setting_group.__contains__(output):
-          file_id.create_array(
-            setting_group,
-            output,
-            np.zeros((output_dimension[output]))*np.nan,
-            description)
+          if filters or options.get('chunk_shape'):
+            file_id.create_carray(
+              setting_group,
+              output,
+              obj=np.zeros((output_dimension[output]))*np.nan,
+              title=description,
+              filters=filters,
+              chunkshape=options.get('chunk_shape'))
+          else:
+            file_id.create_array(
+              setting_group,
+              output,
+              np.zeros((output_dimension[output]))*np.nan,
+              description)
       else:
         if setting_group.__contains__(output):
           setting_group._f_get_child(output)._f_remove()
-        file_id.create_earray(setting_group, output, tb.Float64Atom(), (0,), description)
+        file_id.create_earray(setting_group, output, tb.Float64Atom(), (0,), description,
+                              filters=filters, chunkshape=options.get('chunk_shape'))
 
     return setting_group
 
@@ -1010,7 +1491,8 @@ def get_from_path(
   tag='',
   setting_encoding=None,
   verbose=False,
-  metric_delimiter = '_'
+  metric_delimiter = '_',
+  lazy=False
   ):
   """ Get the metric vector from an .npy or a group of a .h5 file.
 
@@ -1028,6 +1510,7 @@ def get_from_path(
   path: str
     In the case of .npy storage, a valid path to the main directory.
     In the case of .h5 storage, a valid path to an .h5 file.
+    In the case of consolidated storage, a valid path to a .store directory.
 
   setting_encoding : dict
     Encoding of the setting. See doce.Plan.id for references.
@@ -1039,6 +1522,10 @@ def get_from_path(
     In the case of .h5 metric storage, if verbose is set to True,
     print the group seeked for the metric.
 
+  lazy : bool
+    If True, the metric vectors are memory-mapped instead of being loaded in memory,
+    see :meth:`doce.sink.Sink.read_lazy` (default False).
+
   Returns
   -------
 
@@ -1090,11 +1577,6 @@ def get_from_path(
   (100,)
   """
 
-  import tables as tb
-  import warnings
-  from tables import NaturalNameWarning
-  warnings.filterwarnings('ignore', category=NaturalNameWarning)
-
   setting_metric = []
   setting_descriptions = []
   if not setting_encoding:
@@ -1105,33 +1587,23 @@ def get_from_path(
   setting_description_format['sort'] = False
 
   if isinstance(path, str):
-    if path.endswith('.h5'):
-      if tag:
-        path = path[:-3]+'_'+tag+'.h5'
-      h5_fid = tb.open_file(path, mode='r')
-      for setting in settings:
-        if h5_fid.root.__contains__(setting.identifier(**setting_encoding)):
-          if verbose:
-            print(f'Found group {setting.identifier(**setting_encoding)}')
-          setting_group = h5_fid.root._f_get_child(setting.identifier(**setting_encoding))
-          if setting_group.__contains__(metric):
-            setting_metric.append(np.array(setting_group._f_get_child(metric)))
-            setting_descriptions.append(setting.identifier(**setting_description_format))
-        elif verbose:
-          print(f'** Unable to find group {setting.identifier(**setting_encoding)}')
-      h5_fid.close()
-    else:
-      if tag:
-        path += tag+'/'
-      for setting in settings:
-        file_name = f'{path}{setting.identifier(**setting_encoding)}{metric_delimiter}{metric}.npy'
-        if os.path.exists(file_name):
-          if verbose:
-            print(f'Found {file_name}')
-          setting_metric.append(np.load(file_name))
-          setting_descriptions.append(setting.identifier(**setting_description_format))
-        elif verbose:
-          print(f'** Unable to find {file_name}')
+    if tag:
+      path = doce.sink.tag_path(path, tag)
+    sink = doce.sink.get_sink(path, metric_delimiter)
+    sink.keep_open = True
+    for setting in settings:
+      identifier = setting.identifier(**setting_encoding)
+      data = sink.read_lazy(identifier, metric) if lazy else sink.read(identifier, metric)
+      if data is not None:
+        if verbose:
+          print(f'Found {sink.location(identifier, metric)}')
+        setting_metric.append(data)
+        setting_descriptions.append(setting.identifier(**setting_description_format))
+      elif verbose:
+        print(f'** Unable to find {sink.location(identifier, metric)}')
+    sink.close()
+    # the lazy outputs of .h5 files open the file at each access
+    sink.keep_open = False
 
   (setting_descriptions, _,
   constant_setting_description,
@@ -5,8 +5,196 @@ import inspect
 import types
 from itertools import compress
 import time
+import warnings
+import pickle
+from concurrent.futures import ProcessPoolExecutor, Future
 import numpy as np
 import doce.util as eu
+import doce.sink as esk
+import doce.cache
+
+# reductions computed chunk by chunk on large outputs, with the way partial results are combined
+CHUNKED_REDUCTIONS = {
+  np.mean: 'mean',
+  np.sum: 'sum',
+  np.min: 'min',
+  np.max: 'max',
+  np.std: 'std',
+  np.var: 'var'
+  }
+# number of elements read at a time by the chunked reductions
+CHUNK_SIZE = 2**20
+
+def chunked_reduce(func, data, chunk_size=CHUNK_SIZE):
+  """reduces data with func, reading at most about chunk_size elements at a time.
+
+  The chunks are taken along the first dimension of data, so that the peak memory
+  stays bounded when data is memory-mapped, see :meth:`doce.sink.Sink.read_lazy`.
+  Only the reductions of doce.metric.CHUNKED_REDUCTIONS are computed by chunks,
+  the standard deviation and the variance being combined from the moments of the chunks.
+  Other reductions are applied on the whole data. Further reductions can be declared
+  by adding them to doce.metric.CHUNKED_REDUCTIONS with the name of the corresponding combination.
+  data can also be the :class:`doce.sink.RunningStatistics` of an output, in which case
+  the reduction is taken from the statistics.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> data = np.arange(1000.).reshape(100, 10)
+  >>> doce.metric.chunked_reduce(np.std, data, chunk_size=64) == np.std(data)
+  True
+  >>> doce.metric.chunked_reduce(np.max, data, chunk_size=64)
+  999.0
+  """
+  reduction = CHUNKED_REDUCTIONS.get(func)
+  if isinstance(data, esk.RunningStatistics):
+    return data.reduce(reduction)
+  if reduction is None or data.size <= chunk_size or data.ndim == 0:
+    return func(np.asarray(data))
+  step = max(1, chunk_size*len(data)//data.size)
+  result = None
+  count = 0
+  mean = 0.
+  m2 = 0.
+  for start in range(0, len(data), step):
+    chunk = np.asarray(data[start:start+step]).reshape(-1)
+    if reduction in ('mean', 'std', 'var'):
+      # the moments of the chunks are combined following Chan et al.
+      chunk_count = chunk.size
+      chunk_mean = np.mean(chunk, dtype=np.float64)
+      chunk_m2 = np.sum(np.square(chunk-chunk_mean, dtype=np.float64))
+      delta = chunk_mean-mean
+      total = count+chunk_count
+      mean += delta*chunk_count/total
+      m2 += chunk_m2+delta**2*count*chunk_count/total
+      count = total
+    else:
+      value = func(chunk)
+      if result is None:
+        result = value
+      elif reduction == 'sum':
+        result = result+value
+      elif reduction == 'min':
+        result = np.minimum(result, value)
+      else:
+        result = np.maximum(result, value)
+  if reduction == 'mean':
+    return np.float64(mean)
+  if reduction == 'var':
+    return np.float64(m2/count)
+  if reduction == 'std':
+    return np.sqrt(m2/count)
+  return result
+
+# reductions applied to a stack of outputs along its second axis, giving the same value as on each output
+VECTORIZED_REDUCTIONS = [
+  np.mean,
+  np.sum,
+  np.min,
+  np.max,
+  np.std,
+  np.var,
+  np.median,
+  np.argmin,
+  np.argmax,
+  np.ptp,
+  np.nanmean,
+  np.nansum,
+  np.nanmin,
+  np.nanmax,
+  np.nanstd,
+  np.nanvar,
+  np.nanmedian
+  ]
+# maximal number of settings whose outputs are reduced together
+BLOCK_LENGTH = 4096
+
+def _reduce_block(block, reductions, pool):
+  """computes the values of the metrics of a block of settings.
+
+  Each item of the block gives the row of the values of the metrics of a setting,
+  the outputs of the setting, and the indexes of the metrics to compute.
+  If the outputs of the settings are in memory with the same shape and type, and the reduction
+  is in doce.metric.VECTORIZED_REDUCTIONS, the outputs are stacked and reduced in one call,
+  even if the reduction may be computed by chunks. Otherwise, the reduction is applied
+  to the output of each setting, by chunks for the memory-mapped or lazily read outputs.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> from unittest import mock
+  >>> block = [([None], [np.arange(4.)*index], [0]) for index in range(50)]
+  >>> reductions = [({'func': np.mean}, None, True, 0, None, None)]
+  >>> with mock.patch('doce.metric.chunked_reduce') as chunked:
+  ...   doce.metric._reduce_block(block, reductions, None)
+  >>> chunked.call_count
+  0
+  >>> [row[0] for (row, _, _) in block[:3]]
+  [0.0, 1.5, 3.0]
+  """
+  for metric_index, (reduction_type, _, chunked, group, _, _) in enumerate(reductions):
+    func = reduction_type['func']
+    items = [(row, outputs[group]) for (row, outputs, computed) in block if metric_index in computed]
+    if not items:
+      continue
+    # the memory-mapped and lazily read outputs are not plain arrays
+    if (len(items) > 1 and func in VECTORIZED_REDUCTIONS
+        and all(type(data) is np.ndarray and data.size <= CHUNK_SIZE for (_, data) in items)
+        and len(set((data.shape, data.dtype) for (_, data) in items)) == 1):
+      values = func(np.stack([data for (_, data) in items]).reshape(len(items), -1), axis=1)
+      for ((row, _), value) in zip(items, values):
+        row[metric_index] = value
+      continue
+    for (row, data) in items:
+      if chunked:
+        row[metric_index] = chunked_reduce(func, data)
+      elif pool is not None and _picklable(func):
+        row[metric_index] = pool.submit(func, data)
+      else:
+        row[metric_index] = func(data)
+
+# maximal size in bytes of the raw data kept in memory for the significance analysis
+RAW_DATA_MEMORY = 2**28
+
+class _RawData():
+  """reads the raw data of the rows of the table for the significance analysis.
+
+  raw_data[row_index][metric_stat_index] is the flattened output of the tested metric,
+  read from reads[metric_stat_index], a (sink, output) pair, or NaN if not available.
+  """
+  def __init__(self, identifiers, reads):
+    self.identifiers = identifiers
+    self.reads = reads
+
+  def __len__(self):
+    return len(self.identifiers)
+
+  def __getitem__(self, row_index):
+    return _RawDataRow(self, self.identifiers[row_index])
+
+class _RawDataRow():
+  def __init__(self, raw_data, identifier):
+    self.raw_data = raw_data
+    self.identifier = identifier
+
+  def __getitem__(self, metric_stat_index):
+    (sink, output) = self.raw_data.reads[metric_stat_index]
+    data = sink.read(self.identifier, output)
+    if data is None or not np.size(data):
+      return np.nan
+    return np.asarray(data).flatten()
+
+def _picklable(func):
+  # the reductions computed by worker processes are sent to the processes
+  try:
+    pickle.dumps(func)
+    return True
+  except (pickle.PicklingError, AttributeError, TypeError):
+    return False
 
 class Metric():
   """Stores information about the way evaluation metrics are stored and manipulated.
@@ -64,19 +252,49 @@ class Metric():
       self._metrics.append(name)
     return object.__setattr__(self, name, value)
 
-  def reduce_from_npy(
+  def reduce_from_sink(
     self,
     settings,
     path,
     setting_encoding=None,
     metric_delimiter = '_',
     verbose = False,
+    jobs = 1,
+    processes = 0,
+    cache = False,
+    correction = None,
+    pivot_factor = None,
+    aggregate = None
     ):
-    """Handle reduction of the metrics when considering numpy storage.
+    """Handle reduction of the metrics stored in data sinks.
 
-    The method handles the reduction of the metrics when considering numpy storage.
-    For each metric, a .npy file is assumed to be available which the following
-    naming convention: <id_of_setting>_<metric_name>.npy.
+    For each metric, the output is read from the data sink of the path of the metric,
+    see :func:`doce.sink.get_sink`.
+
+    The metrics sharing an output are grouped, so that each output is read once per setting
+    and given to all the reductions of the metrics, which shall thus not modify it.
+    The outputs of the next settings are read by jobs threads while the current setting
+    is reduced, see :func:`doce.util.prefetch`. The reductions that are not computed by chunks,
+    see :func:`doce.metric.chunked_reduce`, are computed by processes worker processes if processes > 0,
+    which is useful for expensive custom reductions. The rows are assembled in the order of the settings.
+
+    The raw data of the metrics with significance analysis are kept in memory for the analysis
+    as long as their size is below doce.metric.RAW_DATA_MEMORY bytes. Beyond, they are read again
+    from the data sinks during the analysis, so that only the raw data of the best setting and of a block
+    of settings are in memory at a time, see :func:`doce.metric.significance`.
+
+    If cache is True, the reduced values are stored in a cache kept alongside the data sink,
+    see :class:`doce.cache.ReductionCache`, and only the outputs modified since their last reduction are read.
+    The metrics whose raw data are compared by the significance analysis are not cached, as their outputs are read anyway.
+
+    The p-values of the significance analysis are corrected for multiple comparisons
+    if correction is given, see :func:`doce.metric.significance`. If pivot_factor is given,
+    each setting is compared with the best of the settings differing only by the modality of pivot_factor.
+
+    If aggregate gives factors, the rows of the table are aggregated over the modalities of these factors,
+    see :func:`doce.metric.aggregate_table`, and the rows are followed by the standard deviations of the metrics.
+    The significance analysis then pairs the reduced values of the aggregated settings,
+    so that the raw data are not read for the metrics whose values are cached.
 
     The method :meth:`doce.metric.Metric.reduce` wraps this method and
     should be considered as the main user interface, please see its documentation for usage.
@@ -95,48 +313,175 @@ class Metric():
 
     if not setting_encoding:
       setting_encoding = {}
+    factors = settings.factors()
+    if isinstance(aggregate, str):
+      aggregate = [aggregate]
+    for factor in aggregate or []:
+      if factor not in factors or factor == pivot_factor:
+        print(f'Unable to aggregate over the factor {factor}, available ones are: '
+              +', '.join(factor for factor in factors if factor != pivot_factor))
+        raise ValueError
+    # the significance analysis compares the raw data of the settings, unless they are aggregated
+    raw_significance = not aggregate
 
     (reduced_metrics, metric_direction, do_testing) = self.significance_status()
-    
-    for setting in settings:
+    sinks = {}
+    caches = {}
+    reductions = []
+    # the metrics sharing an output are grouped, so that the output is read once per setting
+    groups = {}
+    for metric in self.name():
+      reduction_type=self.__getattribute__(metric)
+      output_path = getattr(path, reduction_type['path'])
+      if output_path not in sinks:
+        # the sinks are opened before the reading threads are started
+        sinks[output_path] = esk.get_sink(output_path, metric_delimiter)
+        sinks[output_path].keep_open = True
+        sinks[output_path].preload([getattr(self, name)['output'] for name in self.name()
+                                    if getattr(self, name)['path'] == reduction_type['path']])
+        caches[output_path] = doce.cache.ReductionCache(output_path) if cache else None
+      # large outputs are memory-mapped and reduced by chunks when possible
+      chunked = not (raw_significance and reduction_type['significance']) and reduction_type['func'] in CHUNKED_REDUCTIONS
+      key = (output_path, reduction_type['output'])
+      # the output is memory-mapped only if all the metrics sharing it are reduced by chunks,
+      # and its running statistics are used only if they give all these reductions
+      streamed = chunked and CHUNKED_REDUCTIONS[reduction_type['func']] in esk.RunningStatistics.REDUCTIONS
+      (lazy, streamable) = groups.get(key, (True, True))
+      groups[key] = (lazy and chunked, streamable and streamed)
+      # the outputs of the metrics with significance analysis are read for the analysis
+      metric_cache = None if raw_significance and reduction_type['significance'] else caches[output_path]
+      reductions.append((reduction_type, sinks[output_path], chunked, list(groups).index(key),
+                         metric_cache, doce.cache.reduction_key(reduction_type['func']) if cache else None))
+    groups = [(sinks[output_path], caches[output_path], output, lazy, streamed)
+              for ((output_path, output), (lazy, streamed)) in groups.items()]
+
+    def load(setting):
+      identifier = setting.identifier(**setting_encoding)
+      outputs = []
+      cached = {}
+      versions = []
+      for (group, (sink, group_cache, output, lazy, streamed)) in enumerate(groups):
+        mod = sink.stamp(identifier, output)
+        data = None
+        read = mod is not None
+        version = None
+        if read and group_cache is not None:
+          # the output is not read if the values of all its metrics are cached
+          version = sink.version(identifier, output)
+          read = False
+          for metric_index, (_, _, _, metric_group, metric_cache, key) in enumerate(reductions):
+            if metric_group == group:
+              value = None if metric_cache is None else metric_cache.get(identifier, output, key, version)
+              if value is None:
+                read = True
+              else:
+                cached[metric_index] = value
+        if read:
+          if streamed:
+            # the running statistics of growing outputs are used instead of reading them
+            data = sink.statistics(identifier, output)
+          if data is None and lazy:
+            data = sink.read_lazy(identifier, output, min_size=CHUNK_SIZE)
+          elif data is None:
+            data = sink.read(identifier, output)
+        outputs.append((mod, data))
+        versions.append(version)
+      return (setting, outputs, cached, versions)
+
+    pool = None
+    if processes > 0:
+      pool = ProcessPoolExecutor(max_workers=processes)
+    rows = []
+    # the outputs of the settings are reduced by blocks, see doce.metric._reduce_block
+    block = []
+    block_size = 0
+    # the raw data for the significance are read again once their size exceeds RAW_DATA_MEMORY
+    raw_data_size = 0
+    raw_data_streamed = False
+    for (setting, outputs, cached, versions) in eu.prefetch(load, settings, jobs):
       row = []
       raw_data_row = []
-      nb_reduced_metrics = 0
-      for metric_index, metric in enumerate(self.name()):
-        output = getattr(self, metric)['output']
-        output_path = getattr(path, getattr(self, metric)['path'])
-        file_name = output_path+setting.identifier(**setting_encoding)+metric_delimiter+output+'.npy'
-        if os.path.exists(file_name):
-          mod = os.path.getmtime(file_name)
+      # the flattened outputs for the significance are shared by the metrics
+      flattened = {}
+      # the metrics reduced from the outputs, whose values are to be cached
+      computed = []
+      identifier = setting.identifier(**setting_encoding)
+      for metric_index, (reduction_type, sink, chunked, group, _, _) in enumerate(reductions):
+        output = reduction_type['output']
+        (mod, data) = outputs[group]
+        if metric_index in cached:
+          modification_time_stamp.append(mod)
+          if verbose:
+            print('Found '+sink.location(identifier, output)+' in the cache, last modified '+time.ctime(mod))
+          metric_has_data[metric_index] = True
+          reduced_metrics[metric_index] = True
+          row.append(cached[metric_index])
+        elif data is not None and data.size > 0:
           modification_time_stamp.append(mod)
           if verbose:
-            print('Found '+file_name+', last modified '+time.ctime(mod))
+            print('Found '+sink.location(identifier, output)+', last modified '+time.ctime(mod))
           metric_has_data[metric_index] = True
-          data = np.load(file_name)
-          reduction_type=self.__getattribute__(metric)
-          reduced_metrics[nb_reduced_metrics] = True
-          nb_reduced_metrics+=1
-          value = reduction_type['func'](data)
-          if reduction_type['percent']:
-            value *= 100
-          row.append(value)
-          if reduction_type['significance']:
-            raw_data_row.append(data.flatten())
+          reduced_metrics[metric_index] = True
+          # the value is computed with the other settings of the block
+          computed.append(metric_index)
+          row.append(None)
+          if raw_significance and reduction_type['significance'] and not raw_data_streamed:
+            if group not in flattened:
+              flattened[group] = data.flatten()
+              raw_data_size += flattened[group].nbytes
+            raw_data_row.append(flattened[group])
         else:
           if verbose:
-            print('** Unable to find '+file_name)
-          reduction_type=self.__getattribute__(metric)
+            print('** Unable to find '+sink.location(identifier, output))
           row.append(np.nan)
-          if reduction_type['significance']:
+          if raw_significance and reduction_type['significance']:
             raw_data_row.append(np.nan)
-          nb_reduced_metrics+=1
-
+      if raw_data_size > RAW_DATA_MEMORY and not raw_data_streamed:
+        raw_data_streamed = True
+        for (_, _, previous_raw_data_row, _, _) in rows:
+          previous_raw_data_row.clear()
+        raw_data_row.clear()
+      rows.append((setting, row, raw_data_row, versions, computed))
+      block.append((row, [data for (_, data) in outputs], computed))
+      block_size += sum(getattr(data, "size", 0) for (_, data) in outputs)
+      if block_size >= CHUNK_SIZE or len(block) >= BLOCK_LENGTH:
+        _reduce_block(block, reductions, pool)
+        block = []
+        block_size = 0
+    _reduce_block(block, reductions, pool)
+
+    identifiers = []
+    for (setting, row, raw_data_row, versions, computed) in rows:
+      identifier = setting.identifier(**setting_encoding)
+      for metric_index, (reduction_type, _, _, group, reduction_cache, key) in enumerate(reductions):
+        if isinstance(row[metric_index], Future):
+          row[metric_index] = row[metric_index].result()
+        if reduction_cache is not None and metric_index in computed:
+          reduction_cache.set(identifier, reduction_type['output'], key, versions[group], row[metric_index])
+        if reduction_type['percent']:
+          row[metric_index] *= 100
       if row and not all(np.isnan(c) for c in row):
-        for factor_name in reversed(settings.factors()):
-          row.insert(0, setting.__getattribute__(factor_name))
-        table.append(row)
-        
+        table.append([setting.__getattribute__(factor_name) for factor_name in factors]+row)
+
         raw_data.append(raw_data_row)
+        identifiers.append(identifier)
+    if pool is not None:
+      pool.shutdown()
+    for reduction_cache in caches.values():
+      if reduction_cache is not None:
+        reduction_cache.close()
+    if raw_data_streamed:
+      # second pass, the raw data are read for each setting when compared with the best one
+      raw_data = _RawData(identifiers, [(sink, reduction_type['output'])
+                          for (reduction_type, sink, _, _, _, _) in reductions if reduction_type['significance']])
+
+    std = None
+    if aggregate:
+      (table, std, samples) = aggregate_table(table, factors, aggregate)
+      factors = [factor for factor in factors if factor not in aggregate]
+      # the samples of the tested metrics are the reduced values of the aggregated settings
+      tested = [metric_index for (metric_index, reduction) in enumerate(reductions) if reduction[0]['significance']]
+      raw_data = [[samples[row_index, :, metric_index] for metric_index in tested] for row_index in range(len(table))]
 
     p_values = significance(
       settings,
@@ -144,11 +489,40 @@ class Metric():
       raw_data,
       reduced_metrics,
       metric_direction,
-      do_testing
+      do_testing,
+      [getattr(self, metric)['significance'] if isinstance(getattr(self, metric)['significance'], str)
+       else 't-test' for metric in self.name() if getattr(self, metric)['significance']],
+      correction,
+      groups=None if pivot_factor is None else [
+        tuple(row[:factors.index(pivot_factor)]+row[factors.index(pivot_factor)+1:len(factors)]) for row in table],
+      nb_factors=len(factors)
       )
+    if std is not None:
+      for (row, std_row) in zip(table, std):
+        row.extend(std_row.tolist())
+
+    for sink in sinks.values():
+      sink.close()
 
     return (table, metric_has_data, reduced_metrics, modification_time_stamp, p_values)
 
+  def reduce_from_npy(
+    self,
+    settings,
+    path,
+    setting_encoding=None,
+    metric_delimiter = '_',
+    verbose = False,
+    ):
+    """Handle reduction of the metrics when considering numpy storage.
+
+    For each metric, a .npy file is assumed to be available which the following
+    naming convention: <id_of_setting>_<metric_name>.npy.
+
+    This method is kept for compatibility, see :meth:`doce.metric.Metric.reduce_from_sink`.
+    """
+    return self.reduce_from_sink(settings, path, setting_encoding, metric_delimiter, verbose)
+
   def significance_status(self):
     nb_reduced_metrics = 0
     metric_direction = []
@@ -176,84 +550,15 @@ class Metric():
     setting_encoding=None,
     verbose = False,
     ):
-    """Handle reduction of the metrics when considering numpy storage.
-
-    The method handles the reduction of the metrics when considering h5 storage.
-
-    The method :meth:`doce.metric.Metric.reduce` wraps this method and
-    should be considered as the main user interface,
-    please see its documentation for usage.
-
-    See Also
-    --------
-
-    doce.metric.Metric.reduce
+    """Handle reduction of the metrics when considering h5 storage.
 
+    This method is kept for compatibility, see :meth:`doce.metric.Metric.reduce_from_sink`.
     """
-    import tables as tb
-    import warnings
-    from tables import NaturalNameWarning
-    warnings.filterwarnings('ignore', category=NaturalNameWarning)
-
-    table = []
-    raw_data = []
-    h5_fid = tb.open_file(path.output, mode='r')
-    metric_has_data = [False] * len(self.name())
-
-    if not setting_encoding:
-      setting_encoding = {}
-
-    (reduced_metrics, metric_direction, do_testing) = self.significance_status()
-
-    for setting in settings:
-      row = []
-      raw_data_row = []
-      nb_reduced_metrics = 0
-      
-      if not h5_fid.root.__contains__(setting.identifier(**setting_encoding)):
-        if verbose:
-          print('** Not found Group '+setting.identifier(**setting_encoding))
-      else:
-        if verbose:
-          print('Found Group '+setting.identifier(**setting_encoding))
-        setting_group = h5_fid.root._f_get_child(setting.identifier(**setting_encoding))
-        for metric_index, metric in enumerate(self.name()):
-          reduction_type=self.__getattribute__(metric)
-          no_data = True
-          if setting_group.__contains__(reduction_type['output']):
-            data = setting_group._f_get_child(reduction_type['output'])
-            if data.shape[0] > 0:
-              metric_has_data[metric_index] = True
-              reduced_metrics[nb_reduced_metrics] = True
-              nb_reduced_metrics+=1
-              no_data = False
-            if reduction_type['significance']:
-              raw_data_row.append(np.array(data))
-          if no_data:
-            row.append(np.nan)
-            if reduction_type['significance']:
-              raw_data_row.append(np.nan)
-            nb_reduced_metrics+=1
-          else:
-            value = reduction_type['func'](np.array(data))
-            if reduction_type['percent']:
-              value *= 100
-            row.append(value)
-        if row and not all(np.isnan(c) for c in row):
-          for factor_name in reversed(settings.factors()):
-            row.insert(0, setting.__getattribute__(factor_name))
-        table.append(row)
-        raw_data.append(raw_data_row)
- 
-    h5_fid.close()
-    p_values = significance(
-      settings,
-      table,
-      raw_data,
-      reduced_metrics,
-      metric_direction,
-      do_testing
-      )
+    (table,
+    metric_has_data,
+    reduced_metrics,
+    _,
+    p_values) = self.reduce_from_sink(settings, path, setting_encoding, verbose=verbose)
     return (table, metric_has_data, reduced_metrics, p_values)
 
   def reduce(
@@ -267,7 +572,14 @@ class Metric():
     metric_display_length = 2,
     reduced_metric_display = 'capitalize',
     metric_delimiter = '_',
-    verbose = False
+    verbose = False,
+    jobs = 1,
+    processes = 0,
+    cache = False,
+    correction = None,
+    pivot_factor = None,
+    aggregate = None,
+    data_frame = False
     ):
     """Apply the reduction directives described in each members of doce.metric.
     Metric objects for the settings given as parameters.
@@ -317,6 +629,37 @@ class Metric():
       In the case of .h5 metric storage, if verbose is set to True,
       print the group seeked for each metric.
 
+    jobs : int
+      Number of threads reading the outputs ahead of the reduction (default 1).
+      Reading ahead is useful when the outputs are stored on network storage.
+
+    processes : int
+      Number of worker processes computing the reductions that are not computed by chunks,
+      useful for expensive custom reductions (default 0, the reductions are computed by the calling process).
+
+    cache : bool
+      If True, the reduced values are cached alongside the data sinks, so that only the outputs
+      modified since their last reduction are read and reduced, see :class:`doce.cache.ReductionCache` (default False).
+
+    correction : str
+      Correction of the p-values of the significance analysis for multiple comparisons,
+      'holm' or 'bh', see :func:`doce.metric.correct_p_values` (default None, no correction).
+
+    pivot_factor : str
+      If given, the significance analysis compares each setting with the best of the settings
+      differing only by the modality of pivot_factor, as for the rows of a pivot table (default None).
+
+    aggregate : str or list of str
+      If given, the settings are aggregated over the modalities of these factors, for example the seeds or the folds:
+      each metric gives the mean of its values over the aggregated settings, and is followed
+      by a column with their standard deviation, named after the metric with the ' std' suffix.
+      The significance analysis pairs the values of the aggregated settings,
+      see :func:`doce.metric.aggregate_table` (default None).
+
+    data_frame : bool
+      If True, the setting_description is returned as a pandas DataFrame with categorical factor columns
+      and float metric columns, see :func:`doce.util.setting_description_frame` (default False).
+
     Returns
     -------
 
@@ -453,30 +796,32 @@ class Metric():
       if path.output.endswith('.h5'):
         # setting_encoding = {'factor_separator':'_', 'modality_separator':'_'}
         setting_encoding = {}
-        modification_time_stamp = []
-        (setting_description,
-        metric_has_data,
-        reduced_metrics,
-        p_values) = self.reduce_from_h5(
-          settings,
-          path,
-          setting_encoding,
-          verbose)
-      else:
-        (setting_description,
-        metric_has_data,
-        reduced_metrics,
-        modification_time_stamp,
-        p_values) = self.reduce_from_npy(
-          settings,
-          path,
-          setting_encoding,
-          metric_delimiter,
-          verbose)
-
-      nb_factors = len(settings.factors())
+      (setting_description,
+      metric_has_data,
+      reduced_metrics,
+      modification_time_stamp,
+      p_values) = self.reduce_from_sink(
+        settings,
+        path,
+        setting_encoding,
+        metric_delimiter,
+        verbose,
+        jobs,
+        processes,
+        cache,
+        correction,
+        pivot_factor,
+        aggregate)
+
+      if isinstance(aggregate, str):
+        aggregate = [aggregate]
+      factors = [factor for factor in settings.factors() if factor not in (aggregate or [])]
+      nb_factors = len(factors)
+      nb_metrics = len(reduced_metrics)
       for row_index, row in enumerate(setting_description):
-        setting_description[row_index] = row[:nb_factors]+list(compress(row[nb_factors:], reduced_metrics))
+        setting_description[row_index] = row[:nb_factors]+list(compress(row[nb_factors:nb_factors+nb_metrics], reduced_metrics))
+        if aggregate:
+          setting_description[row_index] += compress(row[nb_factors+nb_metrics:], reduced_metrics)
 
       column_header = self.get_column_header(
         settings,
@@ -486,16 +831,34 @@ class Metric():
         metric_display_length,
         metric_has_data,
         reduced_metric_display)
-      nb_column_factor = len(settings.factors())
-
-      (setting_description,
-      column_header,
-      constant_setting_description,
-      nb_column_factor) = eu.prune_setting_description(
-        setting_description,
+      column_header = [header for (factor, header) in zip(settings.factors(), column_header) if factor in factors] \
+        + column_header[len(settings.factors()):]
+      if aggregate:
+        std_header = [f'{header} std' for header in column_header[nb_factors:]]
+        column_header += std_header
+        # the standard deviations are not compared
+        p_values = np.hstack((p_values, np.zeros((len(p_values), len(std_header)))))
+      nb_column_factor = nb_factors
+
+      if data_frame:
+        (setting_description,
+        constant_setting_description,
+        nb_column_factor) = eu.setting_description_frame(
+          setting_description,
+          column_header,
+          nb_column_factor,
+          factor_display,
+          [getattr(settings, factor) for factor in factors])
+        column_header = list(setting_description.columns)
+      else:
+        (setting_description,
         column_header,
-        nb_column_factor,
-        factor_display)
+        constant_setting_description,
+        nb_column_factor) = eu.prune_setting_description(
+          setting_description,
+          column_header,
+          nb_column_factor,
+          factor_display)
 
       return (setting_description,
         column_header,
@@ -647,37 +1010,225 @@ class Metric():
         metric_descriptor += '\r\n'
     return metric_descriptor.rstrip()
 
+def aggregate_table(table, factors, aggregate):
+  """aggregates the rows of a table over the modalities of some factors.
+
+  The rows of table start with the modalities of factors, followed by values.
+  They are grouped by the modalities of the factors that are not in aggregate, in order of appearance.
+  The samples of a group are the values of its rows, one per combination of the modalities
+  of the factors in aggregate, aligned among the groups so that they can be paired, NaN if missing.
+
+  Returns
+  -------
+
+  table : list of lists of literals
+    one row per group, with the modalities of the factors that are not in aggregate,
+    followed by the mean of the values over the samples of the group.
+
+  std : numpy.ndarray
+    standard deviation of the values over the samples of each group, one row per group.
+
+  samples : numpy.ndarray
+    samples of the values of each group, of shape (groups, samples, values).
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> table = [[1, 0, 0.5, 2], [1, 1, 0.7, 4], [2, 0, 0.2, 1], [2, 1, 0.4, 1]]
+  >>> (aggregated_table, std, samples) = doce.metric.aggregate_table(table, ['f1', 'seed'], ['seed'])
+  >>> print(aggregated_table)
+  [[1, 0.6, 3.0], [2, 0.30000000000000004, 1.0]]
+  >>> print(std)
+  [[0.1 1. ]
+   [0.1 0. ]]
+  >>> samples.shape
+  (2, 2, 2)
+  """
+  nb_factors = len(factors)
+  kept = [index for index, factor in enumerate(factors) if factor not in aggregate]
+  aggregated = [index for index, factor in enumerate(factors) if factor in aggregate]
+  group_indexes = {}
+  sample_indexes = {}
+  rows = []
+  for row in table:
+    group = tuple(row[index] for index in kept)
+    rows.append((group_indexes.setdefault(group, len(group_indexes)),
+                 sample_indexes.setdefault(tuple(row[index] for index in aggregated), len(sample_indexes))))
+  if not table:
+    return ([], np.zeros((0, 0)), np.zeros((0, 0, 0)))
+  values = np.array([row[nb_factors:] for row in table], dtype=float)
+  samples = np.full((len(group_indexes), len(sample_indexes), values.shape[1]), np.nan)
+  (group_index, sample_index) = np.array(rows).T
+  samples[group_index, sample_index] = values
+  with np.errstate(invalid='ignore'), warnings.catch_warnings():
+    # the values missing for all the samples of a group are NaN
+    warnings.simplefilter('ignore', category=RuntimeWarning)
+    mean = np.nanmean(samples, axis=1)
+    std = np.nanstd(samples, axis=1)
+  table = [list(group)+mean_row.tolist() for (group, mean_row) in zip(group_indexes, mean)]
+  return (table, std, samples)
+
+# statistical tests available for the significance analysis, see doce.metric.paired_test
+SIGNIFICANCE_TESTS = ('t-test', 'wilcoxon')
+# corrections of the p-values for multiple comparisons, see doce.metric.correct_p_values
+P_VALUE_CORRECTIONS = ('holm', 'bh')
+
+def paired_test(data, reference, test='t-test', nan_policy='omit'):
+  """returns the p-values of the paired tests between each row of data and reference.
+
+  The tests are computed for all the rows at once. test is 't-test' for the paired t-test,
+  see scipy.stats.ttest_rel, or 'wilcoxon' for the Wilcoxon signed-rank test,
+  see scipy.stats.wilcoxon. With nan_policy set to 'omit' (default), the pairs
+  with a NaN value are discarded, with 'propagate', the p-value of the rows with a NaN value is NaN.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> from scipy import stats
+  >>> rng = np.random.default_rng(0)
+  >>> data = rng.standard_normal((3, 20))
+  >>> reference = rng.standard_normal(20)+1
+  >>> p_values = doce.metric.paired_test(data, reference)
+  >>> bool(np.allclose(p_values, [stats.ttest_rel(row, reference).pvalue for row in data]))
+  True
+  >>> data[0, 0] = np.nan
+  >>> p_values = doce.metric.paired_test(data, reference, test='wilcoxon')
+  >>> bool(np.isclose(p_values[0], stats.wilcoxon(data[0, 1:], reference[1:]).pvalue))
+  True
+  """
+  from scipy import stats
+  data = np.asarray(data, dtype=float)
+  reference = np.broadcast_to(np.asarray(reference, dtype=float), data.shape)
+  if data.ndim == 1:
+    (data, reference) = (data[np.newaxis], reference[np.newaxis])
+  # the outputs are compared as vectors of values
+  data = data.reshape(len(data), -1)
+  reference = reference.reshape(len(reference), -1)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    if test == 't-test':
+      return np.atleast_1d(stats.ttest_rel(data, reference, axis=1, nan_policy=nan_policy).pvalue)
+    if test == 'wilcoxon':
+      return np.atleast_1d(stats.wilcoxon(data, reference, axis=1, nan_policy=nan_policy).pvalue)
+  print(f'Unknown statistical test {test}, available ones are: '+', '.join(SIGNIFICANCE_TESTS))
+  raise ValueError
+
+def correct_p_values(p_values, correction):
+  """returns the p-values corrected for multiple comparisons.
+
+  correction is 'holm' for the Holm-Bonferroni method, controlling the family-wise error rate,
+  or 'bh' for the Benjamini-Hochberg method, controlling the false discovery rate.
+  NaN p-values are kept and not counted as comparisons.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> doce.metric.correct_p_values(np.array([0.01, 0.04, 0.03, np.nan]), 'holm')
+  array([0.03, 0.06, 0.06,  nan])
+  >>> doce.metric.correct_p_values(np.array([0.01, 0.04, 0.03, np.nan]), 'bh')
+  array([0.03, 0.04, 0.04,  nan])
+  """
+  p_values = np.array(p_values, dtype=float)
+  valid = np.flatnonzero(~np.isnan(p_values))
+  order = valid[np.argsort(p_values[valid], kind='stable')]
+  count = len(order)
+  if correction == 'holm':
+    corrected = np.maximum.accumulate((count-np.arange(count))*p_values[order])
+  elif correction == 'bh':
+    corrected = np.minimum.accumulate((count/np.arange(count, 0, -1))*p_values[order[::-1]])[::-1]
+  else:
+    print(f'Unknown correction {correction}, available ones are: '+', '.join(P_VALUE_CORRECTIONS))
+    raise ValueError
+  p_values[order] = np.minimum(corrected, 1)
+  return p_values
+
 def significance(
   settings,
   table,
   raw_data,
   reduced_metrics,
   metric_direction,
-  do_testing):
-
-  from scipy import stats
-
+  do_testing,
+  tests=None,
+  correction=None,
+  nan_policy='omit',
+  groups=None,
+  nb_factors=None):
+  """returns the p-values of the comparisons of each setting with the best setting, for each metric.
+
+  The best setting has a p-value of -1. For the metrics with significance analysis,
+  the raw data of the settings are compared with the ones of the best setting by blocks of settings,
+  with the test of tests (one per tested metric, the paired t-test by default),
+  see :func:`doce.metric.paired_test`. raw_data is indexed by the row of the table and the tested metric,
+  and may read the raw data when accessed, so that only a block of settings is in memory at a time. The p-values are corrected for multiple comparisons
+  if correction is given, see :func:`doce.metric.correct_p_values`.
+
+  If groups gives a label for each row of the table, the best setting is searched
+  among the rows of the same label, to which each row is compared.
+  The rows of the table start with nb_factors factor columns, by default the factors of settings.
+  """
+  if nb_factors is None:
+    nb_factors = len(settings.factors())
   p_values = np.zeros((len(table),len(reduced_metrics)))
+  # the rows of the table compared together
+  group_rows = {}
+  for row_index, group in enumerate(groups if groups is not None else [None]*len(table)):
+    group_rows.setdefault(group, []).append(row_index)
+  group_rows = [np.array(rows) for rows in group_rows.values()]
   metric_stat_index = 0
   for direction_index, direction in enumerate(metric_direction):
-    mean_values = []
-    for table_row in table:
-      mean_values.append(table_row[len(settings.factors())+direction_index])
+    mean_values = np.array([table_row[nb_factors+direction_index] for table_row in table], dtype=float)
     if not np.isnan(mean_values).all() and direction!=0:
-      if metric_direction[direction_index]<0:
-        best_index = np.argwhere(mean_values==np.nanmax(mean_values)).flatten()
-      else:
-        best_index = np.argwhere(mean_values==np.nanmin(mean_values)).flatten()
-      p_values[best_index, direction_index] = -1
+      best_rows = []
+      for rows in group_rows:
+        if np.isnan(mean_values[rows]).all():
+          best_rows.append(None)
+          continue
+        if metric_direction[direction_index]<0:
+          best_index = rows[mean_values[rows]==np.nanmax(mean_values[rows])]
+        else:
+          best_index = rows[mean_values[rows]==np.nanmin(mean_values[rows])]
+        p_values[best_index, direction_index] = -1
+        best_rows.append(best_index[0])
       if do_testing[direction_index] != 0:
-        for raw_data_row_index, raw_data_row in enumerate(raw_data):
-          if p_values[raw_data_row_index, direction_index] != -1: # raw_data_row_index!=best_index[0] and and mean_values[metric_stat_index] != mean_values[raw_data_row_index])
-            if not np.isnan(raw_data[raw_data_row_index][metric_stat_index]).all():
-              (_, p_value) = stats.ttest_rel(
-                raw_data_row[metric_stat_index],
-                raw_data[best_index[0]][metric_stat_index]
-                )
-              p_values[raw_data_row_index, direction_index] = p_value
+        test = tests[metric_stat_index] if tests else 't-test'
+        tested_rows = []
+        tested_p_values = []
+        block = []
+        for (rows, best_row) in zip(group_rows, best_rows):
+          if best_row is None:
+            continue
+          reference = np.asarray(raw_data[best_row][metric_stat_index])
+          tested_rows.append([])
+          for row_index in rows:
+            if p_values[row_index, direction_index] == -1:
+              continue
+            data = raw_data[row_index][metric_stat_index]
+            if np.isnan(data).all():
+              continue
+            if np.shape(data) != reference.shape:
+              print(f'Unable to compare the outputs of shapes {np.shape(data)}'
+                    f' and {reference.shape} for the significance analysis.')
+              raise ValueError
+            tested_rows[-1].append(row_index)
+            block.append((data, reference))
+            # the settings are tested by blocks of about CHUNK_SIZE values
+            if len(block)*reference.size >= CHUNK_SIZE:
+              tested_p_values.extend(paired_test(*zip(*block), test, nan_policy))
+              block = []
+        if block:
+          tested_p_values.extend(paired_test(*zip(*block), test, nan_policy))
+        start = 0
+        for rows in tested_rows:
+          group_p_values = np.array(tested_p_values[start:start+len(rows)])
+          start += len(rows)
+          if rows and correction:
+            group_p_values = correct_p_values(group_p_values, correction)
+          p_values[rows, direction_index] = group_p_values
         metric_stat_index += 1
   # p_values = np.delete(p_values, np.invert(reduced_metrics), axis=1)
 
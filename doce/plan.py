@@ -1,18 +1,17 @@
 """Handle storage and processing of the plan of the doce module."""
 
 import os
-import shutil as sh
 import inspect
 import types
 import copy
-import glob
 import logging
+import traceback
 import time
 from itertools import groupby
-import subprocess
 import numpy as np
 import doce.util as eu
 import doce.setting as es
+import doce.sink
 
 if eu.in_notebook():
   from tqdm.notebook import tqdm as tqdm
@@ -144,7 +143,11 @@ class Plan():
     nb_jobs=1,
     progress='d',
     log_file_name='',
-    mail_interval=0
+    mail_interval=0,
+    profiler=None,
+    fast=False,
+    batch_factors=None,
+    timeout=None
     ):
     r"""iterate over the setting set and run the function given as parameter.
 
@@ -186,6 +189,21 @@ class Plan():
       If not empty, the execution is not stopped on a faulty setting,
       and the error is logged in the log_file_name file.
 
+    profiler : doce.profiling.Profiler (optional)
+      if not None, the processing of the settings is measured by the profiler.
+
+    fast : bool (optional)
+      if True and nb_jobs = 1, use a low overhead driver loop, see
+      :meth:`doce.Plan.perform_fast`.
+
+    batch_factors : list of str (optional)
+      if not empty, the function operates on batches of settings, see
+      :meth:`doce.Plan.perform_batch`.
+
+    timeout : float (optional)
+      if the function is a coroutine function, maximal duration in seconds
+      of the processing of a setting, see :meth:`doce.Plan.perform_async`.
+
     See Also
     --------
 
@@ -202,29 +220,61 @@ class Plan():
       
     if progress:
       print('Number of settings: '+str(len(self)))
+    if inspect.iscoroutinefunction(function):
+      return self.perform_async(
+        function,
+        experiment,
+        *parameters,
+        nb_jobs=nb_jobs,
+        progress=progress,
+        log_file_name=log_file_name,
+        timeout=timeout
+        )
+    if batch_factors and function:
+      if fast:
+        print('The fast driver loop is not used for batches of settings, whose overhead is already paid per batch.')
+      return self.perform_batch(
+        function,
+        experiment,
+        *parameters,
+        batch_factors=batch_factors,
+        nb_jobs=nb_jobs,
+        progress=progress,
+        log_file_name=log_file_name,
+        mail_interval=mail_interval,
+        profiler=profiler
+        )
+    if profiler is not None:
+      profiler.start(parallel = nb_jobs>1 or nb_jobs<0)
     if nb_jobs>1 or nb_jobs<0:
       from joblib import Parallel, delayed
       Parallel(n_jobs=nb_jobs, require='sharedmem')(delayed(setting.perform)(
         function,
         experiment,
         log_file_name,
-        *parameters
+        *parameters,
+        profiler=profiler
         ) for setting in self)
+    elif fast and function and profiler is None:
+      nb_failed = self.perform_fast(
+        function,
+        experiment,
+        *parameters,
+        progress=progress,
+        log_file_name=log_file_name,
+        mail_interval=mail_interval
+        )
     else:
       start_time = time.time()
       step_time = start_time
       with tqdm(total=len(self), disable = progress == '') as progress_bar:
         for setting_index, setting in enumerate(self):
-          description = ''
-          if nb_failed:
-            description = f'[failed: {str(nb_failed)}]'
-          if 'm' in progress:
-            description += str(self._settings[setting_index])+' '
-          if 'd' in progress:
-            description += setting.identifier()
-          progress_bar.set_description(description)
+          # the description is only formatted when the progress bar is about to be rendered
+          if progress and time.time()-progress_bar.last_print_t >= progress_bar.mininterval:
+            progress_bar.set_description(
+              self._progress_description(progress, setting, setting_index, nb_failed))
           if function:
-            nb_failed += setting.perform(function, experiment, log_file_name, *parameters)
+            nb_failed += setting.perform(function, experiment, log_file_name, *parameters, profiler=profiler)
           else:
             print(setting)
           delay = (time.time()-step_time)
@@ -235,8 +285,376 @@ class Plan():
             message = f'{percentage}% of settings done: {setting_index+1} over {len(self)} <br>Time elapsed: {duration}'
             experiment.send_mail(f'progress {percentage}% ', message)
           progress_bar.update(1)
+    if profiler is not None:
+      profiler.stop()
+      profiler.report()
+    return nb_failed
+
+  def perform_fast(
+    self,
+    function,
+    experiment,
+    *parameters,
+    progress='d',
+    log_file_name='',
+    mail_interval=0,
+    batch_size=4096
+    ):
+    r"""iterate over the setting set with a low overhead and run the function given as parameter.
+
+    This driver loop is meant for large setting sets of short settings.
+    It is used by :meth:`doce.Plan.perform` if fast is set to True.
+
+    The settings are processed by batches of batch_size settings.
+    The progress bar is updated once per batch, and rendered at most every 0.1 second,
+    the description of the current setting being formatted only when rendered.
+    Mail interval is checked once per batch.
+
+    To avoid per-setting allocations, the same :class:`~doce.setting.Setting` object
+    is updated in place and given to the function for every setting.
+    The function shall therefore not retain the setting object across calls,
+    :meth:`copy.copy` of the setting shall be stored instead.
+
+    Parameters
+    ----------
+
+    batch_size: int (optional)
+      number of settings processed between two updates of the progress bar (default 4096).
+
+    See :meth:`doce.Plan.perform` for the description of the other parameters.
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> e=doce.Experiment()
+    >>> e.add_plan('plan', factor1=[1, 3], factor2=[2, 5])
+    >>> def my_function(setting, experiment):
+    ...  print(f'{setting.factor1}+{setting.factor2}={setting.factor1+setting.factor2}')
+    >>> nb_failed = e.perform([], my_function, progress='', fast=True)
+    1+2=3
+    1+5=6
+    3+2=5
+    3+5=8
+    """
+    self.__set_settings__()
+    settings = self._settings
+    nb_settings = len(settings)
+    factors = self.factors()
+    modalities = [list(np.atleast_1d(getattr(self, factor))) for factor in factors]
+    resume = getattr(experiment, '_resume', False)
+    nb_failed = 0
+    setting = None
+
+    start_time = time.time()
+    step_time = start_time
+    with tqdm(total=nb_settings, disable = progress == '') as progress_bar:
+      for batch_start in range(0, nb_settings, batch_size):
+        batch_end = min(batch_start+batch_size, nb_settings)
+        for setting_index in range(batch_start, batch_end):
+          indexes = settings[setting_index]
+          self._setting = indexes
+          if setting is None:
+            setting = es.Setting(self)
+          else:
+            setting._setting = indexes
+            setting.__dict__.update(zip(factors, map(list.__getitem__, modalities, indexes)))
+          if resume and experiment.skip_setting(setting):
+            continue
+          try:
+            function(setting, experiment, *parameters)
+          except Exception as exception:
+            if log_file_name:
+              nb_failed += 1
+              logging.info('Failed setting: %s', setting.identifier())
+              logging.info(traceback.format_exc())
+            else:
+              print('Failed setting: '+setting.identifier())
+              raise exception
+          if progress and time.time()-progress_bar.last_print_t >= progress_bar.mininterval:
+            progress_bar.set_description(
+              self._progress_description(progress, setting, setting_index, nb_failed),
+              refresh=False)
+            progress_bar.update(setting_index+1-progress_bar.n)
+        if progress:
+          progress_bar.update(batch_end-progress_bar.n)
+        if mail_interval>0 and batch_end<nb_settings and (time.time()-step_time)/(60**2) > mail_interval:
+          step_time = time.time()
+          percentage = int(batch_end/nb_settings*100)
+          duration = time.strftime('%dd %Hh %Mm %Ss', time.gmtime(step_time-start_time))
+          message = f'{percentage}% of settings done: {batch_end} over {nb_settings} <br>Time elapsed: {duration}'
+          experiment.send_mail(f'progress {percentage}% ', message)
+    return nb_failed
+
+  def batches(self, batch_factors):
+    """returns the setting set grouped as batches.
+
+    The settings of a batch only differ by the modalities of the batch factors.
+
+    Parameters
+    ----------
+
+    batch_factors: list of str
+      the names of the batch factors.
+
+    Returns
+    -------
+
+    batches: list of :class:`doce.setting.SettingBatch`
+
+    Examples
+    --------
+
+    >>> import doce
+
+    >>> p = doce.Plan('plan')
+    >>> p.model=['a', 'b']
+    >>> p.threshold=[1, 2, 3]
+    >>> for batch in p.select([-1, [0, 2]]).batches(['threshold']):
+    ...   print(batch)
+    model=a+threshold=[1 3]
+    model=b+threshold=[1 3]
+    """
+    for factor in batch_factors:
+      if factor not in self.factors():
+        raise Exception(f'Error: {factor} is not a factor.')
+    self.__set_settings__()
+    shared_factors = [
+      factor_index for factor_index, factor in enumerate(self.factors())
+      if factor not in batch_factors]
+    groups = {}
+    for setting in self._settings:
+      groups.setdefault(tuple(setting[i] for i in shared_factors), []).append(setting)
+    return [es.SettingBatch(self, group, batch_factors) for group in groups.values()]
+
+  def perform_batch(
+    self,
+    function,
+    experiment,
+    *parameters,
+    batch_factors=None,
+    nb_jobs=1,
+    progress='d',
+    log_file_name='',
+    mail_interval=0,
+    profiler=None
+    ):
+    r"""iterate over batches of settings and run the function given as parameter for each batch.
+
+    The settings that only differ by the modalities of the batch factors
+    are gathered as a :class:`doce.setting.SettingBatch` object which is given to the function.
+    This is convenient for functions that naturally vectorize along some factors.
+    This method is used by :meth:`doce.Plan.perform` if batch_factors is set.
+
+    If the function raises an exception, all the settings of the batch are considered as failed.
+    The function may also report specific failed settings using :meth:`doce.setting.SettingBatch.fail`.
+
+    If the experiment is resumed, the settings whose outputs are already
+    available are removed from the batches.
+
+    The profiler measures each batch as a single setting.
+    Mail interval is checked once per batch.
+
+    Parameters
+    ----------
+
+    batch_factors: list of str
+      the names of the batch factors.
+
+    See :meth:`doce.Plan.perform` for the description of the other parameters.
+
+    Returns
+    -------
+
+    nb_failed: int
+      the number of failed settings.
+    """
+    batches = self.batches(batch_factors)
+    if getattr(experiment, '_resume', False):
+      pruned_batches = []
+      for batch in batches:
+        setting_arrays = [
+          setting_array for setting_array, setting in zip(batch._settings, batch)
+          if not experiment.skip_setting(setting)]
+        if setting_arrays:
+          pruned_batches.append(es.SettingBatch(self, setting_arrays, batch_factors))
+      batches = pruned_batches
+
+    nb_failed = 0
+    if progress:
+      print(f'Number of batches: {len(batches)}')
+    if profiler is not None:
+      profiler.start(parallel = nb_jobs>1 or nb_jobs<0)
+    if nb_jobs>1 or nb_jobs<0:
+      from joblib import Parallel, delayed
+      nb_failed = sum(Parallel(n_jobs=nb_jobs, require='sharedmem')(delayed(batch.perform)(
+        function,
+        experiment,
+        log_file_name,
+        *parameters,
+        profiler=profiler
+        ) for batch in batches))
+    else:
+      nb_settings = sum(len(batch) for batch in batches)
+      nb_done = 0
+      start_time = time.time()
+      step_time = start_time
+      with tqdm(total=nb_settings, disable = progress == '') as progress_bar:
+        for batch in batches:
+          if progress:
+            description = ''
+            if nb_failed:
+              description = f'[failed: {str(nb_failed)}]'
+            if 'd' in progress:
+              description += batch[0].identifier(hide=batch_factors)
+            progress_bar.set_description(description)
+          nb_failed += batch.perform(function, experiment, log_file_name, *parameters, profiler=profiler)
+          progress_bar.update(len(batch))
+          nb_done += len(batch)
+          if mail_interval>0 and nb_done<nb_settings and (time.time()-step_time)/(60**2) > mail_interval:
+            step_time = time.time()
+            percentage = int(nb_done/nb_settings*100)
+            duration = time.strftime('%dd %Hh %Mm %Ss', time.gmtime(step_time-start_time))
+            message = f'{percentage}% of settings done: {nb_done} over {nb_settings} <br>Time elapsed: {duration}'
+            experiment.send_mail(f'progress {percentage}% ', message)
+    if profiler is not None:
+      profiler.stop()
+      profiler.report()
     return nb_failed
 
+  def perform_async(
+    self,
+    function,
+    experiment,
+    *parameters,
+    nb_jobs=1,
+    progress='d',
+    log_file_name='',
+    timeout=None
+    ):
+    r"""iterate over the setting set and run the coroutine function given as parameter
+    on an asyncio event loop.
+
+    This is suited to functions that mostly wait, for example on subprocesses.
+    This method is used by :meth:`doce.Plan.perform` if the function
+    is a coroutine function, that is to say defined using async def.
+
+    Up to nb_jobs settings are processed concurrently by the event loop.
+    If the processing of a setting lasts more than timeout seconds, it is cancelled
+    and the setting is considered as failed.
+    On keyboard interrupt, the settings being processed are cancelled.
+
+    Parameters
+    ----------
+
+    nb_jobs : int (optional)
+      maximal number of settings processed concurrently (default 1).
+      If negative, all the settings are processed concurrently.
+
+    timeout : float (optional)
+      maximal duration in seconds of the processing of a setting (default None, no limit).
+
+    See :meth:`doce.Plan.perform` for the description of the other parameters.
+
+    Returns
+    -------
+
+    nb_failed: int
+      the number of failed settings.
+
+    Examples
+    --------
+
+    >>> import asyncio
+    >>> import doce
+    >>> e=doce.Experiment()
+    >>> e.add_plan('plan', factor1=[1, 3], factor2=[2, 5])
+    >>> async def my_function(setting, experiment):
+    ...   await asyncio.sleep(setting.factor2/100)
+    ...   print(f'{setting.factor1}+{setting.factor2}={setting.factor1+setting.factor2}')
+    >>> nb_failed = e.perform([], my_function, nb_jobs=4, progress='')
+    1+2=3
+    3+2=5
+    1+5=6
+    3+5=8
+    >>> nb_failed = e.perform([], my_function, nb_jobs=4, progress='', timeout=0.03, log_file_name='/tmp/doce_async.txt')
+    1+2=3
+    3+2=5
+    >>> nb_failed
+    2
+    """
+    import asyncio
+
+    nb_settings = len(self)
+    if nb_jobs < 1:
+      nb_jobs = nb_settings
+    nb_jobs = max(min(nb_jobs, nb_settings), 1)
+    resume = getattr(experiment, '_resume', False)
+    status = {'failed': 0}
+
+    async def worker(settings, progress_bar):
+      for setting in settings:
+        if progress and time.time()-progress_bar.last_print_t >= progress_bar.mininterval:
+          progress_bar.set_description(
+            self._progress_description(progress, setting, progress_bar.n, status['failed']))
+        if resume and experiment.skip_setting(setting):
+          progress_bar.update(1)
+          continue
+        try:
+          if timeout:
+            await asyncio.wait_for(function(setting, experiment, *parameters), timeout)
+          else:
+            await function(setting, experiment, *parameters)
+        except asyncio.CancelledError:
+          raise
+        except Exception as exception:
+          if log_file_name:
+            status['failed'] += 1
+            logging.info('Failed setting: %s', setting.identifier())
+            if isinstance(exception, asyncio.TimeoutError):
+              logging.info('Timeout after %s seconds', str(timeout))
+            else:
+              logging.info(traceback.format_exc())
+          else:
+            print('Failed setting: '+setting.identifier())
+            raise exception
+        progress_bar.update(1)
+
+    async def run():
+      # the workers share the iterator over the setting set
+      settings = (es.Setting(self, setting) for setting in self._settings)
+      with tqdm(total=nb_settings, disable = progress == '') as progress_bar:
+        workers = [asyncio.ensure_future(worker(settings, progress_bar)) for _ in range(nb_jobs)]
+        try:
+          await asyncio.gather(*workers)
+        finally:
+          for task in workers:
+            task.cancel()
+
+    try:
+      if hasattr(asyncio, 'run'):
+        asyncio.run(run())
+      else:
+        loop = asyncio.new_event_loop()
+        try:
+          loop.run_until_complete(run())
+        finally:
+          loop.close()
+    except KeyboardInterrupt:
+      print(f'Interrupted, the settings being processed have been cancelled ({status["failed"]} failed).')
+      raise
+    return status['failed']
+
+  def _progress_description(self, progress, setting, setting_index, nb_failed):
+    description = ''
+    if nb_failed:
+      description = f'[failed: {str(nb_failed)}]'
+    if 'm' in progress:
+      description += str(self._settings[setting_index])+' '
+    if 'd' in progress:
+      description += setting.identifier()
+    return description
+
   def check(self):
     for factor in self._factors:
       if '=' in factor or '+' in factor:
@@ -449,75 +867,14 @@ class Plan():
     the method :meth:`doce.experiment._experiment.clean_data_sink,
     please see its documentation for usage.
     """
-    import tables as tb
-    import warnings
-    from tables import NaturalNameWarning
-    warnings.filterwarnings('ignore', category=NaturalNameWarning)
-
-    if not setting_encoding:
-      # setting_encoding = {'factor_separator':'_', 'modality_separator':'_'}
-      setting_encoding = {}
-
-    changed = False
-
-    if archive_path:
-      sh.copyfile(path, archive_path)
-      self.clean_h5(
-        path=archive_path,
-        reverse = not reverse,
-        force=True,
-        keep=False,
-        setting_encoding=setting_encoding,
-        archive_path='',
-        verbose=verbose)
-      print(f'Archived data should be available at: {archive_path}')
-    if not keep:
-      h_5 = tb.open_file(path, mode='a')
-      groups = []
-      if reverse:
-        ids = [setting.identifier(**setting_encoding) for setting in self]
-        for group in h_5.iter_nodes('/'):
-          if group._v_name not in ids:
-            groups.append(group._v_name)
-      else:
-        for setting in self:
-          group_name = setting.identifier(**setting_encoding)
-          if h_5.root.__contains__(group_name):
-            groups.append(group_name)
-      if not force:
-        print(f'About to remove {len(groups)} settings.')
-      if not force and not groups:
-        print('No settings to remove.')
-        return
-      if not force and eu.query_yes_no('List them ?'):
-        [print(g) for g in groups]
-      if force or eu.query_yes_no('Proceed to removal ?'):
-        changed = True
-        [h_5.remove_node(h_5.root, g, recursive=True) for g in groups]
-      
-      h_5.close()
- 
-      # repack
-      if not changed:
-        outfilename = path+'Tmp'
-        command = f'ptrepack -o {path} {outfilename}'
-        if not force:
-          print('Original size is %.2f MB' % (float(os.stat(path).st_size)/1024**2))
-          print('Repacking ... (requires ptrepack utility)')
-
-        subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        if os.path.exists(outfilename):
-          if not force:
-            print('Repacked size is %.2f MB' % (float(os.stat(outfilename).st_size)/1024**2))
-          os.rename(outfilename, path)
-        else:
-          print('Call to ptrepack failed. Is ptrepack available ?')
-
+    doce.sink.H5Sink(path).clean(
+      self,
+      reverse=reverse,
+      force=force,
+      keep=keep,
+      setting_encoding=setting_encoding,
+      archive_path=archive_path,
+      verbose=verbose)
 
   def clean_data_sink(
     self,
@@ -528,10 +885,17 @@ class Plan():
     wildcard='*',
     setting_encoding=None,
     archive_path='',
-    verbose=0
+    verbose=0,
+    dry_run=False,
+    metric_delimiter='_',
+    output_names=None
     ):
     """clean a data sink by considering the settings set.
 
+    The data sink is selected according to the path, see :func:`doce.sink.get_sink`.
+    The names of the declared outputs are given by output_names, see :class:`doce.sink.Sink`.
+    Returns the statistics of the selected entries, see :meth:`doce.sink.Sink.clean`.
+
   	This method is more conveniently used by
     considering the method :meth:`doce.experiment._experiment.clean_data_sink,
     please see its documentation for usage.
@@ -541,54 +905,20 @@ class Plan():
     path = os.path.expanduser(path)
     if path.endswith('.h5'):
       setting_encoding={} #'factor_separator':'_', 'modality_separator':'_'}
-      self.clean_h5(path, reverse, force, keep, setting_encoding, archive_path, verbose)
-    else:
-      file_names = []
-      for setting in self:
-        if verbose:
-          print('search path: '+path+'/'+setting.identifier(**setting_encoding)+wildcard)
-        for output_file in glob.glob(path+'/'+setting.identifier(**setting_encoding)+wildcard):
-          file_names.append(output_file)
-      if reverse:
-        complete = []
-        for output_file in glob.glob(path+'/'+wildcard):
-          if not os.path.isdir(output_file):
-            complete.append(output_file)
-        # print(file_names)
-        file_names = [i for i in complete if i not in file_names]
-      #   print(complete)
-      file_names = set(file_names)
-      if verbose:
-        print('Selected files')
-        print(file_names)
-      # print(len(file_names))
-      if archive_path:
-        if keep:
-          action = 'copy '
-        else:
-          action = 'move '
-        destination = ' to '+archive_path+' '
-      elif not force:
-        print('''INFORMATION: setting path.archive allows you to move
-          the unwanted files to the archive path and not delete them.''')
-        destination = ''
-        action = 'remove '
-      if file_names:
-        if not force and eu.query_yes_no(f'List the {str(len(file_names))} files ?'):
-          print("\n".join(file_names))
-        if force or eu.query_yes_no(
-          f'About to {action}{str(len(file_names))} files from {path}{destination} \n Proceed?'
-          ):
-          for file_name in file_names:
-            if archive_path:
-              if keep:
-                sh.copyfile(file_name, archive_path+'/'+os.path.basename(file_name))
-              else:
-                os.rename(file_name, archive_path+'/'+os.path.basename(file_name))
-            else:
-              os.remove(file_name)
-      else:
-        print('no files found.')
+    sink = doce.sink.get_sink(path, metric_delimiter)
+    sink.output_names = set(output_names or [])
+    statistics = sink.clean(
+      self,
+      reverse=reverse,
+      force=force,
+      keep=keep,
+      wildcard=wildcard,
+      setting_encoding=setting_encoding,
+      archive_path=archive_path,
+      verbose=verbose,
+      dry_run=dry_run)
+    sink.close()
+    return statistics
 
   def merge(self, plans):
     # build temporary plan
@@ -870,7 +1200,7 @@ class Plan():
     ):
     if not hasattr(self, name) and name[0] != '_':
       self._factors.append(name)
-    if hasattr(self, name) and isinstance(inspect.getattr_static(self, name), types.FunctionType):
+    if name[0] != '_' and hasattr(self, name) and isinstance(inspect.getattr_static(self, name), types.FunctionType):
       raise Exception(f'the attribute {name} is shadowing a builtin function')
     if name == '_selector' or name[0] != '_':
       self._changed = True
@@ -0,0 +1,264 @@
+"""Handle the profiling of the computation of the settings of the doce module."""
+
+import os
+import io
+import time
+import cProfile
+import pstats
+import threading
+
+# functions whose own time is considered as input/output
+IO_MODULES = [
+  os.path.join('numpy', 'lib', 'npyio'),
+  os.path.join('numpy', 'lib', 'format'),
+  os.path.join('numpy', 'lib', '_npyio_impl'),
+  os.path.join('numpy', 'lib', '_format_impl'),
+  os.path.join('site-packages', 'tables'),
+  'shutil.py',
+  'glob.py',
+  'tarfile.py',
+  'zipfile',
+  'sqlite3'
+  ]
+IO_BUILTINS = ['_io.', 'posix.', 'nt.', 'built-in method io.open', 'built-in method posix', 'built-in method nt']
+
+class Profiler():
+  """collects profiling statistics during the computation of settings.
+
+  The time spent by the user function is measured for each setting,
+  as well as the time spent by doce to handle the setting and to drive the loop
+  over the setting set. Every interval settings, the processing of the setting
+  is profiled with cProfile. The statistics gathered in the different workers are merged.
+  As a single profiler may be active at a time, a setting processed while another thread
+  is profiled is only timed.
+
+  The report splits the time between doce overhead and user code.
+  Statistics are written in the pstats format (.prof) and in the folded stack
+  format (.folded) expected by flamegraph tools such as flamegraph.pl or speedscope.
+
+  Parameters
+  ----------
+
+  file_name: str
+    path prefix of the report files.
+
+  interval: int (optional)
+    profile one setting every interval settings (default 1).
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> e=doce.Experiment()
+  >>> e.add_plan('plan', factor1=[1, 3], factor2=[2, 5])
+  >>> def my_function(setting, experiment):
+  ...   return sum(range(setting.factor1*setting.factor2*1000))
+  >>> nb_failed = e.perform([], my_function, progress='', profile='/tmp/doce_profile')
+  Profile of 4 settings (4 profiled) ...
+  """
+  def __init__(self, file_name, interval=1):
+    if file_name.endswith('.prof'):
+      file_name = file_name[:-5]
+    self.file_name = file_name
+    self.interval = max(int(interval), 1)
+    self.nb_settings = 0
+    self.nb_profiled = 0
+    self.user_time = 0
+    self.setting_time = 0
+    self.wall_time = 0
+    self.parallel = False
+    self._stats = None
+    self._lock = threading.Lock()
+    # held by the thread whose setting is profiled with cProfile
+    self._profile_lock = threading.Lock()
+    self._start = None
+
+  def start(self, parallel=False):
+    """starts the measurement of the wall time of the loop over the setting set."""
+    self.parallel = parallel
+    self._start = time.perf_counter()
+
+  def stop(self):
+    """stops the measurement of the wall time of the loop over the setting set."""
+    self.wall_time += time.perf_counter()-self._start
+
+  def profile(self, setting_perform, *args):
+    """calls setting_perform with args while measuring it.
+
+    setting_perform is expected to call the user function
+    through :meth:`doce.profiling.Profiler.user`.
+    """
+    with self._lock:
+      sampled = self.nb_settings % self.interval == 0
+      self.nb_settings += 1
+    # the setting is only timed if another thread is profiled
+    sampled = sampled and self._profile_lock.acquire(blocking=False)
+    start = time.perf_counter()
+    if sampled:
+      profile = cProfile.Profile()
+      try:
+        profile.enable()
+        result = setting_perform(*args)
+      finally:
+        profile.disable()
+        self._profile_lock.release()
+        duration = time.perf_counter()-start
+        with self._lock:
+          self.nb_profiled += 1
+          self.setting_time += duration
+          if self._stats is None:
+            self._stats = pstats.Stats(profile)
+          else:
+            self._stats.add(profile)
+    else:
+      try:
+        result = setting_perform(*args)
+      finally:
+        duration = time.perf_counter()-start
+        with self._lock:
+          self.setting_time += duration
+    return result
+
+  def user(self, function, *args):
+    """calls the user function with args while measuring its duration."""
+    start = time.perf_counter()
+    try:
+      return function(*args)
+    finally:
+      duration = time.perf_counter()-start
+      with self._lock:
+        self.user_time += duration
+
+  def breakdown(self):
+    """returns the own time of the profiled functions split by category.
+
+    Returns
+    -------
+
+    breakdown: dict
+      own time in seconds of the functions of doce ('doce'),
+      of input/output functions ('io'), and of the remaining functions ('user').
+    """
+    import doce
+    doce_path = os.path.dirname(os.path.abspath(doce.__file__))
+    breakdown = {'doce': 0, 'io': 0, 'user': 0}
+    if self._stats is None:
+      return breakdown
+    for (file_name, _, function_name), stat in self._stats.stats.items():
+      own_time = stat[2]
+      if file_name.startswith(doce_path) and not file_name.endswith('profiling.py'):
+        breakdown['doce'] += own_time
+      elif (any(module in file_name for module in IO_MODULES) or
+            (file_name == '~' and any(name in function_name for name in IO_BUILTINS))):
+        breakdown['io'] += own_time
+      else:
+        breakdown['user'] += own_time
+    return breakdown
+
+  def folded(self, max_depth=64):
+    """returns the profiled stacks in the folded format.
+
+    As cProfile only records caller/callee pairs, the time of a function
+    is distributed over its call stacks proportionally to the cumulative time
+    of each call.
+    """
+    if self._stats is None:
+      return []
+    stats = self._stats.stats
+    children = {}
+    roots = []
+    for function, (_, _, _, cumulative_time, callers) in stats.items():
+      if not callers:
+        roots.append(function)
+      for caller, caller_stat in callers.items():
+        children.setdefault(caller, []).append((function, caller_stat[3]))
+
+    def label(function):
+      file_name, line, function_name = function
+      if file_name == '~':
+        return function_name
+      return f'{function_name} ({os.path.basename(file_name)}:{line})'
+
+    lines = {}
+    def walk(function, stack, ratio, depth):
+      own_time = stats[function][2]*ratio
+      stack = stack+[label(function)]
+      if own_time > 0:
+        key = ';'.join(stack)
+        lines[key] = lines.get(key, 0)+own_time
+      if depth >= max_depth:
+        return
+      for child, child_time in children.get(function, []):
+        if label(child) in stack:
+          continue
+        cumulative_time = stats[child][3]
+        if cumulative_time > 0 and child_time > 0:
+          walk(child, stack, ratio*child_time/cumulative_time, depth+1)
+
+    for root in roots:
+      walk(root, [], 1, 0)
+    return [f'{stack} {int(round(duration*1e6))}' for stack, duration in lines.items()
+            if int(round(duration*1e6)) > 0]
+
+  def summary(self, nb_functions=20):
+    """returns a textual report of the profiling."""
+    if self.parallel:
+      # workers run concurrently, the overhead is measured within the workers
+      total_time = self.setting_time
+      driver_time = 0
+    else:
+      total_time = self.wall_time
+      driver_time = max(self.wall_time-self.setting_time, 0)
+    handling_time = max(self.setting_time-self.user_time, 0)
+    overhead_time = driver_time+handling_time
+
+    def percent(duration):
+      if total_time:
+        return f'{100*duration/total_time:5.1f} %'
+      return ''
+
+    report = f'Profile of {self.nb_settings} settings ({self.nb_profiled} profiled)\n'
+    report += f'  wall time: {self.wall_time:.3f} s\n'
+    report += f'  user code: {self.user_time:.3f} s {percent(self.user_time)}\n'
+    report += f'  doce overhead: {overhead_time:.3f} s {percent(overhead_time)}\n'
+    if not self.parallel:
+      report += f'    driver loop: {driver_time:.3f} s {percent(driver_time)}\n'
+    report += f'    setting handling: {handling_time:.3f} s {percent(handling_time)}\n'
+    if self.nb_settings:
+      report += f'  doce overhead per setting: {1e6*overhead_time/self.nb_settings:.1f} us\n'
+    breakdown = self.breakdown()
+    report += 'Own time of the profiled settings:\n'
+    for category, duration in breakdown.items():
+      report += f'  {category}: {duration:.3f} s\n'
+    if self._stats is not None:
+      stream = io.StringIO()
+      stats = pstats.Stats(stream=stream)
+      stats.add(self._stats)
+      stats.sort_stats('cumulative').print_stats(nb_functions)
+      report += stream.getvalue()
+    return report
+
+  def report(self, verbose=True):
+    """writes the report files and prints the summary.
+
+    The files are: <file_name>.txt for the summary,
+    <file_name>.prof for the statistics in the pstats format, and
+    <file_name>.folded for the statistics in the folded stack format.
+    """
+    directory = os.path.dirname(self.file_name)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    summary = self.summary()
+    with open(f'{self.file_name}.txt', 'w') as file:
+      file.write(summary)
+    if self._stats is not None:
+      self._stats.dump_stats(f'{self.file_name}.prof')
+      with open(f'{self.file_name}.folded', 'w') as file:
+        file.write('\n'.join(self.folded()))
+    if verbose:
+      print(summary.split('Own time')[0].rstrip())
+      print(f'Profile available at: {self.file_name}.txt, .prof and .folded')
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
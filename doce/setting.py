@@ -52,7 +52,7 @@ class Setting():
     if setting_array:
       self._setting = copy.deepcopy(setting_array)
     else:
-      self._setting = copy.deepcopy(plan._setting)
+      self._setting = list(plan._setting)
 
     for factor_index, factor in enumerate(plan.factors()):
       # print(self._setting[fi])
@@ -331,7 +331,8 @@ class Setting():
     function,
     experiment,
     log_file_name,
-    *parameters
+    *parameters,
+    profiler=None
     ):
     """run the function given as parameter for the setting.
 
@@ -343,6 +344,18 @@ class Setting():
     doce.Plan.do
 
     """
+    if profiler is not None:
+      return profiler.profile(self._perform, function, experiment, log_file_name, parameters, profiler)
+    return self._perform(function, experiment, log_file_name, parameters)
+
+  def _perform(
+    self,
+    function,
+    experiment,
+    log_file_name,
+    parameters,
+    profiler=None
+    ):
     failed = 0
     if experiment.skip_setting(self) :
       message = 'Metrics for setting '+self.identifier()+' already available. Skipping...'
@@ -351,7 +364,10 @@ class Setting():
         logging.info(message)
     else:
       try:
-        function(self, experiment, *parameters)
+        if profiler is not None:
+          profiler.user(function, self, experiment, *parameters)
+        else:
+          function(self, experiment, *parameters)
       except Exception as exception:
         if log_file_name:
           failed = 1
@@ -376,6 +392,157 @@ class Setting():
     delattr(setting_copy, factor)
     return setting_copy
 
+class SettingBatch():
+  """stores a group of :term:`settings<setting>` that only differ
+  by the modalities of some factors, the batch factors.
+
+  Each member is a factor. For the batch factors, the value of the member is
+  a numpy array with the modality of each setting of the batch.
+  For the other factors, the value of the member is the shared modality.
+
+  A function that operates on a batch may report that some settings of the batch failed
+  by calling :meth:`doce.setting.SettingBatch.fail`.
+
+  Examples
+  --------
+
+  >>> import doce
+
+  >>> p = doce.Plan('plan')
+  >>> p.model=['a', 'b']
+  >>> p.threshold=[0.1, 0.2, 0.3]
+
+  >>> def step(batch, experiment):
+  ...   print(batch)
+  ...   print(batch.model, batch.threshold)
+  >>> e = doce.Experiment()
+  >>> e._plan = p
+  >>> nb_failed = e.perform([], step, progress='', batch_factors=['threshold'])
+  model=a+threshold=[0.1 0.2 0.3]
+  a [0.1 0.2 0.3]
+  model=b+threshold=[0.1 0.2 0.3]
+  b [0.1 0.2 0.3]
+  """
+
+  def __init__(self, plan, setting_arrays, batch_factors):
+    self._plan = plan
+    self._settings = [list(setting_array) for setting_array in setting_arrays]
+    self._batch_factors = list(batch_factors)
+    self._failed = {}
+
+    for factor_index, factor in enumerate(plan.factors()):
+      modalities = np.atleast_1d(getattr(plan, factor))
+      if factor in self._batch_factors:
+        self.__setattr__(
+          factor,
+          modalities[[setting_array[factor_index] for setting_array in self._settings]])
+      else:
+        self.__setattr__(factor, modalities[self._settings[0][factor_index]])
+
+  def __len__(self):
+    return len(self._settings)
+
+  def __iter__(self):
+    for setting_array in self._settings:
+      yield Setting(self._plan, setting_array)
+
+  def __getitem__(self, index):
+    """returns the setting of the batch at the given index."""
+    return Setting(self._plan, self._settings[index])
+
+  def __str__(self):
+    identifier = []
+    for factor in self._plan.factors():
+      identifier.append(f'{factor}={str(getattr(self, factor))}')
+    return '+'.join(identifier)
+
+  def identifier(self, **setting_encoding):
+    """returns the identifier of each setting of the batch as a list of str.
+
+    Parameters
+    ----------
+
+    setting_encoding:
+      see :meth:`doce.setting.Setting.identifier` for reference.
+
+    Examples
+    --------
+
+    >>> import doce
+
+    >>> p = doce.Plan('plan')
+    >>> p.model=['a', 'b']
+    >>> p.threshold=[1, 2]
+    >>> batch = doce.setting.SettingBatch(p, [[0, 0], [0, 1]], ['threshold'])
+    >>> batch.identifier()
+    ['model=a+threshold=1', 'model=a+threshold=2']
+    """
+    return [setting.identifier(**setting_encoding) for setting in self]
+
+  def fail(self, index, message=''):
+    """report that the setting of the batch at the given index failed.
+
+    Parameters
+    ----------
+
+    index: int or array of bool
+      index of the failed setting in the batch, or mask of the failed settings.
+
+    message: str (optional)
+      description of the failure.
+    """
+    if isinstance(index, (list, np.ndarray)) and np.asarray(index).dtype == bool:
+      index = np.flatnonzero(index)
+    for setting_index in np.atleast_1d(index):
+      self._failed[int(setting_index)] = message
+
+  def perform(
+    self,
+    function,
+    experiment,
+    log_file_name,
+    *parameters,
+    profiler=None
+    ):
+    """run the function given as parameter for the batch.
+
+    Helper function for the method :meth:`~doce.Plan.perform_batch`.
+    Returns the number of failed settings.
+    If profiler is not None, the batch is measured as a single setting.
+    """
+    if profiler is not None:
+      return profiler.profile(self._perform, function, experiment, log_file_name, parameters, profiler)
+    return self._perform(function, experiment, log_file_name, parameters)
+
+  def _perform(
+    self,
+    function,
+    experiment,
+    log_file_name,
+    parameters,
+    profiler=None
+    ):
+    try:
+      if profiler is not None:
+        profiler.user(function, self, experiment, *parameters)
+      else:
+        function(self, experiment, *parameters)
+    except Exception as exception:
+      if log_file_name:
+        for identifier in self.identifier():
+          logging.info('Failed setting: %s', identifier)
+        logging.info(traceback.format_exc())
+        return len(self)
+      print('Failed settings: '+', '.join(self.identifier()))
+      raise exception
+    for setting_index, message in self._failed.items():
+      identifier = self[setting_index].identifier()
+      if log_file_name:
+        logging.info('Failed setting: %s %s', identifier, message)
+      else:
+        print(f'Failed setting: {identifier} {message}')
+    return len(self._failed)
+
 
 if __name__ == '__main__':
   import doctest
@@ -0,0 +1,2127 @@
+"""Handle the data sinks where the outputs of the settings are stored for the doce module.
+
+A data sink is designated by a path:
+
+- a directory, where each output is stored in an .npy file named <identifier><metric_delimiter><output>.npy,
+- an .h5 file, where each setting is a group of the root and each output an array of the group,
+- a directory ending with .store, see :class:`doce.store.Store`,
+- an .sqlite file, where each output is a row of a table.
+
+All the data sinks share the interface of :class:`doce.sink.Sink`.
+"""
+
+import os
+import io
+import re
+import hashlib
+import glob
+import time
+import queue
+import atexit
+import weakref
+import fnmatch
+import threading
+import shutil as sh
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import doce.util as eu
+import doce.store
+import doce.archive
+
+if eu.in_notebook():
+  from tqdm.notebook import tqdm as tqdm
+else:
+  from tqdm import tqdm as tqdm
+
+H5_EXTENSION = '.h5'
+SQLITE_EXTENSIONS = ('.sqlite', '.db')
+
+def is_file_sink(path):
+  """returns True if path designates a data sink stored in a single file.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.sink.is_file_sink('/tmp/my_experiment.h5')
+  True
+  >>> doce.sink.is_file_sink('/tmp/my_experiment/')
+  False
+  """
+  return path.endswith(H5_EXTENSION) or path.endswith(SQLITE_EXTENSIONS)
+
+def get_sink(path, metric_delimiter='_', h5_layout='flat', factors=None):
+  """returns the data sink designated by path.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the data sink. The kind of data sink is given by the extension.
+
+  metric_delimiter: str (optional)
+    delimiter between the identifier of the setting and the name of the output
+    in the names of .npy files (default '_').
+
+  h5_layout: str (optional)
+    layout of the .h5 files created by the sink, see :func:`doce.sink.h5_group_path` (default 'flat').
+
+  factors: list of str (optional)
+    factors of the settings, used to create the tables of the .h5 files with the table layout,
+    see :class:`doce.sink.H5Table`.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.sink.get_sink('/tmp/my_experiment.h5')
+  H5Sink('/tmp/my_experiment.h5')
+  >>> doce.sink.get_sink('/tmp/my_experiment.store/')
+  StoreSink('/tmp/my_experiment.store/')
+  """
+  path = os.path.expanduser(path)
+  if path.endswith(H5_EXTENSION):
+    return H5Sink(path, metric_delimiter, h5_layout, factors)
+  if doce.store.is_store(path):
+    return StoreSink(path, metric_delimiter)
+  if path.endswith(SQLITE_EXTENSIONS):
+    return SQLiteSink(path, metric_delimiter)
+  return NpySink(path, metric_delimiter)
+
+def tag_path(path, tag):
+  """returns the path of the data sink path specialized by a tag.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.sink.tag_path('/tmp/my_experiment.h5', 'test')
+  '/tmp/my_experiment_test.h5'
+  >>> doce.sink.tag_path('/tmp/my_experiment/', 'test')
+  '/tmp/my_experiment/test/'
+  """
+  stripped = path.rstrip('/\\')
+  for extension in (H5_EXTENSION, doce.store.STORE_EXTENSION)+SQLITE_EXTENSIONS:
+    if stripped.endswith(extension):
+      return stripped[:-len(extension)]+'_'+tag+extension
+  return stripped+'/'+tag+'/'
+
+H5_LAYOUTS = ['flat', 'factor', 'hash', 'table']
+
+def h5_group_path(identifier, layout='flat'):
+  """returns the path of the group of a setting in an .h5 file.
+
+  With the flat layout, the group of each setting is a child of the root,
+  named by the identifier of the setting. As the access to the children of a group
+  gets slow for large numbers of children, two nested layouts are available:
+
+  - factor: one level of groups per factor, named factor=modality,
+  - hash: the groups of the settings are gathered in 256 groups, named by a hash of the identifier.
+
+  With the table layout, the outputs are stored as the rows of tables, see :class:`doce.sink.H5Table`.
+
+  Parameters
+  ----------
+
+  identifier: str
+    the identifier of the setting.
+
+  layout: str (optional)
+    'flat' (default), 'factor' or 'hash'.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.sink.h5_group_path('f1=1+f2=2')
+  '/f1=1+f2=2'
+  >>> doce.sink.h5_group_path('f1=1+f2=2', 'factor')
+  '/f1=1/f2=2'
+  >>> doce.sink.h5_group_path('f1=1+f2=2', 'hash')
+  '/hb1/f1=1+f2=2'
+  """
+  if layout == 'factor':
+    return '/'+'/'.join(_FACTOR_SEPARATOR.split(identifier))
+  if layout == 'hash':
+    return f'/h{hashlib.md5(identifier.encode()).hexdigest()[:2]}/{identifier}'
+  return '/'+identifier
+
+# + followed by a factor name and =, so that modalities such as 1e+20 are preserved
+_FACTOR_SEPARATOR = re.compile(r'\+(?=[^+=]+=)')
+
+def h5_layout(h5, layout=None):
+  """returns the layout of an opened .h5 file.
+
+  The layout of a file is stored in the doce_layout attribute of its root group.
+  A file without such attribute has the flat layout, unless the file is empty and writable,
+  in which case layout is set as its layout.
+  """
+  # the layout of a file does not change once the file has settings
+  if hasattr(h5, '_doce_layout'):
+    return h5._doce_layout
+  attributes = h5.root._v_attrs
+  if 'doce_layout' in attributes:
+    h5._doce_layout = attributes.doce_layout
+    return h5._doce_layout
+  if not h5.root._v_children:
+    if layout and layout != 'flat' and h5.mode != 'r':
+      attributes.doce_layout = layout
+      h5._doce_layout = layout
+      return layout
+    return 'flat'
+  h5._doce_layout = 'flat'
+  return 'flat'
+
+def h5_setting_group(h5, identifier, title='', layout=None):
+  """returns the group of a setting in an opened .h5 file, created if needed.
+
+  layout is the layout considered if the file is empty, see :func:`doce.sink.h5_layout`.
+  """
+  layout = h5_layout(h5, layout)
+  if layout == 'table':
+    print(f'The settings of {h5.filename} are stored in tables, not in groups.')
+    raise ValueError
+  path = h5_group_path(identifier, layout)
+  if h5.__contains__(path):
+    return h5.get_node(path)
+  (where, name) = path.rsplit('/', 1)
+  return h5.create_group(where or '/', name, title or identifier, createparents=True)
+
+def h5_setting_groups(h5):
+  """yields the identifier and the group of each setting stored in an opened .h5 file."""
+  layout = h5_layout(h5)
+  if layout == 'factor':
+    for group in h5.walk_groups('/'):
+      if group._v_leaves:
+        yield (group._v_pathname[1:].replace('/', '+'), group)
+  elif layout == 'hash':
+    for bucket in h5.root._v_groups.values():
+      for (identifier, group) in bucket._v_groups.items():
+        yield (identifier, group)
+  elif layout == 'flat':
+    for (identifier, group) in h5.root._v_groups.items():
+      yield (identifier, group)
+
+def h5_table(h5, output):
+  """returns the :class:`doce.sink.H5Table` of an output of an opened .h5 file, None if not available."""
+  if h5 is None:
+    return None
+  # the tables are kept with their row index as long as the file is open
+  if not hasattr(h5, '_doce_tables'):
+    h5._doce_tables = {}
+  if output not in h5._doce_tables:
+    if not h5.root.__contains__(output):
+      return None
+    h5._doce_tables[output] = H5Table(h5.root._f_get_child(output))
+  return h5._doce_tables[output]
+
+def h5_tables(h5):
+  """returns the :class:`doce.sink.H5Table` of the outputs of an opened .h5 file."""
+  return [h5_table(h5, output) for output in h5.root._v_leaves]
+
+def h5_identifiers(h5):
+  """returns the identifiers of the settings stored in an opened .h5 file."""
+  if h5 is None:
+    return []
+  if h5_layout(h5) == 'table':
+    identifiers = {}
+    for table in h5_tables(h5):
+      identifiers.update(dict.fromkeys(table.identifiers()))
+    return list(identifiers)
+  return [identifier for (identifier, _) in h5_setting_groups(h5)]
+
+def h5_node(h5, identifier, output):
+  """returns the array storing an output of a setting in an opened .h5 file, None if not available."""
+  if h5 is None:
+    return None
+  path = h5_group_path(identifier, h5_layout(h5))
+  if not h5.__contains__(path+'/'+output):
+    return None
+  return h5.get_node(path+'/'+output)
+
+def h5_touch(node):
+  """records the time of the last modification of an array of an opened .h5 file by :func:`doce.sink.h5_write`."""
+  node.attrs.doce_modified = time.time()
+
+def h5_modified(node):
+  """returns the time of the last modification of an array by :func:`doce.sink.h5_write`, None if it has been written otherwise."""
+  if 'doce_modified' not in node.attrs._v_attrnames:
+    return None
+  return float(node.attrs.doce_modified)
+
+def h5_read(h5, identifier, output):
+  """returns an output of a setting stored in an opened .h5 file, None if not available."""
+  if h5 is not None and h5_layout(h5) == 'table':
+    table = h5_table(h5, output)
+    return None if table is None else table.read(identifier)
+  node = h5_node(h5, identifier, output)
+  return None if node is None else np.array(node)
+
+class RunningStatistics():
+  """maintains the statistics of the values of an output that grows by appends.
+
+  The number of values, their mean, the sum of their squared deviations from the mean (m2),
+  their sum, minimum and maximum are updated with each appended array,
+  so that the reductions of doce.sink.RunningStatistics.REDUCTIONS are available
+  without reading the output again, see :func:`doce.sink.h5_statistics`.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> statistics = doce.sink.RunningStatistics()
+  >>> statistics.update(np.arange(10.))
+  >>> statistics.update(np.arange(10., 20.))
+  >>> statistics.reduce('mean'), statistics.reduce('max')
+  (9.5, 19.0)
+  >>> bool(np.isclose(statistics.reduce('std'), np.std(np.arange(20.))))
+  True
+  """
+  REDUCTIONS = ('mean', 'sum', 'min', 'max', 'std', 'var')
+
+  def __init__(self, count=0, mean=0., m2=0., total=None, minimum=None, maximum=None):
+    self.count = count
+    self.mean = mean
+    self.m2 = m2
+    self.total = total
+    self.minimum = minimum
+    self.maximum = maximum
+
+  @property
+  def size(self):
+    return self.count
+
+  def update(self, data):
+    """adds the values of data to the statistics."""
+    data = np.asarray(data).reshape(-1)
+    if not data.size:
+      return
+    # the moments are combined following Chan et al.
+    data_mean = np.mean(data, dtype=np.float64)
+    data_m2 = np.sum(np.square(data-data_mean, dtype=np.float64))
+    delta = data_mean-self.mean
+    count = self.count+data.size
+    self.mean += delta*data.size/count
+    self.m2 += data_m2+delta**2*self.count*data.size/count
+    self.count = count
+    if self.total is None:
+      (self.total, self.minimum, self.maximum) = (np.sum(data), np.min(data), np.max(data))
+    else:
+      self.total = self.total+np.sum(data)
+      self.minimum = np.minimum(self.minimum, np.min(data))
+      self.maximum = np.maximum(self.maximum, np.max(data))
+
+  def reduce(self, reduction):
+    """returns the value of reduction, one of doce.sink.RunningStatistics.REDUCTIONS."""
+    if reduction == 'mean':
+      return np.float64(self.mean)
+    if reduction == 'var':
+      return np.float64(self.m2/self.count)
+    if reduction == 'std':
+      return np.sqrt(self.m2/self.count)
+    if reduction == 'sum':
+      return self.total
+    if reduction == 'min':
+      return self.minimum
+    if reduction == 'max':
+      return self.maximum
+    print(f'Reduction {reduction} is not available from the running statistics.')
+    raise ValueError
+
+  def state(self):
+    """returns the statistics as a dict, from which they can be restored with RunningStatistics(**state)."""
+    return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+            'total': self.total, 'minimum': self.minimum, 'maximum': self.maximum}
+
+def h5_statistics(node, chunk_size=2**20):
+  """returns the running statistics of an expandable array of an opened .h5 file, None if not available.
+
+  The statistics are maintained by :func:`doce.sink.h5_write` for the arrays it writes,
+  and stored in the doce_statistics attribute of the array with the number of rows and the time
+  of the last modification of the array they cover, see :func:`doce.sink.h5_modified`.
+  If they do not match the array and the file is writable, they are computed again
+  by chunks of about chunk_size values. The arrays written otherwise, for example appended
+  or assigned in place through pytables, have no statistics, as they may be outdated.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import tables as tb
+  >>> h5 = tb.open_file('/tmp/example_statistics.h5', mode='w')
+  >>> node = h5.create_earray(doce.sink.h5_setting_group(h5, 'f1=1'), 'duration', tb.Float64Atom(), (0,))
+  >>> doce.sink.h5_write(h5, 'f1=1', 'duration', np.arange(4.))
+  >>> doce.sink.h5_statistics(node).reduce('mean')
+  1.5
+  >>> doce.sink.h5_write(h5, 'f1=1', 'duration', np.arange(4., 8.))
+  >>> doce.sink.h5_statistics(node).reduce('sum')
+  28.0
+  >>> node.attrs.doce_statistics['rows']
+  8
+
+  An array modified in place without h5_write has no statistics.
+
+  >>> node = h5.create_earray(h5.root, 'accuracy', tb.Float64Atom(), (0,))
+  >>> node.append(np.arange(4.))
+  >>> node[0] = 10.
+  >>> doce.sink.h5_statistics(node) is None
+  True
+  >>> h5.close()
+  """
+  import tables as tb
+  if not isinstance(node, tb.EArray) or node.extdim != 0:
+    return None
+  modified = h5_modified(node)
+  if modified is None:
+    return None
+  state = dict(node.attrs.doce_statistics) if 'doce_statistics' in node.attrs._v_attrnames else {}
+  if state.pop('modified', None) == modified and state.pop('rows', None) == node.nrows:
+    return RunningStatistics(**state)
+  if node._v_file.mode == 'r':
+    return None
+  statistics = RunningStatistics()
+  step = max(1, chunk_size//max(1, int(np.prod(node.shape[1:]))))
+  for start in range(0, node.nrows, step):
+    statistics.update(node[start:start+step])
+  node.attrs.doce_statistics = dict(statistics.state(), rows=node.nrows, modified=modified)
+  return statistics
+
+def h5_outputs(h5, identifier):
+  """returns the names of the outputs of a setting stored in an opened .h5 file."""
+  if h5 is None:
+    return []
+  layout = h5_layout(h5)
+  if layout == 'table':
+    return [table.output for table in h5_tables(h5) if table.row(identifier) is not None]
+  path = h5_group_path(identifier, layout)
+  if not h5.__contains__(path):
+    return []
+  return list(h5.get_node(path)._v_leaves)
+
+def h5_write(h5, identifier, output, data, title='', description='', layout=None, factors=None, options=None):
+  """writes an output of a setting in an opened .h5 file.
+
+  With the group layouts, the group of the setting is created if needed, with title as title.
+  If the output is an expandable array, as created by :meth:`doce.Experiment.add_setting_group`,
+  data is appended to it and its running statistics are updated, see :func:`doce.sink.h5_statistics`. If the output is an array of the same shape as data,
+  it is filled with data. Otherwise, an array with description as title is created.
+
+  With the table layout, data is written in the row of the setting
+  of the table of the output. The table is created if needed, with factors as factor columns,
+  see :class:`doce.sink.H5Table`.
+
+  layout is the layout considered if the file is empty, see :func:`doce.sink.h5_layout`.
+  options are the storage options of the output when the array or the table is created,
+  see :meth:`doce.Experiment.set_output`.
+  """
+  import tables as tb
+  data = np.asarray(data)
+  if h5_layout(h5, layout) == 'table':
+    table = h5_table(h5, output)
+    if table is None:
+      table = H5Table.create(h5, output, data, factors or h5_factors([identifier]), description, options)
+    table.write(identifier, data)
+    return
+  setting_group = h5_setting_group(h5, identifier, title, layout)
+  if setting_group.__contains__(output):
+    node = setting_group._f_get_child(output)
+    # arrays created by doce.Experiment.add_setting_group are filled
+    if isinstance(node, tb.EArray):
+      statistics = h5_statistics(node)
+      node.append(np.atleast_1d(data))
+      h5_touch(node)
+      if statistics is None:
+        h5_statistics(node)
+      else:
+        # the statistics of the array are updated with the appended rows
+        statistics.update(np.atleast_1d(data))
+        node.attrs.doce_statistics = dict(statistics.state(), rows=node.nrows, modified=h5_modified(node))
+      return
+    if node.shape == data.shape:
+      node[...] = data
+      h5_touch(node)
+      return
+    node._f_remove()
+  filters = h5_filters(options)
+  chunk_shape = options.get('chunk_shape') if options else None
+  if data.ndim and (filters or chunk_shape):
+    # chunked arrays are needed to compress the data
+    node = h5.create_carray(setting_group, output, obj=data, title=description or output,
+                            filters=filters, chunkshape=chunk_shape)
+  else:
+    node = h5.create_array(setting_group, output, data, description or output)
+  h5_touch(node)
+
+def h5_remove_setting(h5, identifier, output=None):
+  """removes the output (all the outputs if None) of a setting from an opened .h5 file.
+
+  The groups left empty by the removal are removed.
+  """
+  h5_remove_settings(h5, [identifier], output)
+
+def h5_remove_settings(h5, identifiers, output=None):
+  """removes the output (all the outputs if None) of several settings from an opened .h5 file."""
+  layout = h5_layout(h5)
+  if layout == 'table':
+    tables = h5_tables(h5) if output is None else [h5_table(h5, output)]
+    for table in tables:
+      if table is not None:
+        table.remove(identifiers)
+    return
+  for identifier in identifiers:
+    path = h5_group_path(identifier, layout)
+    if not h5.__contains__(path):
+      continue
+    group = h5.get_node(path)
+    if output is not None:
+      if group.__contains__(output):
+        group._f_get_child(output)._f_remove()
+    else:
+      for leaf in list(group._v_leaves.values()):
+        leaf._f_remove()
+    # with the factor layout, the group of a setting may contain the groups of other settings
+    while group._v_pathname != '/' and not group._v_children:
+      parent = group._v_parent
+      group._f_remove()
+      group = parent
+
+def h5_filters(options):
+  """returns the filters of an output of an .h5 file, None if not compressed.
+
+  Parameters
+  ----------
+
+  options: dict
+    storage options of the output, see :meth:`doce.Experiment.set_output`.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.sink.h5_filters({'compression': 'blosc:lz4', 'level': 3, 'shuffle': True})
+  Filters(complevel=3, complib='blosc:lz4', shuffle=True, bitshuffle=False, fletcher32=False, least_significant_digit=None)
+  >>> doce.sink.h5_filters({}) is None
+  True
+  """
+  import tables as tb
+  if not options or not options.get('compression'):
+    return None
+  return tb.Filters(complevel=options.get('level', 5), complib=options['compression'],
+                    shuffle=options.get('shuffle', True))
+
+def h5_factors(identifiers):
+  """returns the sorted names of the factors of the identifiers."""
+  factors = set()
+  for identifier in identifiers:
+    factors.update(part.split('=', 1)[0] for part in _FACTOR_SEPARATOR.split(identifier) if part)
+  return sorted(factors)
+
+def migrate_h5(path, layout, output_path=None):
+  """writes the settings of an .h5 file with another layout.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the .h5 file.
+
+  layout: str
+    the new layout, 'flat', 'factor', 'hash' or 'table', see :func:`doce.sink.h5_group_path`.
+
+  output_path: str (optional)
+    path to the migrated file. If None (default), the file is replaced by the migrated one.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import tables as tb
+  >>> import os
+  >>> if os.path.exists('/tmp/example_migrate.h5'): os.remove('/tmp/example_migrate.h5')
+  >>> sink = doce.sink.H5Sink('/tmp/example_migrate.h5')
+  >>> sink.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> sink.close()
+  >>> doce.sink.migrate_h5('/tmp/example_migrate.h5', 'factor')
+  >>> with tb.open_file('/tmp/example_migrate.h5') as h5:
+  ...   print(h5.get_node('/f1=1/f2=2/accuracy'))
+  /f1=1/f2=2/accuracy (Array(3,)) 'accuracy'
+  >>> doce.sink.H5Sink('/tmp/example_migrate.h5').read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  """
+  import tables as tb
+  import warnings
+  from tables import NaturalNameWarning
+  warnings.filterwarnings('ignore', category=NaturalNameWarning)
+
+  if layout not in H5_LAYOUTS:
+    raise ValueError(f'Unknown layout {layout}, should be in {H5_LAYOUTS}')
+  if not output_path:
+    with tb.open_file(path, mode='r') as h5:
+      if h5_layout(h5) == layout:
+        return
+  migrated_path = output_path if output_path else path+'.migrate'
+  with tb.open_file(path, mode='r') as source, tb.open_file(migrated_path, mode='w') as destination:
+    if layout != 'flat':
+      destination.root._v_attrs.doce_layout = layout
+    if 'table' in (layout, h5_layout(source)):
+      identifiers = h5_identifiers(source)
+      factors = h5_factors(identifiers)
+      for identifier in identifiers:
+        for output in h5_outputs(source, identifier):
+          h5_write(destination, identifier, output, h5_read(source, identifier, output), factors=factors)
+    else:
+      # the arrays are copied, so that their type and attributes are preserved
+      for (identifier, group) in h5_setting_groups(source):
+        destination_group = h5_setting_group(destination, identifier, group._v_title)
+        for leaf in group._v_leaves.values():
+          leaf._f_copy(newparent=destination_group)
+  if not output_path:
+    os.replace(migrated_path, path)
+
+def compact_h5(path, verbose=False):
+  """rewrites an .h5 file to reclaim the space of the removed nodes.
+
+  HDF5 does not reclaim the space of the removed nodes. The nodes of the file
+  are copied into a temporary file, which then replaces the file.
+  The file is not modified if the copy fails.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the .h5 file.
+
+  verbose: bool (optional)
+    if True, display the progress of the copy and the sizes of the file (default False).
+
+  Returns
+  -------
+
+  sizes: tuple
+    the sizes in bytes of the file before and after the compaction.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import os
+  >>> if os.path.exists('/tmp/example_compact.h5'): os.remove('/tmp/example_compact.h5')
+  >>> sink = doce.sink.H5Sink('/tmp/example_compact.h5')
+  >>> for f1 in range(10):
+  ...   sink.write(f'f1={f1}', 'accuracy', np.ones(10000))
+  >>> sink.remove('f1=1')
+  >>> sink.close()
+  >>> (size, compacted_size) = doce.sink.compact_h5('/tmp/example_compact.h5')
+  >>> compacted_size < size
+  True
+  >>> doce.sink.H5Sink('/tmp/example_compact.h5').identifiers()
+  ['f1=0', 'f1=2', 'f1=3', 'f1=4', 'f1=5', 'f1=6', 'f1=7', 'f1=8', 'f1=9']
+  """
+  import tables as tb
+  import warnings
+  from tables import NaturalNameWarning
+  warnings.filterwarnings('ignore', category=NaturalNameWarning)
+
+  size = os.path.getsize(path)
+  compacted_path = path+'.compact'
+  try:
+    with tb.open_file(path, mode='r') as source, tb.open_file(compacted_path, mode='w') as destination:
+      source.root._v_attrs._f_copy(destination.root)
+      children = list(source.root._v_children.values())
+      with tqdm(total=len(children), disable=not verbose, desc=f'Compacting {path}') as progress_bar:
+        for child in children:
+          # the indexes of the tables are copied, see doce.sink.H5Table
+          node = child._f_copy(destination.root, recursive=True, propindexes=True)
+          if isinstance(child, tb.Table):
+            node.autoindex = child.autoindex
+          progress_bar.update(1)
+  except BaseException:
+    if os.path.exists(compacted_path):
+      os.remove(compacted_path)
+    raise
+  os.replace(compacted_path, path)
+  compacted_size = os.path.getsize(path)
+  if verbose:
+    print(f'Size of {path} reduced from {size/1024**2:.2f} MB to {compacted_size/1024**2:.2f} MB')
+  return (size, compacted_size)
+
+class Sink():
+  """stores the outputs of the settings.
+
+  Each output is an array identified by the identifier of the setting
+  and the name of the output. Derived classes implement the storage.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the data sink.
+
+  metric_delimiter: str (optional)
+    delimiter between the identifier of the setting and the name of the output (default '_').
+
+  The files of the sink are kept open between operations if keep_open is True,
+  until :meth:`doce.sink.Sink.close` is called. This speeds up the reading of many outputs.
+
+  The storage options of the outputs, such as compression, are given by the options dict,
+  see :meth:`doce.Experiment.set_output`. The names of the outputs declared by the experiment
+  are given by the output_names set.
+  """
+  def __init__(self, path, metric_delimiter='_'):
+    self.path = path
+    self.metric_delimiter = metric_delimiter
+    self.keep_open = False
+    self.options = {}
+    self.output_names = set()
+
+  # True if the sink writes in the background, in which case flush waits for the writes
+  asynchronous = False
+
+  def __repr__(self):
+    return f"{type(self).__name__}('{self.path}')"
+
+  def write(self, identifier, output, data):
+    """stores data as the output of the setting described by identifier."""
+    raise NotImplementedError
+
+  def read(self, identifier, output):
+    """returns the output of the setting described by identifier, None if not available."""
+    raise NotImplementedError
+
+  def read_lazy(self, identifier, output, min_size=0):
+    """returns the output of the setting described by identifier, None if not available.
+
+    The returned array-like object is read from the data sink when accessed,
+    so that only the accessed parts of the output are loaded in memory.
+    The outputs smaller than min_size bytes and, by default, all the outputs are fully read.
+    """
+    return self.read(identifier, output)
+
+  def statistics(self, identifier, output):
+    """returns the :class:`doce.sink.RunningStatistics` of the output, None if not maintained by the sink."""
+    return None
+
+  def remove(self, identifier, output=None):
+    """removes the output (all the outputs if None) of the setting described by identifier."""
+    raise NotImplementedError
+
+  def identifiers(self):
+    """returns the identifiers of the settings that have outputs available."""
+    raise NotImplementedError
+
+  def outputs(self, identifier, wildcard='*'):
+    """returns the names of the outputs available for the setting, filtered by wildcard."""
+    raise NotImplementedError
+
+  def stamp(self, identifier, output):
+    """returns the time of the last modification of the output, None if not available."""
+    raise NotImplementedError
+
+  def version(self, identifier, output):
+    """returns a marker of the content of the output, changed whenever the output is modified, None if not available.
+
+    The reduced values cached for the output are valid as long as its version is unchanged,
+    see :class:`doce.cache.ReductionCache`. By default, the version is the time of the last modification of the output.
+    """
+    stamp = self.stamp(identifier, output)
+    return None if stamp is None else repr(stamp)
+
+  def contains(self, identifier, output=None):
+    """returns True if the output (any output if None) of the setting is available."""
+    if output is None:
+      return len(self.outputs(identifier)) > 0
+    return self.stamp(identifier, output) is not None
+
+  def location(self, identifier, output):
+    """returns a description of the location of the output, used for display."""
+    return f'{self.path}:{identifier}{self.metric_delimiter}{output}'
+
+  def compact(self):
+    """reclaims the space used by removed outputs."""
+
+  def size(self):
+    """returns the size in bytes of the files of the sink."""
+    path = self.path.rstrip('/\\')
+    if os.path.isfile(path):
+      return os.path.getsize(path)
+    size = 0
+    if os.path.isdir(path):
+      for entry in os.scandir(path):
+        if entry.is_file():
+          size += entry.stat().st_size
+    return size
+
+  def preload(self, outputs):
+    """prepares the reading of the outputs of many settings."""
+
+  def flush(self):
+    """waits for the pending writes and returns the number of failed writes."""
+    return 0
+
+  def close(self):
+    """releases the resources used by the sink."""
+
+  def clean(
+    self,
+    settings,
+    reverse=False,
+    force=False,
+    keep=False,
+    wildcard='*',
+    setting_encoding=None,
+    archive_path='',
+    verbose=0,
+    dry_run=False):
+    """clean the data sink by considering the settings set.
+
+    The wildcard is matched against the names of the outputs.
+    The selected outputs are moved or copied to a data sink of the same kind in archive_path if specified.
+    If dry_run is True, the data sink is not modified.
+    Returns the number of selected outputs, and their size in bytes if available.
+
+  	This method is more conveniently used by considering
+    the method :meth:`doce.experiment._experiment.clean_data_sink,
+    please see its documentation for usage.
+    """
+    if not setting_encoding:
+      setting_encoding = {}
+    if reverse:
+      ids = set(setting.identifier(**setting_encoding) for setting in settings)
+      identifiers = [identifier for identifier in self.identifiers() if identifier not in ids]
+    else:
+      identifiers = [setting.identifier(**setting_encoding) for setting in settings]
+    entries = [(identifier, output) for identifier in identifiers
+               for output in self.outputs(identifier, wildcard)]
+    if verbose:
+      print('Selected outputs')
+      print(entries)
+    statistics = {'outputs': len(entries), 'bytes': None}
+    if not entries:
+      print('no outputs found.')
+      return statistics
+    if archive_path:
+      action = 'copy ' if keep else 'move '
+      if os.path.isdir(archive_path) and not doce.store.is_store(archive_path):
+        archive_path = os.path.join(archive_path, os.path.basename(self.path.rstrip('/\\')))
+      destination = ' to '+archive_path+' '
+    else:
+      if not force and not dry_run:
+        print('''INFORMATION: setting path.archive allows you to move
+          the unwanted outputs to the archive path and not delete them.''')
+      destination = ''
+      action = 'remove '
+    if dry_run:
+      print(f'Would {action}{len(entries)} outputs from {self.path}{destination}')
+      return statistics
+    if not force and eu.query_yes_no(f'List the {str(len(entries))} outputs ?'):
+      print("\n".join(identifier+' '+output for identifier, output in entries))
+    if force or eu.query_yes_no(
+      f'About to {action}{str(len(entries))} outputs from {self.path}{destination} \n Proceed?'
+      ):
+      if doce.archive.is_archive(archive_path):
+        doce.archive.write_archive(archive_path, self,
+                                   [(identifier, output, None) for identifier, output in entries],
+                                   verbose=not force)
+        print(f'Archived data should be available at: {archive_path}')
+      elif archive_path:
+        archive = type(self)(archive_path, self.metric_delimiter)
+        for identifier, output in entries:
+          archive.write(identifier, output, self.read(identifier, output))
+        archive.close()
+        print(f'Archived data should be available at: {archive_path}')
+      if not keep or not archive_path:
+        for identifier, output in entries:
+          self.remove(identifier, output)
+        self.compact()
+    return statistics
+
+class NpySink(Sink):
+  """stores each output in an .npy file named <identifier><metric_delimiter><output>.npy.
+
+  The outputs with compression in their options are stored in compressed .npz files.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> sink = doce.sink.NpySink('/tmp/', '_')
+  >>> sink.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> sink.location('f1=1+f2=2', 'accuracy')
+  '/tmp/f1=1+f2=2_accuracy.npy'
+  >>> sink.read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  >>> sink.remove('f1=1+f2=2')
+  >>> sink.contains('f1=1+f2=2')
+  False
+  """
+  def __init__(self, path, metric_delimiter='_'):
+    if path and not path.endswith('/') and not path.endswith('\\'):
+      path += '\\' if '\\' in path else '/'
+    super().__init__(path, metric_delimiter)
+
+  def location(self, identifier, output):
+    file_name = self._file(identifier, output)
+    if file_name:
+      return file_name
+    return self.path+identifier+self.metric_delimiter+output+self._extension(output)
+
+  def _extension(self, output):
+    return '.npz' if self.options.get(output, {}).get('compression') else '.npy'
+
+  def _file(self, identifier, output):
+    # the output may have been written with other options
+    prefix = self.path+identifier+self.metric_delimiter+output
+    for extension in ['.npy', '.npz']:
+      if os.path.exists(prefix+extension):
+        return prefix+extension
+    return None
+
+  def write(self, identifier, output, data):
+    prefix = self.path+identifier+self.metric_delimiter+output
+    file_name = prefix+self._extension(output)
+    # write to a temporary file so that readers never see incomplete outputs
+    with open(file_name+'.tmp', 'wb') as file:
+      if file_name.endswith('.npz'):
+        np.savez_compressed(file, data)
+      else:
+        np.save(file, data)
+    os.replace(file_name+'.tmp', file_name)
+    stale_file_name = prefix+('.npy' if file_name.endswith('.npz') else '.npz')
+    if os.path.exists(stale_file_name):
+      os.remove(stale_file_name)
+
+  def read(self, identifier, output):
+    file_name = self._file(identifier, output)
+    if file_name is None:
+      return None
+    if file_name.endswith('.npz'):
+      with np.load(file_name) as archive:
+        return archive[archive.files[0]]
+    return np.load(file_name)
+
+  def read_lazy(self, identifier, output, min_size=0):
+    """returns the output as a memory-mapped array, fully read if compressed."""
+    file_name = self._file(identifier, output)
+    if file_name is None or file_name.endswith('.npz') or os.path.getsize(file_name) < min_size:
+      return self.read(identifier, output)
+    return np.load(file_name, mmap_mode='r')
+
+  def stamp(self, identifier, output):
+    file_name = self._file(identifier, output)
+    if file_name:
+      return os.path.getmtime(file_name)
+    return None
+
+  def version(self, identifier, output):
+    """returns the time of the last modification of the file of the output in nanoseconds and its size."""
+    file_name = self._file(identifier, output)
+    if not file_name:
+      return None
+    status = os.stat(file_name)
+    return f'{status.st_mtime_ns}:{status.st_size}'
+
+  def _files(self, identifier):
+    return glob.glob(glob.escape(self.path+identifier+self.metric_delimiter)+'*.np[yz]')
+
+  def contains(self, identifier, output=None):
+    if output is None:
+      return len(self._files(identifier)) > 0
+    return self._file(identifier, output) is not None
+
+  def outputs(self, identifier, wildcard='*'):
+    start = len(os.path.basename(self.path+identifier+self.metric_delimiter))
+    outputs = [os.path.basename(file_name)[start:-4] for file_name in self._files(identifier)]
+    return [output for output in outputs if fnmatch.fnmatch(output, wildcard)]
+
+  def identifiers(self):
+    identifiers = set()
+    if not os.path.isdir(self.path):
+      return []
+    for file_name in os.listdir(self.path):
+      (identifier, _) = self._split(file_name)
+      if identifier is not None:
+        identifiers.add(identifier)
+    return sorted(identifiers)
+
+  def _split(self, file_name, identifiers=None):
+    """returns the identifier and the output of a file name, None if it does not store an output.
+
+    As modalities may contain the metric delimiter, the file name is split at the first delimiter
+    after the last equal sign that is preceded by one of the identifiers, if given,
+    or followed by one of the declared output names, see :class:`doce.sink.Sink`.
+    Otherwise, it is split at the first delimiter after the last equal sign.
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> sink = doce.sink.NpySink('/tmp/example_split/')
+    >>> sink._split('f1=1+model=linear_svm_acc.npy')
+    ('f1=1+model=linear', 'svm_acc')
+    >>> sink._split('f1=1+model=linear_svm_acc.npy', identifiers={'f1=1+model=linear_svm'})
+    ('f1=1+model=linear_svm', 'acc')
+    >>> sink.output_names = {'acc'}
+    >>> sink._split('f1=1+model=linear_svm_acc.npy')
+    ('f1=1+model=linear_svm', 'acc')
+    """
+    if not file_name.endswith(('.npy', '.npz')):
+      return (None, None)
+    # the output name follows a delimiter after the last modality
+    ends = []
+    end = file_name.find(self.metric_delimiter, max(file_name.rfind('='), 0))
+    while 0 < end < len(file_name)-4:
+      ends.append(end)
+      end = file_name.find(self.metric_delimiter, end+1)
+    if not ends:
+      return (None, None)
+    splits = [(file_name[:end], file_name[end+len(self.metric_delimiter):-4]) for end in ends]
+    for (identifier, output) in splits:
+      if (identifier in identifiers) if identifiers else (output in self.output_names):
+        return (identifier, output)
+    return splits[0]
+
+  def remove(self, identifier, output=None):
+    outputs = [output] if output else self.outputs(identifier)
+    for output_name in outputs:
+      file_name = self._file(identifier, output_name)
+      if file_name:
+        os.remove(file_name)
+
+  def _select(self, settings, reverse, wildcard, setting_encoding):
+    """returns the files of the directory selected by the settings, in a single pass.
+
+    A file is selected if its name starts with the identifier of a setting,
+    and the end of the name that follows the identifier matches the wildcard.
+    The file name, its size, and the identifier and output it stores are returned for each file.
+    """
+    identifiers = set(setting.identifier(**setting_encoding) for setting in settings)
+    selected = []
+    if not os.path.isdir(self.path):
+      return selected
+    with os.scandir(self.path) as entries:
+      for entry in entries:
+        # hidden files, such as the cache of the reduced metrics, are not outputs
+        if not entry.is_file() or entry.name.startswith('.'):
+          continue
+        name = entry.name
+        # the identifier ends after the last modality
+        start = name.rfind('=')+1
+        matched = next((end for end in range(start, len(name)+1)
+                        if name[:end] in identifiers and fnmatch.fnmatch(name[end:], wildcard)), None)
+        if reverse:
+          if matched is None and fnmatch.fnmatch(name, wildcard):
+            selected.append((entry.path, entry.stat().st_size)+self._split(name))
+        elif matched is not None:
+          output = None
+          if name.startswith(self.metric_delimiter, matched) and name.endswith(('.npy', '.npz')):
+            output = name[matched+len(self.metric_delimiter):-4]
+          selected.append((entry.path, entry.stat().st_size, name[:matched] if output else None, output))
+    return selected
+
+  def clean(
+    self,
+    settings,
+    reverse=False,
+    force=False,
+    keep=False,
+    wildcard='*',
+    setting_encoding=None,
+    archive_path='',
+    verbose=0,
+    dry_run=False):
+    """clean the directory by considering the settings set.
+
+    The wildcard is matched against the end of the file names that follows the identifier.
+    The directory is scanned once, and the files are removed, moved or copied by a pool of threads.
+    """
+    if not setting_encoding:
+      setting_encoding = {}
+    path = self.path
+    selected = self._select(settings, reverse, wildcard, setting_encoding)
+    file_names = [file_name for (file_name, _, _, _) in selected]
+    size = sum(file_size for (_, file_size, _, _) in selected)
+    if verbose:
+      print('Selected files')
+      print(file_names)
+    if archive_path:
+      if keep:
+        action = 'copy '
+      else:
+        action = 'move '
+      destination = ' to '+archive_path+' '
+    else:
+      if not force and not dry_run:
+        print('''INFORMATION: setting path.archive allows you to move
+          the unwanted files to the archive path and not delete them.''')
+      destination = ''
+      action = 'remove '
+    statistics = {'files': len(file_names), 'bytes': size}
+    if dry_run:
+      print(f'Would {action}{len(file_names)} files ({size/1024**2:.2f} MB) from {path}{destination}')
+      return statistics
+    if file_names:
+      if not force and eu.query_yes_no(f'List the {str(len(file_names))} files ?'):
+        print("\n".join(file_names))
+      if force or eu.query_yes_no(
+        f'About to {action}{str(len(file_names))} files ({size/1024**2:.2f} MB) from {path}{destination} \n Proceed?'
+        ):
+        # the files are streamed to tar and zip archives in a single sequential write
+        streamed = doce.archive.is_archive(archive_path)
+        if streamed:
+          doce.archive.write_archive(
+            archive_path, self,
+            [(identifier, output, file_name) for (file_name, _, identifier, output) in selected],
+            verbose=not force)
+          print(f'Archived data should be available at: {archive_path}')
+        def process(file_name):
+          if archive_path and not streamed:
+            if keep:
+              sh.copyfile(file_name, archive_path+'/'+os.path.basename(file_name))
+            else:
+              sh.move(file_name, archive_path+'/'+os.path.basename(file_name))
+          else:
+            os.remove(file_name)
+        if not (streamed and keep):
+          with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1)+4)) as executor:
+            list(executor.map(process, file_names))
+    else:
+      print('no files found.')
+    return statistics
+
+class H5Sink(Sink):
+  """stores the outputs of each setting in a group of an .h5 file.
+
+  The outputs are written by an :class:`doce.sink.H5Writer` service that owns the handle
+  of the file, so that several threads can write to the same file.
+  While the service is active, read accesses also use its handle.
+
+  The groups are organized according to the layout of the file,
+  given by layout when the file is created, see :func:`doce.sink.h5_group_path`.
+  With the table layout, the outputs are stored in tables, whose factor columns
+  are given by factors, see :class:`doce.sink.H5Table`.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> sink = doce.sink.H5Sink('/tmp/example_sink.h5')
+  >>> sink.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> sink.read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  >>> sink.outputs('f1=1+f2=2')
+  ['accuracy']
+
+  The outputs queued for writing are read as soon as they are written.
+
+  >>> for index in range(50):
+  ...   sink.write(f'f1={index}', 'loss', np.ones(2)*index)
+  ...   assert sink.read(f'f1={index}', 'loss')[0] == index
+  >>> sink.close()
+  """
+  asynchronous = True
+
+  def __init__(self, path, metric_delimiter='_', layout='flat', factors=None):
+    super().__init__(path, metric_delimiter)
+    self.layout = layout
+    self.factors = factors
+    self._file = None
+    self._writer = None
+    self._lock = threading.RLock()
+
+  def _open(self, mode='r'):
+    if self._file is not None and (mode == 'r' or self._file.mode != 'r'):
+      return self._file
+    import tables as tb
+    import warnings
+    from tables import NaturalNameWarning
+    warnings.filterwarnings('ignore', category=NaturalNameWarning)
+    self._close_file()
+    if mode == 'r' and not os.path.exists(self.path):
+      return None
+    self._file = tb.open_file(self.path, mode=mode)
+    return self._file
+
+  def _service(self):
+    with self._lock:
+      if self._writer is None:
+        self._close_file()
+        self._writer = H5Writer(self.path, layout=self.layout, factors=self.factors)
+      return self._writer
+
+  def _access(self, function):
+    # the handle of the writer service is used when available
+    if self._writer is not None:
+      return self._writer.access(function)
+    with self._lock:
+      if self._writer is not None:
+        return self._writer.access(function)
+      try:
+        return function(self._open())
+      finally:
+        # the file is not kept open by default, so that other handles on the file can be opened
+        if not self.keep_open:
+          self._close_file()
+
+  def location(self, identifier, output):
+    return f'{self.path}:/{identifier}/{output}'
+
+  def write(self, identifier, output, data, title=None, description=None):
+    """queues data to be written as the output of the setting described by identifier.
+
+    See :meth:`doce.sink.H5Writer.write` for the details.
+    """
+    self._service().write(identifier, output, data, title, description, self.options.get(output))
+
+  def read(self, identifier, output):
+    return self._access(lambda h5: h5_read(h5, identifier, output))
+
+  def read_lazy(self, identifier, output, min_size=0):
+    """returns the output as a :class:`doce.sink.H5Output`, fully read with the table layout."""
+    def read_lazy(h5):
+      if h5 is None or h5_layout(h5) == 'table':
+        return h5_read(h5, identifier, output)
+      node = h5_node(h5, identifier, output)
+      if node is None or node.size_in_memory < min_size:
+        return None if node is None else np.array(node)
+      return H5Output(self, identifier, output, node.shape, node.atom.dtype)
+    return self._access(read_lazy)
+
+  def statistics(self, identifier, output):
+    """returns the running statistics of the output if it is an expandable array, see :func:`doce.sink.h5_statistics`."""
+    def statistics(h5):
+      if h5 is None or h5_layout(h5) == 'table':
+        return None
+      node = h5_node(h5, identifier, output)
+      return None if node is None else h5_statistics(node)
+    return self._access(statistics)
+
+  def stamp(self, identifier, output):
+    """returns the time of the last modification of the output.
+
+    The time is recorded for each output written by :func:`doce.sink.h5_write`.
+    For the outputs written otherwise, the time of the last modification of the file is returned.
+    """
+    def stamp(h5):
+      if h5 is not None and h5_layout(h5) == 'table':
+        table = h5_table(h5, output)
+        return None if table is None else table.stamp(identifier)
+      node = h5_node(h5, identifier, output)
+      if node is None:
+        return None
+      modified = h5_modified(node)
+      return os.path.getmtime(self.path) if modified is None else modified
+    return self._access(stamp)
+
+  def version(self, identifier, output):
+    """returns the time of the last modification of the output and its shape, see :meth:`doce.sink.H5Sink.stamp`."""
+    def version(h5):
+      if h5 is not None and h5_layout(h5) == 'table':
+        table = h5_table(h5, output)
+        stamp = None if table is None else table.stamp(identifier)
+        return None if stamp is None else repr(stamp)
+      node = h5_node(h5, identifier, output)
+      if node is None:
+        return None
+      modified = h5_modified(node)
+      return f'{os.path.getmtime(self.path) if modified is None else modified!r}:{node.shape}'
+    return self._access(version)
+
+  def outputs(self, identifier, wildcard='*'):
+    return [name for name in self._access(lambda h5: h5_outputs(h5, identifier))
+            if fnmatch.fnmatch(name, wildcard)]
+
+  def identifiers(self):
+    return self._access(h5_identifiers)
+
+  def preload(self, outputs):
+    """loads the tables of the outputs in memory, if the file has the table layout.
+
+    The subsequent reads of these outputs do not access the file,
+    as long as the file is kept open, see :attr:`doce.sink.Sink.keep_open`.
+    """
+    def preload(h5):
+      if h5 is not None and h5_layout(h5) == 'table':
+        for output in outputs:
+          table = h5_table(h5, output)
+          if table is not None:
+            table.load()
+    self._access(preload)
+
+  def where(self, output, **modalities):
+    """selects the settings with an in-kernel query on the table of an output.
+
+    The file must have the table layout, see :class:`doce.sink.H5Table`.
+
+    Parameters
+    ----------
+
+    output: str
+      name of the output.
+
+    modalities: dict
+      for each factor, a modality or a list of modalities to select.
+      The default modality of a factor is selected with None.
+
+    Returns
+    -------
+
+    identifiers: list of str
+      identifiers of the selected settings.
+
+    values: numpy array
+      outputs of the selected settings, stacked along the first dimension.
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> import os
+    >>> if os.path.exists('/tmp/example_where.h5'): os.remove('/tmp/example_where.h5')
+    >>> sink = doce.sink.H5Sink('/tmp/example_where.h5', layout='table', factors=['f1', 'f2'])
+    >>> for f1 in range(3):
+    ...   for f2 in [0.1, 0.2]:
+    ...     sink.write(f'f1={f1}+f2={f2}', 'accuracy', f1+f2)
+    >>> sink.flush()
+    0
+    >>> sink.where('accuracy', f1=[0, 2], f2=0.2)
+    (['f1=0+f2=0.2', 'f1=2+f2=0.2'], array([0.2, 2.2]))
+    >>> sink.close()
+    """
+    def where(h5):
+      table = h5_table(h5, output) if h5 is not None and h5_layout(h5) == 'table' else None
+      if table is None:
+        print(f'No table for output {output} in {self.path}.')
+        raise ValueError
+      return table.where(**modalities)
+    return self._access(where)
+
+  def remove(self, identifier, output=None):
+    self._service().remove(identifier, output)
+    self._writer.flush()
+
+  def flush(self):
+    if self._writer is None:
+      return 0
+    return self._writer.flush()
+
+  def _close_file(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def close(self):
+    with self._lock:
+      if self._writer is not None:
+        self._writer.close()
+      self._close_file()
+
+  def compact(self, verbose=False):
+    """reclaims the space of the removed outputs, see :func:`doce.sink.compact_h5`."""
+    self.close()
+    if os.path.exists(self.path):
+      compact_h5(self.path, verbose)
+
+  def clean(
+    self,
+    settings,
+    reverse=False,
+    force=True,
+    keep=False,
+    wildcard='*',
+    setting_encoding=None,
+    archive_path='',
+    verbose=0,
+    dry_run=False):
+    """clean the h5 file by considering the settings set.
+
+    The groups of the selected settings are removed, the wildcard is not considered.
+    """
+    self.close()
+    path = self.path
+    if not setting_encoding:
+      setting_encoding = {}
+
+    changed = False
+
+    if dry_run:
+      groups = self._select(settings, reverse, setting_encoding, mode='r')
+      self.close()
+      action = ('copy ' if keep else 'move ') if archive_path else 'remove '
+      destination = ' to '+archive_path+' ' if archive_path else ''
+      print(f'Would {action}{len(groups)} settings from {path}{destination}')
+      return {'settings': len(groups), 'bytes': None}
+
+    if archive_path:
+      if os.path.isdir(archive_path):
+        archive_path = os.path.join(archive_path, os.path.basename(path))
+      # only the selected settings are written to the archive
+      archived = self._select(settings, reverse, setting_encoding, mode='r')
+      if doce.archive.is_archive(archive_path):
+        h_5 = self._open('r')
+        doce.archive.write_archive(
+          archive_path, self,
+          [(identifier, output, None) for identifier in archived for output in h5_outputs(h_5, identifier)],
+          verbose=verbose)
+      else:
+        doce.archive.write_h5_archive(archive_path, self, archived, verbose=verbose)
+      self.close()
+      print(f'Archived data should be available at: {archive_path}')
+    groups = []
+    if not keep:
+      groups = self._select(settings, reverse, setting_encoding)
+      h_5 = self._open('a')
+      if not force:
+        print(f'About to remove {len(groups)} settings.')
+      if not force and not groups:
+        print('No settings to remove.')
+        self.close()
+        return {'settings': 0, 'bytes': None}
+      if not force and eu.query_yes_no('List them ?'):
+        [print(g) for g in groups]
+      if force or eu.query_yes_no('Proceed to removal ?'):
+        changed = True
+        h5_remove_settings(h_5, groups)
+
+      self.close()
+
+      if changed:
+        self.compact(verbose=not force)
+    return {'settings': len(groups), 'bytes': None}
+
+  def _select(self, settings, reverse, setting_encoding, mode='a'):
+    """returns the identifiers of the settings of the h5 file selected by the settings."""
+    h_5 = self._open(mode)
+    if h_5 is None:
+      return []
+    if reverse:
+      ids = set(setting.identifier(**setting_encoding) for setting in settings)
+      return [group_name for group_name in h5_identifiers(h_5) if group_name not in ids]
+    available = set(h5_identifiers(h_5))
+    return [group_name for group_name in (setting.identifier(**setting_encoding) for setting in settings)
+            if group_name in available]
+
+class H5Output():
+  """gives access to an output of an .h5 file without reading it.
+
+  The output is read from the file when indexed, so that only the selected part is loaded in memory,
+  and fully read when converted to a numpy array.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import os
+  >>> if os.path.exists('/tmp/example_lazy.h5'): os.remove('/tmp/example_lazy.h5')
+  >>> sink = doce.sink.H5Sink('/tmp/example_lazy.h5')
+  >>> sink.write('f1=1', 'accuracy', np.arange(6).reshape(3, 2))
+  >>> sink.flush()
+  0
+  >>> output = sink.read_lazy('f1=1', 'accuracy')
+  >>> output.shape
+  (3, 2)
+  >>> output[1:]
+  array([[2, 3],
+         [4, 5]])
+  >>> np.sum(output)
+  15
+  """
+  def __init__(self, sink, identifier, output, shape, dtype):
+    self.sink = sink
+    self.identifier = identifier
+    self.output = output
+    self.shape = tuple(shape)
+    self.dtype = np.dtype(dtype)
+
+  @property
+  def ndim(self):
+    return len(self.shape)
+
+  @property
+  def size(self):
+    return int(np.prod(self.shape))
+
+  def __len__(self):
+    return self.shape[0]
+
+  def __repr__(self):
+    return f'H5Output({self.sink.path}:{self.identifier}/{self.output}, shape={self.shape}, dtype={self.dtype})'
+
+  def __getitem__(self, key):
+    return self.sink._access(lambda h5: h5_node(h5, self.identifier, self.output)[key])
+
+  def __array__(self, dtype=None):
+    data = self.sink._access(lambda h5: h5_node(h5, self.identifier, self.output).read())
+    return np.asarray(data, dtype=dtype)
+
+class H5Table():
+  """handles the outputs of an .h5 file with the table layout.
+
+  With the table layout, each output is stored in a table at the root of the file,
+  named after the output, with one row per setting. The output of the setting
+  is stored in the value column, and the time of its last modification in the stamp column.
+  The setting is described by one column per factor, storing the index of its modality
+  in the list of the modalities of the factor, or -1 if the factor does not
+  appear in the identifier of the setting, for example if its modality is the default one.
+  The lists of modalities are stored in the modalities attribute of the table.
+
+  The factor columns are indexed, so that the selection of the settings
+  is performed by in-kernel queries, see :meth:`doce.sink.H5Table.where`.
+  As the value column has a fixed shape and type, this layout is suited to
+  scalar and fixed-length outputs.
+
+  Parameters
+  ----------
+
+  table: tables.Table
+    the table of the output.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import tables as tb
+  >>> import numpy as np
+  >>> with tb.open_file('/tmp/example_table.h5', mode='w') as h5:
+  ...   table = doce.sink.H5Table.create(h5, 'accuracy', np.zeros(2), ['f1', 'f2'])
+  ...   table.write('f1=1+f2=a', np.ones(2))
+  ...   table.write('f2=b', np.arange(2))
+  ...   print(table.identifiers(), table.read('f2=b'))
+  ['f1=1+f2=a', 'f2=b'] [0. 1.]
+  """
+  reserved = ['value', 'stamp']
+
+  def __init__(self, table):
+    # the node is not referenced, as the nodes are handled by the node cache of the file
+    self._file = table._v_file
+    self.output = table.name
+    self.factors = [name for name in table.colnames if name not in self.reserved]
+    self.modalities = dict(table.attrs.modalities)
+    self._codes = {factor: {modality: code for (code, modality) in enumerate(modalities)}
+                   for (factor, modalities) in self.modalities.items()}
+    self._positions = {factor: position for (position, factor) in enumerate(self.factors)}
+    self._rows = None
+    self._columns = None
+    self._last = (None, None)
+
+  @property
+  def table(self):
+    """the table of the output."""
+    return self._file.get_node('/', self.output)
+
+  @staticmethod
+  def create(h5, output, data, factors, description='', options=None):
+    """creates the table of an output in an opened .h5 file.
+
+    The value column has the shape and the type of data.
+    The table is compressed according to options, see :meth:`doce.Experiment.set_output`.
+    """
+    import tables as tb
+    factors = sorted(factors)
+    if set(factors) & set(H5Table.reserved):
+      print(f'The factors {H5Table.reserved} cannot be stored with the table layout.')
+      raise ValueError
+    data = np.asarray(data)
+    columns = {factor: tb.Int32Col(dflt=-1, pos=position) for (position, factor) in enumerate(factors)}
+    columns['value'] = tb.Col.from_dtype(np.dtype((data.dtype, data.shape)), pos=len(factors))
+    columns['stamp'] = tb.Float64Col(pos=len(factors)+1)
+    chunk_shape = options.get('chunk_shape') if options else None
+    table = h5.create_table('/', output, columns, description or output,
+                            filters=h5_filters(options), chunkshape=chunk_shape)
+    table.attrs.modalities = {factor: [] for factor in factors}
+    for factor in factors:
+      table.colinstances[factor].create_index()
+    # the indexes are updated before the queries, see doce.sink.H5Table.reindex
+    table.autoindex = False
+    return h5_table(h5, output)
+
+  def codes(self, identifier, add=False):
+    """returns the codes of the modalities of a setting, None if not available.
+
+    If add is True, the modalities that are not available are added to the list of modalities.
+    """
+    codes = [-1]*len(self.factors)
+    for part in _FACTOR_SEPARATOR.split(identifier):
+      if not part:
+        continue
+      (factor, _, modality) = part.partition('=')
+      if factor not in self._positions:
+        if add:
+          print(f'Factor {factor} of {identifier} is not a column of the table {self.output}.')
+          raise ValueError
+        return None
+      code = self._codes[factor].get(modality)
+      if code is None:
+        if not add:
+          return None
+        code = len(self.modalities[factor])
+        self.modalities[factor] = self.modalities[factor]+[modality]
+        self._codes[factor][modality] = code
+        self.table.attrs.modalities = self.modalities
+      codes[self._positions[factor]] = code
+    return tuple(codes)
+
+  def identifier(self, codes):
+    """returns the identifier of the setting described by codes."""
+    return '+'.join(f'{factor}={self.modalities[factor][code]}'
+                    for (factor, code) in zip(self.factors, codes) if code >= 0)
+
+  def rows(self):
+    """returns a dict mapping the codes of the settings to their rows."""
+    if self._rows is None:
+      columns = [self.table.col(factor).tolist() for factor in self.factors]
+      self._rows = dict(zip(zip(*columns), range(self.table.nrows)))
+    return self._rows
+
+  def row(self, identifier):
+    """returns the row of a setting, None if not available."""
+    # the stamp and the output of a setting are usually read in a row
+    if self._last[0] == identifier and self._rows is not None:
+      return self._last[1]
+    codes = self.codes(identifier)
+    row = None if codes is None else self.rows().get(codes)
+    self._last = (identifier, row)
+    return row
+
+  def load(self):
+    """loads the values and the stamps in memory, to speed up subsequent reads."""
+    self.rows()
+    self._columns = (self.table.col('value'), self.table.col('stamp'))
+
+  def read(self, identifier):
+    """returns the output of a setting, None if not available."""
+    row = self.row(identifier)
+    if row is None:
+      return None
+    if self._columns is not None:
+      return np.array(self._columns[0][row])
+    return np.array(self.table.read(row, row+1, field='value')[0])
+
+  def stamp(self, identifier):
+    """returns the time of the last modification of the output of a setting, None if not available."""
+    row = self.row(identifier)
+    if row is None:
+      return None
+    if self._columns is not None:
+      return float(self._columns[1][row])
+    return float(self.table.read(row, row+1, field='stamp')[0])
+
+  def write(self, identifier, data):
+    """writes the output of a setting."""
+    data = np.asarray(data)
+    shape = self.table.coldtypes['value'].shape
+    if data.shape != shape:
+      print(f'The output {self.output} of {identifier} has shape {data.shape}, '
+            f'the table layout expects shape {shape}.')
+      raise ValueError
+    codes = self.codes(identifier, add=True)
+    rows = self.rows()
+    self._columns = None
+    self._last = (None, None)
+    if codes in rows:
+      row = rows[codes]
+      self.table.modify_columns(row, row+1, columns=[[data], [time.time()]], names=self.reserved)
+    else:
+      self.table.append([codes+(data, time.time())])
+      rows[codes] = self.table.nrows-1
+
+  def remove(self, identifiers):
+    """removes the outputs of several settings."""
+    rows = [self.row(identifier) for identifier in identifiers]
+    rows = sorted((row for row in rows if row is not None), reverse=True)
+    # rows are removed from the end, so that the rows remaining to be removed do not move
+    for row in rows:
+      self.table.remove_rows(row, row+1)
+    if rows:
+      self._rows = None
+      self._columns = None
+      self._last = (None, None)
+
+  def reindex(self):
+    """updates the indexes of the factor columns with the rows written since the last update."""
+    self.table.flush()
+    self.table.reindex_dirty()
+
+  def identifiers(self):
+    """returns the identifiers of the settings of the table."""
+    return [self.identifier(codes) for codes in self.rows()]
+
+  def where(self, **modalities):
+    """selects the settings with an in-kernel query.
+
+    See :meth:`doce.sink.H5Sink.where` for the details.
+    """
+    conditions = []
+    for (factor, selected) in modalities.items():
+      if factor not in self._positions:
+        print(f'Factor {factor} is not a column of the table {self.output}.')
+        raise ValueError
+      if not isinstance(selected, (list, tuple, np.ndarray)):
+        selected = [selected]
+      codes = set()
+      for modality in selected:
+        if modality is None:
+          codes.add(-1)
+        elif isinstance(modality, float):
+          codes.add(self._codes[factor].get(np.format_float_positional(modality)))
+        else:
+          codes.add(self._codes[factor].get(str(modality)))
+      codes.discard(None)
+      if not codes:
+        return ([], np.zeros((0,)+self.table.coldtypes['value'].shape))
+      conditions.append('('+' | '.join(f'({factor} == {code})' for code in sorted(codes))+')')
+    if self._file.mode != 'r':
+      self.reindex()
+    # the queries do not use the indexes that are not up to date
+    if conditions:
+      records = self.table.read_where(' & '.join(conditions))
+    else:
+      records = self.table.read()
+    identifiers = [self.identifier(codes) for codes in
+                   zip(*[records[factor].tolist() for factor in self.factors])]
+    return (identifiers, records['value'])
+
+class StoreSink(Sink):
+  """stores the outputs in a consolidated store, see :class:`doce.store.Store`.
+
+  The store is compacted after cleaning.
+  """
+  def __init__(self, path, metric_delimiter='_'):
+    super().__init__(path, metric_delimiter)
+    self.store = doce.store.Store(path)
+
+  def write(self, identifier, output, data):
+    self.store.write(identifier, output, data)
+
+  def read(self, identifier, output):
+    return self.store.read(identifier, output)
+
+  def read_lazy(self, identifier, output, min_size=0):
+    return self.store.read_lazy(identifier, output, min_size)
+
+  def stamp(self, identifier, output):
+    return self.store.stamp(identifier, output)
+
+  def contains(self, identifier, output=None):
+    return self.store.contains(identifier, output)
+
+  def outputs(self, identifier, wildcard='*'):
+    return self.store.outputs(identifier, wildcard)
+
+  def identifiers(self):
+    return self.store.identifiers()
+
+  def remove(self, identifier, output=None):
+    self.store.remove(identifier, output)
+
+  def compact(self):
+    self.store.compact()
+
+  def close(self):
+    self.store.close()
+
+class SQLiteSink(Sink):
+  """stores each output in a row of a table of an SQLite database.
+
+  The outputs are serialized in the npy format.
+  Several processes may write to the same database.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import os
+  >>> if os.path.exists('/tmp/example_sink.sqlite'): os.remove('/tmp/example_sink.sqlite')
+  >>> sink = doce.sink.SQLiteSink('/tmp/example_sink.sqlite')
+  >>> sink.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> sink.read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  >>> sink.identifiers()
+  ['f1=1+f2=2']
+  >>> sink.close()
+  """
+  def __init__(self, path, metric_delimiter='_'):
+    super().__init__(path, metric_delimiter)
+    self._connection = None
+    self._lock = threading.RLock()
+
+  def _connect(self):
+    import sqlite3
+    if self._connection is None:
+      self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+      self._connection.execute('pragma journal_mode=wal')
+      self._connection.execute('''create table if not exists outputs
+        (identifier text, output text, data blob, stamp real, primary key (identifier, output))''')
+      self._connection.commit()
+    return self._connection
+
+  def write(self, identifier, output, data):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.asanyarray(data), allow_pickle=False)
+    with self._lock:
+      connection = self._connect()
+      connection.execute(
+        'insert or replace into outputs values (?, ?, ?, ?)',
+        (identifier, output, buffer.getvalue(), time.time()))
+      connection.commit()
+
+  def _select(self, query, parameters):
+    with self._lock:
+      return self._connect().execute(query, parameters).fetchall()
+
+  def read(self, identifier, output):
+    rows = self._select(
+      'select data from outputs where identifier=? and output=?', (identifier, output))
+    if not rows:
+      return None
+    return np.lib.format.read_array(io.BytesIO(rows[0][0]), allow_pickle=False)
+
+  def stamp(self, identifier, output):
+    rows = self._select(
+      'select stamp from outputs where identifier=? and output=?', (identifier, output))
+    if not rows:
+      return None
+    return rows[0][0]
+
+  def outputs(self, identifier, wildcard='*'):
+    rows = self._select('select output from outputs where identifier=?', (identifier,))
+    return [row[0] for row in rows if fnmatch.fnmatch(row[0], wildcard)]
+
+  def identifiers(self):
+    return [row[0] for row in self._select('select distinct identifier from outputs', ())]
+
+  def remove(self, identifier, output=None):
+    with self._lock:
+      connection = self._connect()
+      if output is None:
+        connection.execute('delete from outputs where identifier=?', (identifier,))
+      else:
+        connection.execute(
+          'delete from outputs where identifier=? and output=?', (identifier, output))
+      connection.commit()
+
+  def compact(self):
+    with self._lock:
+      self._connect().execute('vacuum')
+
+  def close(self):
+    with self._lock:
+      if self._connection is not None:
+        self._connection.close()
+        self._connection = None
+
+class H5Writer():
+  """owns the handle of an .h5 file and writes the outputs sent by workers.
+
+  The outputs are sent over a queue to a service thread that applies them
+  to the file, which is kept open. The file is flushed at most every flush_interval seconds,
+  and when the queue is idle. This avoids the cost of opening the file for each setting
+  and the corruption of the file when several workers write to it.
+
+  If shared is True, the queue is handled by a multiprocessing manager
+  and the writer object can be sent to worker processes,
+  for example as an argument of a function run by a multiprocessing pool.
+  The worker processes write through the queue, the file is written by the service
+  thread of the process that created the writer.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the .h5 file.
+
+  flush_interval: float (optional)
+    maximal duration in seconds between two flushes of the file (default 1).
+
+  buffer_size: int (optional)
+    maximal number of outputs waiting to be written (default 256).
+
+  shared: bool (optional)
+    if True, the writer can be used by several processes (default False).
+
+  layout: str (optional)
+    layout of the file if it is created, see :func:`doce.sink.h5_group_path` (default 'flat').
+
+  factors: list of str (optional)
+    factors of the settings, used to create the tables with the table layout,
+    see :class:`doce.sink.H5Table`.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import tables as tb
+  >>> from concurrent.futures import ThreadPoolExecutor
+  >>> writer = doce.sink.H5Writer('/tmp/example_writer.h5')
+  >>> def step(index):
+  ...   writer.write(f'f1={index}', 'accuracy', np.ones(3)*index)
+  >>> with ThreadPoolExecutor(4) as executor:
+  ...   _ = list(executor.map(step, range(8)))
+  >>> writer.close()
+  0
+  >>> with tb.open_file('/tmp/example_writer.h5') as h5:
+  ...   print(len(h5.root._v_groups), np.array(h5.root['f1=7'].accuracy))
+  8 [7. 7. 7.]
+  """
+  def __init__(self, path, flush_interval=1, buffer_size=256, shared=False, layout='flat', factors=None):
+    self.path = path
+    self.layout = layout
+    self.factors = factors
+    self.flush_interval = flush_interval
+    buffer_size = max(int(buffer_size), 1)
+    if shared:
+      import multiprocessing
+      self._manager = multiprocessing.Manager()
+      self._queue = self._manager.Queue(buffer_size)
+    else:
+      self._manager = None
+      self._queue = queue.Queue(buffer_size)
+    self._file = None
+    self._file_lock = threading.RLock()
+    self._nb_failed = 0
+    self._last_flush = 0
+    self._owner = True
+    self._thread = None
+    self._thread_lock = threading.Lock()
+    if shared:
+      # outputs may be sent by other processes at any time
+      self._start()
+    # pytables registers its exit hook when imported, see doce.sink._register_shutdown
+    import tables
+    _h5_writers.add(self)
+    _register_shutdown()
+
+  def __getstate__(self):
+    if self._manager is None:
+      raise TypeError('only H5Writer objects created with shared=True can be sent to other processes')
+    return {'path': self.path, 'flush_interval': self.flush_interval, '_queue': self._queue}
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    # the writer of a worker process only sends outputs to the service
+    self._manager = None
+    self._owner = False
+
+  def _open(self):
+    import tables as tb
+    import warnings
+    from tables import NaturalNameWarning
+    warnings.filterwarnings('ignore', category=NaturalNameWarning)
+    if self._file is None:
+      self._file = tb.open_file(self.path, mode='a')
+    return self._file
+
+  def _flush_file(self):
+    if self._file is not None:
+      self._file.flush()
+    self._last_flush = time.time()
+
+  def _start(self):
+    if self._owner:
+      with self._thread_lock:
+        if self._thread is None or not self._thread.is_alive():
+          self._thread = threading.Thread(target=self._run, daemon=True)
+          self._thread.start()
+
+  def _run(self):
+    while True:
+      try:
+        operation = self._queue.get(timeout=self.flush_interval)
+      except queue.Empty:
+        with self._file_lock:
+          self._flush_file()
+        continue
+      try:
+        with self._file_lock:
+          self._apply(*operation)
+          if time.time()-self._last_flush > self.flush_interval:
+            self._flush_file()
+      except Exception as exception:
+        print(f'Failed operation {operation[0]} on {self.path}: {exception}')
+        self._nb_failed += 1
+      finally:
+        self._queue.task_done()
+      if operation[0] == 'close':
+        return
+
+  def _apply(self, name, *arguments):
+    if name == 'write':
+      self._write(*arguments)
+    elif name == 'remove':
+      (identifier, output) = arguments
+      h5_remove_setting(self._open(), identifier, output)
+    elif name == 'flush':
+      self._flush_file()
+    elif name == 'close':
+      if self._file is not None:
+        for table in getattr(self._file, '_doce_tables', {}).values():
+          table.reindex()
+        self._file.close()
+        self._file = None
+
+  def _write(self, identifier, output, data, title, description, options):
+    h5_write(self._open(), identifier, output, data, title, description, self.layout, self.factors, options)
+
+  def write(self, identifier, output, data, title=None, description=None, options=None):
+    """queues data to be written as the output of the setting described by identifier.
+
+    See :func:`doce.sink.h5_write` for the details.
+    """
+    self._start()
+    # copy so that the array can be modified by the caller while waiting to be written
+    self._queue.put(('write', identifier, output, np.array(data), title, description, options))
+
+  def remove(self, identifier, output=None):
+    """queues the removal of the output (all the outputs if None) of the setting."""
+    self._start()
+    self._queue.put(('remove', identifier, output))
+
+  def access(self, function):
+    """returns function applied to the handle of the file, once the queued outputs are written."""
+    if not self._owner:
+      raise ValueError('the file can only be accessed by the process that created the writer')
+    if self._thread is not None and self._thread.is_alive():
+      # the outputs queued before the access are visible to function
+      self._queue.join()
+    with self._file_lock:
+      if self._file is None and not os.path.exists(self.path):
+        return function(None)
+      return function(self._open())
+
+  def flush(self):
+    """waits for the queued outputs to be written and flushes the file.
+
+    Returns
+    -------
+
+    nb_failed: int
+      the number of failed operations since the last flush.
+    """
+    if not self._owner:
+      self._queue.join()
+      return 0
+    self._start()
+    self._queue.put(('flush',))
+    self._queue.join()
+    nb_failed = self._nb_failed
+    self._nb_failed = 0
+    return nb_failed
+
+  def close(self):
+    """writes the queued outputs, closes the file and stops the service thread.
+
+    The service is started again if other outputs are written.
+
+    Returns
+    -------
+
+    nb_failed: int
+      the number of failed operations since the last flush.
+    """
+    if not self._owner:
+      return self.flush()
+    if (self._thread is None or not self._thread.is_alive()) and self._queue.empty():
+      return 0
+    nb_failed = self.flush()
+    self._queue.put(('close',))
+    self._thread.join()
+    return nb_failed
+
+class BufferedWriter():
+  """writes outputs to data sinks in a background thread.
+
+  The outputs are buffered in a queue, so that the computation of the settings
+  overlaps the writing to disk. Failed writes are reported and counted.
+
+  Parameters
+  ----------
+
+  buffer_size: int (optional)
+    maximal number of outputs waiting to be written (default 256).
+    When the buffer is full, the writing request blocks until an output is written.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> writer = doce.sink.BufferedWriter()
+  >>> sink = doce.sink.NpySink('/tmp/')
+  >>> writer.write(sink, 'f1=1+f2=3', 'accuracy', np.arange(3))
+  >>> writer.flush()
+  0
+  >>> sink.read('f1=1+f2=3', 'accuracy')
+  array([0, 1, 2])
+  """
+  def __init__(self, buffer_size=256):
+    self._queue = queue.Queue(maxsize=max(int(buffer_size), 1))
+    self._nb_failed = 0
+    self._lock = threading.Lock()
+    self._thread = None
+    _buffered_writers.add(self)
+    _register_shutdown()
+
+  def _run(self):
+    while True:
+      (sink, identifier, output, data) = self._queue.get()
+      try:
+        sink.write(identifier, output, data)
+      except Exception as exception:
+        print(f'Failed writing output {output} of setting {identifier} to {sink.path}: {exception}')
+        with self._lock:
+          self._nb_failed += 1
+      finally:
+        self._queue.task_done()
+
+  def write(self, sink, identifier, output, data):
+    """queues data to be written as the output of the setting described by identifier to sink."""
+    with self._lock:
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    # copy so that the array can be modified by the caller while waiting to be written
+    self._queue.put((sink, identifier, output, np.array(data)))
+
+  def flush(self):
+    """waits for the queued outputs to be written.
+
+    Returns
+    -------
+
+    nb_failed: int
+      the number of failed writes since the last flush.
+    """
+    self._queue.join()
+    with self._lock:
+      nb_failed = self._nb_failed
+      self._nb_failed = 0
+    return nb_failed
+
+# the writers still active when the interpreter exits
+_buffered_writers = weakref.WeakSet()
+_h5_writers = weakref.WeakSet()
+
+def _shutdown():
+  # the buffered outputs are sent to the sinks before the files of the sinks are closed
+  for writer in list(_buffered_writers):
+    writer.flush()
+  for writer in list(_h5_writers):
+    writer.close()
+
+def _register_shutdown():
+  # the hooks run in the reverse order of their registration, the hook is thus registered again
+  # so that it runs before the hooks registered since, such as the one of pytables closing the files
+  atexit.unregister(_shutdown)
+  atexit.register(_shutdown)
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
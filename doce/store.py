@@ -0,0 +1,367 @@
+"""Handle the consolidated storage of the outputs of the doce module."""
+
+import os
+import io
+import glob
+import time
+import socket
+import fnmatch
+import threading
+import numpy as np
+
+STORE_EXTENSION = '.store'
+
+# writers are shared by the Store objects of a process
+_writers = {}
+_writers_lock = threading.Lock()
+
+def is_store(path):
+  """returns True if path designates a consolidated store.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> doce.store.is_store('/tmp/my_experiment.store/')
+  True
+  >>> doce.store.is_store('/tmp/my_experiment/')
+  False
+  """
+  return isinstance(path, str) and path.rstrip('/\\').endswith(STORE_EXTENSION)
+
+class Store():
+  """stores the outputs of the settings in a few large files.
+
+  A store is a directory whose name ends with .store. The outputs are serialized
+  in the npy format and appended to data files, called segments.
+  Their location is recorded in an index file associated to each segment.
+  This avoids the creation of one file per setting and per output.
+
+  Each process appends to its own segment, so that several processes can safely
+  write to the same store. Within a process, writes are thread safe.
+  Segments are merged and the space of removed outputs is reclaimed
+  by :meth:`doce.store.Store.compact`. Other Store objects, in the same or in other processes,
+  may read the store while it is compacted: they read the index files again
+  when they find that the segments they know have been removed.
+
+  Parameters
+  ----------
+
+  path: str
+    path to the store directory. The directory is created if needed.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> import numpy as np
+  >>> import shutil
+  >>> shutil.rmtree('/tmp/example.store', ignore_errors=True)
+  >>> store = doce.store.Store('/tmp/example.store')
+  >>> store.write('f1=1+f2=2', 'accuracy', np.arange(3))
+  >>> store.write('f1=1+f2=3', 'accuracy', np.ones(2))
+  >>> store.read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  >>> store.contains('f1=1+f2=3')
+  True
+  >>> store.remove('f1=1+f2=3')
+  >>> store.identifiers()
+  ['f1=1+f2=2']
+  >>> reader = doce.store.Store('/tmp/example.store')
+  >>> store.compact()
+  >>> doce.store.Store('/tmp/example.store').read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  >>> reader.read('f1=1+f2=2', 'accuracy')
+  array([0, 1, 2])
+  """
+  def __init__(self, path):
+    self.path = os.path.abspath(os.path.expanduser(path))
+    if not os.path.exists(self.path):
+      os.makedirs(self.path)
+    self._index = {}
+    self._index_positions = {}
+    self._readers = {}
+    self._lock = threading.Lock()
+    self._refresh_time = 0
+    self.refresh()
+
+  def refresh(self):
+    """reads the entries added to the index files since the last refresh.
+
+    If segments have been removed by a compaction, all the index files are read again.
+    """
+    with self._lock:
+      self._refresh_time = time.time()
+      index_file_names = sorted(glob.glob(os.path.join(self.path, '*.index')))
+      segments = set(os.path.basename(index_file_name)[:-len('.index')] for index_file_name in index_file_names)
+      if not segments.issuperset(self._index_positions):
+        self._reset()
+      for index_file_name in index_file_names:
+        segment = os.path.basename(index_file_name)[:-len('.index')]
+        position = self._index_positions.get(segment, 0)
+        try:
+          if os.path.getsize(index_file_name) <= position:
+            continue
+          with open(index_file_name, 'r') as index_file:
+            index_file.seek(position)
+            lines = index_file.read()
+        except FileNotFoundError:
+          continue
+        # only consider complete lines
+        lines = lines[:lines.rfind('\n')+1]
+        self._index_positions[segment] = position+len(lines.encode('utf-8'))
+        for line in lines.splitlines():
+          self._add_entry(segment, *line.split('\t'))
+
+  def _reset(self):
+    # the entries of the removed segments are dropped, with the files opened for reading
+    for reader in self._readers.values():
+      reader.close()
+    self._readers = {}
+    self._index = {}
+    self._index_positions = {}
+
+  def reload(self):
+    """reads all the index files again."""
+    with self._lock:
+      self._reset()
+    self.refresh()
+
+  def _add_entry(self, segment, identifier, output, offset, length, stamp):
+    entries = self._index.setdefault(identifier, {})
+    stamp = float(stamp)
+    if output in entries and entries[output][3] > stamp:
+      return
+    entries[output] = (segment, int(offset), int(length), stamp)
+
+  def _entry(self, identifier, output):
+    if time.time()-self._refresh_time > 1:
+      # the output may have been written, or the store compacted, by another process
+      self.refresh()
+    entry = self._index.get(identifier, {}).get(output)
+    if entry is None or entry[2] < 0:
+      return None
+    return entry
+
+  def _writer(self):
+    segment = f'{socket.gethostname()}-{os.getpid()}'
+    key = (self.path, segment)
+    with _writers_lock:
+      if key not in _writers:
+        _writers[key] = _SegmentWriter(self.path, segment)
+      return _writers[key]
+
+  def write(self, identifier, output, data):
+    """stores data as the output of the setting described by identifier.
+
+    Parameters
+    ----------
+
+    identifier: str
+      identifier of the setting, see :meth:`doce.setting.Setting.identifier`.
+
+    output: str
+      name of the output.
+
+    data: array_like
+      the output to store.
+    """
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.asanyarray(data), allow_pickle=False)
+    entry = self._writer().append(identifier, output, buffer.getvalue())
+    with self._lock:
+      self._add_entry(*entry)
+
+  def remove(self, identifier, output=None):
+    """removes the outputs of the setting described by identifier.
+
+    If output is None, all the outputs of the setting are removed.
+    The space used by removed outputs is reclaimed by :meth:`doce.store.Store.compact`.
+    """
+    outputs = [output] if output else self.outputs(identifier)
+    writer = self._writer()
+    for output_name in outputs:
+      entry = writer.append(identifier, output_name, None)
+      with self._lock:
+        self._add_entry(*entry)
+
+  def read(self, identifier, output):
+    """returns the output of the setting described by identifier as a numpy array.
+
+    Returns None if the output is not available.
+    """
+    entry = self._entry(identifier, output)
+    if entry is None:
+      return None
+    try:
+      buffer = self._read(entry)
+    except FileNotFoundError:
+      # the segment has been removed by a compaction
+      self.reload()
+      entry = self._entry(identifier, output)
+      if entry is None:
+        return None
+      buffer = self._read(entry)
+    return np.lib.format.read_array(io.BytesIO(buffer), allow_pickle=False)
+
+  def _read(self, entry):
+    segment, offset, length, _ = entry
+    with self._lock:
+      if segment not in self._readers:
+        self._readers[segment] = open(os.path.join(self.path, segment+'.data'), 'rb')
+      reader = self._readers[segment]
+      reader.seek(offset)
+      return reader.read(length)
+
+  def read_lazy(self, identifier, output, min_size=0):
+    """returns the output of the setting described by identifier as a memory-mapped array.
+
+    The outputs smaller than min_size bytes are fully read.
+    Returns None if the output is not available.
+
+    Examples
+    --------
+
+    >>> import doce
+    >>> import numpy as np
+    >>> store = doce.store.Store('/tmp/example_lazy.store')
+    >>> store.write('f1=1', 'accuracy', np.arange(4))
+    >>> output = store.read_lazy('f1=1', 'accuracy')
+    >>> type(output).__name__, output[2:]
+    ('memmap', memmap([2, 3]))
+    """
+    entry = self._entry(identifier, output)
+    if entry is None:
+      return None
+    try:
+      return self._read_lazy(identifier, output, entry, min_size)
+    except FileNotFoundError:
+      # the segment has been removed by a compaction
+      self.reload()
+      entry = self._entry(identifier, output)
+      if entry is None:
+        return None
+      return self._read_lazy(identifier, output, entry, min_size)
+
+  def _read_lazy(self, identifier, output, entry, min_size):
+    segment, offset, length, _ = entry
+    if length < min_size:
+      return self.read(identifier, output)
+    file_name = os.path.join(self.path, segment+'.data')
+    with open(file_name, 'rb') as data_file:
+      data_file.seek(offset)
+      version = np.lib.format.read_magic(data_file)
+      (shape, fortran_order, dtype) = np.lib.format._read_array_header(data_file, version)
+      data_offset = data_file.tell()
+    if not shape or 0 in shape:
+      return self.read(identifier, output)
+    return np.memmap(file_name, dtype=dtype, mode='r', offset=data_offset,
+                     shape=shape, order='F' if fortran_order else 'C')
+
+  def stamp(self, identifier, output):
+    """returns the time of the last modification of the output, None if not available."""
+    entry = self._entry(identifier, output)
+    if entry is None:
+      return None
+    return entry[3]
+
+  def contains(self, identifier, output=None):
+    """returns True if the output (any output if None) of the setting is available."""
+    if output is not None:
+      return self._entry(identifier, output) is not None
+    if time.time()-self._refresh_time > 1:
+      self.refresh()
+    return len(self.outputs(identifier)) > 0
+
+  def outputs(self, identifier, wildcard='*'):
+    """returns the names of the outputs available for the setting, filtered by wildcard."""
+    return [output for output, entry in self._index.get(identifier, {}).items()
+            if entry[2] >= 0 and fnmatch.fnmatch(output, wildcard)]
+
+  def identifiers(self):
+    """returns the identifiers of the settings that have outputs available."""
+    return [identifier for identifier in self._index if self.outputs(identifier)]
+
+  def size(self):
+    """returns the size in bytes of the files of the store."""
+    return sum(os.path.getsize(file_name)
+               for file_name in glob.glob(os.path.join(self.path, '*')))
+
+  def compact(self):
+    """merges the segments of the store and reclaims the space of removed outputs.
+
+    No other process shall write to the store during the compaction.
+    """
+    self.refresh()
+    self.close()
+    with _writers_lock:
+      for key in [key for key in _writers if key[0] == self.path]:
+        _writers.pop(key).close()
+    segments = [os.path.basename(file_name)[:-len('.index')]
+                for file_name in glob.glob(os.path.join(self.path, '*.index'))]
+    writer = _SegmentWriter(self.path, f'compact-{time.time_ns()}')
+    index = {}
+    readers = {}
+    for identifier, entries in self._index.items():
+      for output, (segment, offset, length, stamp) in entries.items():
+        if length < 0:
+          continue
+        if segment not in readers:
+          readers[segment] = open(os.path.join(self.path, segment+'.data'), 'rb')
+        readers[segment].seek(offset)
+        entry = writer.append(identifier, output, readers[segment].read(length), stamp)
+        # entries are (segment, identifier, output, offset, length, stamp)
+        index.setdefault(identifier, {})[output] = (entry[0],)+entry[3:]
+    writer.close()
+    for reader in readers.values():
+      reader.close()
+    for segment in segments:
+      for extension in ['.data', '.index']:
+        if os.path.exists(os.path.join(self.path, segment+extension)):
+          os.remove(os.path.join(self.path, segment+extension))
+    # the index of the compacted segment is known, it is not read again
+    with self._lock:
+      self._index = index
+      self._index_positions = {writer.segment: os.path.getsize(
+        os.path.join(self.path, writer.segment+'.index'))}
+
+  def close(self):
+    """closes the files opened for reading."""
+    with self._lock:
+      for reader in self._readers.values():
+        reader.close()
+      self._readers = {}
+
+class _SegmentWriter():
+  """appends outputs to a segment of a store."""
+  def __init__(self, path, segment):
+    self.segment = segment
+    self._lock = threading.Lock()
+    self._data = open(os.path.join(path, segment+'.data'), 'ab')
+    self._index = open(os.path.join(path, segment+'.index'), 'a')
+
+  def append(self, identifier, output, buffer, stamp=None):
+    if stamp is None:
+      stamp = time.time()
+    with self._lock:
+      if buffer is None:
+        offset, length = 0, -1
+      else:
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        length = len(buffer)
+        self._data.write(buffer)
+        self._data.flush()
+      # the index is written after the data, so that readers never see incomplete outputs
+      self._index.write(f'{identifier}\t{output}\t{offset}\t{length}\t{stamp!r}\n')
+      self._index.flush()
+    return (self.segment, identifier, output, offset, length, stamp)
+
+  def close(self):
+    with self._lock:
+      self._data.close()
+      self._index.close()
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
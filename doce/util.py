@@ -2,6 +2,9 @@
 
 import sys
 import re
+import collections
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 def special_caracter_natural_naming(modality):
   modifier = {' ': 'space',
@@ -191,6 +194,84 @@ def prune_setting_description(
     )
 
 
+def setting_description_frame(
+  setting_description,
+  column_header,
+  nb_column_factor=0,
+  factor_display='long',
+  modalities=None
+  ):
+  """builds a pandas DataFrame from a setting_description, removing the factors with only one modality.
+
+  The DataFrame is built column-wise: the factor columns are categorical, with the modalities
+  of each factor given by modalities (by default, the values of the column in order of appearance)
+  as categories, and the other columns are float columns when possible.
+  As with :func:`doce.util.prune_setting_description`, the factor columns with only one modality are removed
+  and described in cst_setting_desc.
+
+	Returns
+	-------
+
+  data_frame: pandas.DataFrame
+    the table, with column_header as columns.
+
+  cst_setting_desc: str
+    description of the settings with constant modality.
+
+  nb_column_factor: int
+    number of factors in data_frame.
+
+	Examples
+	--------
+  >>> import doce
+
+  >>> header = ['factor_1', 'factor_2', 'metric_1', 'metric_2']
+  >>> table = [['a', 'b', 1, 2], ['a', 'c', 2, 2], ['a', 'b', 2, 2]]
+  >>> (data_frame, cst_setting_desc, nb_column_factor) = doce.util.setting_description_frame(table, header, 2)
+  >>> print(cst_setting_desc)
+  factor_1: a
+  >>> data_frame
+    factor_2  metric_1  metric_2
+  0        b       1.0       2.0
+  1        c       2.0       2.0
+  2        b       2.0       2.0
+  >>> data_frame.dtypes.tolist()
+  [CategoricalDtype(categories=['b', 'c'], ordered=False), dtype('float64'), dtype('float64')]
+  """
+  import pandas as pd
+  if setting_description and nb_column_factor == 0:
+    nb_column_factor = len(setting_description[0])
+  columns = list(zip(*setting_description)) if setting_description else [()]*len(column_header)
+  data = []
+  names = []
+  cst_setting_desc = ''
+  nb_factors = 0
+  for column_index, (name, values) in enumerate(zip(column_header, columns)):
+    if column_index < nb_column_factor:
+      if modalities:
+        column = pd.Categorical(values, categories=list(dict.fromkeys(modalities[column_index])))
+        if (column.codes < 0).any():
+          # values that are not modalities of the plan are added as categories
+          unseen = pd.unique(np.asarray(values, dtype=object)[column.codes < 0])
+          column = column.add_categories([value for value in unseen if value not in column.categories])
+          column[column.codes < 0] = np.asarray(values, dtype=object)[column.codes < 0]
+      else:
+        column = pd.Categorical(values, categories=list(dict.fromkeys(values)))
+      if len(values) > 1 and (column.codes == column.codes[0]).all():
+        cst_setting_desc += f'{compress_description(name, factor_display)}: {values[0]} '
+        continue
+      nb_factors += 1
+    else:
+      try:
+        column = np.array(values, dtype=float)
+      except (TypeError, ValueError):
+        column = pd.Series(values, dtype=object)
+    data.append(column)
+    names.append(name)
+  data_frame = pd.DataFrame(dict(enumerate(data)), index=pd.RangeIndex(len(setting_description)))
+  data_frame.columns = names
+  return (data_frame, cst_setting_desc, nb_factors)
+
 def compress_description(
   description,
   desc_type='long',
@@ -311,6 +392,37 @@ def in_notebook():
   except NameError:
     return False
 
+def prefetch(function, items, jobs=1, depth=4):
+  """yields function(item) for each item of items, in order, computed ahead by a pool of threads.
+
+  At most depth results per thread are computed ahead, so that the memory used stays bounded.
+  With one job, the items are processed sequentially by the calling thread.
+
+  Examples
+  --------
+
+  >>> import doce
+  >>> list(doce.util.prefetch(lambda x: x**2, range(10), jobs=3))
+  [0, 1, 4, 9, 16, 25, 36, 49, 64, 81]
+  """
+  if jobs <= 1:
+    for item in items:
+      yield function(item)
+    return
+  with ThreadPoolExecutor(max_workers=jobs) as executor:
+    pending = collections.deque()
+    try:
+      for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= depth*jobs:
+          yield pending.popleft().result()
+      while pending:
+        yield pending.popleft().result()
+    finally:
+      # the results computed ahead are discarded if the consumer stops early
+      for future in pending:
+        future.cancel()
+
 if __name__ == '__main__':
   import doctest
   doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
@@ -0,0 +1,41 @@
+import numpy as np
+import doce
+
+# define the experiment
+experiment = doce.Experiment(
+  name = 'demo_batch',
+  purpose = 'batched computation of settings with the doce package',
+  author = 'john doe',
+  address = 'john.doe@no-log.org',
+)
+# set acces paths (here only storage is needed)
+experiment.set_path('output', '/tmp/'+experiment.name+'/', force=True)
+# set the plan (factor : modalities)
+experiment.add_plan('plan',
+  model = ['linear', 'quadratic'],
+  threshold = np.linspace(0.1, 0.9, 9)
+)
+# set the metrics
+experiment.set_metric(
+  name = 'accuracy',
+  percent=True,
+  higher_the_better= True
+  )
+
+def step(setting_batch, experiment):
+  # the predictions of the model are computed once for all the thresholds of the batch
+  rng = np.random.default_rng(len(setting_batch.model))
+  truth = rng.random(1000) > 0.5
+  prediction = truth + rng.standard_normal(1000)*(0.5 if setting_batch.model == 'linear' else 0.3)
+  # setting_batch.threshold is an array with the thresholds of the batch
+  accuracy = np.mean((prediction[np.newaxis, :] > setting_batch.threshold[:, np.newaxis]) == truth, axis=1)
+  # outputs are stored for each setting of the batch
+  for setting_index, setting in enumerate(setting_batch):
+    experiment.save(setting, 'accuracy', accuracy[setting_index])
+
+# invoke the command line management of the doce package
+if __name__ == "__main__":
+  doce.cli.main(experiment = experiment,
+                func = step,
+                batch_factors = ['threshold']
+                )
@@ -0,0 +1,43 @@
+import numpy as np
+import doce
+
+# define the experiment
+experiment = doce.Experiment(
+  name = 'demo_store',
+  purpose = 'consolidated storage of outputs with the doce package',
+  author = 'john doe',
+  address = 'john.doe@no-log.org',
+)
+# outputs are stored in a few large files within a directory ending with .store
+experiment.set_path('output', '/tmp/'+experiment.name+'.store', force=True)
+# set the plan (factor : modalities)
+experiment.add_plan('plan',
+  nn_type = ['cnn', 'lstm'],
+  n_layers = np.arange(2, 10, 3),
+  learning_rate = [0.001, 0.0001, 0.00001],
+  dropout = [0, 1]
+)
+# set the metrics
+experiment.set_metric(
+  name = 'accuracy',
+  percent=True,
+  higher_the_better= True,
+  significance = True
+  )
+experiment.set_metric(
+  name = 'duration',
+  lower_the_better= True
+  )
+
+def step(setting, experiment):
+  accuracy = (len(setting.nn_type)+setting.dropout+np.random.random_sample(10))/6
+  duration = len(setting.nn_type)+setting.n_layers+np.random.randn(10)
+  # outputs are stored through the experiment, whatever the kind of data sink
+  experiment.save(setting, 'accuracy', accuracy)
+  experiment.save(setting, 'duration', duration)
+
+# invoke the command line management of the doce package
+if __name__ == "__main__":
+  doce.cli.main(experiment = experiment,
+                func = step
+                )